@@ -1,3 +1,33 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from partecipante.authentication import TokenConRuoloSerializer, verifica_utenti
+from partecipante.models import Utente
+from .models import Admin
 
-# Create your tests here.
+
+class AdminProfileAsyncTest(TestCase):
+    def setUp(self):
+        verifica_utenti.svuota()
+        self.client = APIClient()
+    
+    def autentica(self, utente):
+        token = TokenConRuoloSerializer.get_token(utente).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_me_uguale_al_sincrono(self):
+        utente = Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        Admin.objects.create(utente=utente)
+        self.autentica(utente)
+        
+        asincrona = self.client.get('/api/async/admin/profile/me/')
+        
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.content, self.client.get('/api/admin/profile/me/').content)
+    
+    def test_me_senza_profilo(self):
+        self.autentica(Utente.objects.create(username='admin2', nome='Admin', cognome='Test', ruolo='admin'))
+        
+        risposta = self.client.get('/api/async/admin/profile/me/')
+        
+        self.assertEqual(risposta.status_code, 404)
+        self.assertEqual(risposta.json(), {'error': 'Profilo admin non trovato'})
@@ -32,7 +32,7 @@ class AdminProfileViewSet(viewsets.ModelViewSet):
         Endpoint per ottenere il proprio profilo admin
         """
         try:
-            admin_profile = Admin.objects.get(utente=request.user)
+            admin_profile = Admin.objects.get(pk=request.user.pk)
             serializer = self.get_serializer(admin_profile)
             return Response(serializer.data)
         except Admin.DoesNotExist:
@@ -0,0 +1,18 @@
+"""
+Versione asincrona (ASGI) della lettura del profilo admin.
+"""
+from rest_framework import status
+from rest_framework.response import Response
+from gestione_presenze.asincrono import errore, vista_async
+from .models import Admin
+from .serializers import AdminProfileSerializer
+
+
+@vista_async()
+async def me(request):
+    """Profilo admin dell'utente autenticato"""
+    try:
+        admin_profile = await Admin.objects.select_related('utente').aget(pk=request.user.pk)
+    except Admin.DoesNotExist:
+        return errore('Profilo admin non trovato', status.HTTP_404_NOT_FOUND)
+    return Response(AdminProfileSerializer(admin_profile).data)
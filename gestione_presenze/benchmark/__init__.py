@@ -0,0 +1,9 @@
+"""
+Benchmark degli endpoint API e delle changelist admin su dataset sintetici.
+
+Uso (dalla cartella del progetto):
+    python -m benchmark --partecipanti 500 --giorni 200
+    python -m benchmark --aggiorna-baseline
+
+Vedi benchmark/__main__.py per tutte le opzioni.
+"""
@@ -0,0 +1,168 @@
+"""
+Esegue il benchmark su un database di test separato (quello del database
+configurato non viene toccato).
+
+Esempi:
+    python -m benchmark
+    python -m benchmark --partecipanti 5000 --giorni 500 --ripetizioni 3
+    python -m benchmark --solo registro_lista --cache calda
+    python -m benchmark --aggiorna-baseline
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+BASELINE_DEFAULT = Path(__file__).resolve().parent / 'baseline.json'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partecipanti', type=int, default=50)
+    parser.add_argument('--giorni', type=int, default=60, help='giorni lavorativi di registro')
+    parser.add_argument('--distribuzione', default='realistica',
+                        choices=['nessuna', 'uniforme', 'realistica'],
+                        help='distribuzione delle ore di assenza')
+    parser.add_argument('--a-rischio', type=float, default=0.1,
+                        help='quota di partecipanti con molte assenze')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    parser.add_argument('--cache', choices=['fredda', 'calda'], default='fredda',
+                        help='fredda: svuota la cache prima di ogni richiesta')
+    parser.add_argument('--solo', help='esegue solo gli scenari il cui nome contiene questo testo')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_DEFAULT)
+    parser.add_argument('--aggiorna-baseline', action='store_true',
+                        help='salva i risultati come nuova baseline')
+    parser.add_argument('--output', type=Path, help='salva i risultati in questo file JSON')
+    return parser.parse_args(argv)
+
+
+def costruisci_contesto(dataset_parametri):
+    from datetime import timedelta
+    from partecipante.models import Utente, Partecipante
+    from registro.models import Registro
+    from registro.pagination import RegistroCursorPagination
+    from registro.dataset import giorni_lavorativi
+    
+    giorni = giorni_lavorativi(dataset_parametri['giorni'])
+    partecipante = Partecipante.objects.select_related('utente').order_by('pk').first()
+    
+    # Cursore verso una pagina al 90% dello storico
+    registri = Registro.objects.order_by('-data', '-id')
+    profondo = registri[max(registri.count() * 9 // 10 - 1, 0)]
+    paginazione = RegistroCursorPagination()
+    paginazione.base_url = '/api/registro/'
+    
+    return {
+        'utente_admin': Utente.objects.filter(ruolo='admin').order_by('pk').first(),
+        'utente_partecipante': partecipante.utente,
+        'partecipante': partecipante,
+        'partecipanti_ids': list(
+            Partecipante.objects.order_by('pk').values_list('pk', flat=True)[:200]
+        ),
+        'ultimo_giorno': giorni[0],
+        'inizio_intervallo': giorni[min(19, len(giorni) - 1)],
+        'giorno_libero': giorni[-1] - timedelta(days=1),
+        'cursore_profondo': paginazione.encode_cursor(False, profondo),
+    }
+
+
+def stampa(risultati, baseline):
+    from .runner import SCENARIO_RIFERIMENTO, tempi_relativi
+    
+    relativi = tempi_relativi(risultati)
+    intestazione = (f"{'scenario':36} {'query':>6} {'scan':>5} {'ms med':>9} {'ms max':>9} "
+                    f"{'x rif':>7} {'picco KB':>10} {'byte':>10}")
+    print(intestazione)
+    print('-' * len(intestazione))
+    for nome, r in risultati.items():
+        scansioni = '-' if r['scansioni'] is None else r['scansioni']
+        relativo = f"{relativi[nome]:.2f}" if nome in relativi else '-'
+        riga = (f"{nome:36} {r['query']:>6} {scansioni:>5} {r['ms_mediana']:>9.2f} {r['ms_max']:>9.2f} "
+                f"{relativo:>7} {r['picco_kb']:>10.1f} {r['byte']:>10}")
+        riferimento = (baseline or {}).get(nome)
+        if riferimento:
+            riga += f"   (baseline {riferimento['query']} query, {riferimento.get('scansioni', '-')} scan)"
+        print(riga)
+    if relativi:
+        print(f"\nx rif: mediana rispetto a {SCENARIO_RIFERIMENTO} in questa esecuzione (solo informativo)")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestione_presenze.settings')
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import django
+    django.setup()
+    
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from registro.dataset import genera_dataset
+    from .runner import carica_baseline, confronta, esegui, salva_baseline, salva_risultati
+    from .scenari import SCENARI
+    
+    parametri = {
+        'partecipanti': args.partecipanti,
+        'giorni': args.giorni,
+        'distribuzione': args.distribuzione,
+        'a_rischio': args.a_rischio,
+        'seed': args.seed,
+        'cache': args.cache,
+    }
+    
+    setup_test_environment()
+    test_runner = DiscoverRunner(verbosity=0)
+    database = test_runner.setup_databases()
+    try:
+        creati = genera_dataset(
+            partecipanti=args.partecipanti,
+            giorni=args.giorni,
+            distribuzione=args.distribuzione,
+            quota_a_rischio=args.a_rischio,
+            seed=args.seed,
+        )
+        print(f"Dataset: {creati['partecipanti']} partecipanti, {creati['registri']} registri "
+              f"in {creati['secondi_totali']}s ({creati['righe_al_secondo']} righe/s)\n")
+        
+        risultati = esegui(
+            SCENARI,
+            costruisci_contesto(parametri),
+            ripetizioni=args.ripetizioni,
+            cache_fredda=args.cache == 'fredda',
+            filtro=args.solo,
+        )
+    finally:
+        test_runner.teardown_databases(database)
+        teardown_test_environment()
+    
+    salvata = carica_baseline(args.baseline)
+    baseline = None
+    if salvata and salvata['parametri'] == parametri:
+        baseline = salvata['risultati']
+    elif salvata:
+        print("Baseline registrata con parametri diversi: confronto saltato\n")
+    
+    stampa(risultati, baseline)
+    
+    if args.output:
+        salva_risultati(args.output, parametri, risultati)
+    if args.aggiorna_baseline:
+        salva_baseline(args.baseline, parametri, risultati)
+        print(f"\nBaseline aggiornata: {args.baseline}")
+        return 0
+    
+    if baseline:
+        regressioni = confronta(risultati, baseline)
+        if regressioni:
+            print('\nRegressioni rispetto alla baseline:')
+            for regressione in regressioni:
+                print(f'  - {regressione}')
+            return 1
+        print('\nNessuna regressione rispetto alla baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
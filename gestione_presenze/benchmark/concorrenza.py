@@ -0,0 +1,213 @@
+"""
+Benchmark di concorrenza sotto ASGI: avvia uvicorn e confronta, per ogni
+endpoint di lettura, la vista sincrona (DRF, eseguita in un thread) con la
+versione asincrona in /api/async/, a diversi livelli di concorrenza.
+
+Usa il database configurato, che va prima popolato:
+    python manage.py popola_db --partecipanti 200 --giorni 120
+    python -m benchmark.concorrenza
+    python -m benchmark.concorrenza --concorrenza 1 10 50 100 --richieste 1000 --solo registro
+
+Richiede uvicorn (pip install uvicorn), che non fa parte delle dipendenze
+dell'applicazione. Il client HTTP è minimale (asyncio, connessioni keep-alive
+una per richiesta concorrente) per non aggiungere altre dipendenze.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROGETTO = Path(__file__).resolve().parent.parent
+
+# nome: (utente, percorso sincrono, percorso asincrono)
+ENDPOINT = [
+    ('registro_lista', 'admin', '/api/registro/?page_size=100', '/api/async/registro/?page_size=100'),
+    ('registro_lista_partecipante', 'partecipante', '/api/registro/', '/api/async/registro/'),
+    ('registro_summary', 'admin', '/api/registro/summary/?group_by=month',
+     '/api/async/registro/summary/?group_by=month'),
+    ('partecipante_me', 'partecipante', '/api/partecipante/me/', '/api/async/partecipante/me/'),
+    ('partecipante_stats', 'admin', '/api/partecipante/{partecipante}/stats/',
+     '/api/async/partecipante/{partecipante}/stats/'),
+    ('admin_me', 'admin', '/api/admin/profile/me/', '/api/async/admin/profile/me/'),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark.concorrenza', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concorrenza', type=int, nargs='+', default=[1, 10, 50],
+                        help='richieste contemporanee (uno o più livelli)')
+    parser.add_argument('--richieste', type=int, default=300,
+                        help='richieste totali per endpoint e livello di concorrenza')
+    parser.add_argument('--prefisso', default='demo', help='prefisso degli utenti creati da popola_db')
+    parser.add_argument('--porta', type=int, default=0, help='porta di uvicorn (0: una libera)')
+    parser.add_argument('--solo', help='esegue solo gli endpoint il cui nome contiene questo testo')
+    return parser.parse_args(argv)
+
+
+def prepara_token(prefisso):
+    """Token JWT dei primi utenti del dataset (generati in locale, senza login)"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestione_presenze.settings')
+    sys.path.insert(0, str(PROGETTO))
+    import django
+    django.setup()
+    
+    from partecipante.authentication import TokenConRuoloSerializer
+    from partecipante.models import Utente
+    
+    utenti = {}
+    for ruolo in ('admin', 'partecipante'):
+        utente = (
+            Utente.objects.filter(ruolo=ruolo, username__startswith=f'{prefisso}_')
+            .order_by('pk').first()
+        )
+        if utente is None:
+            raise SystemExit(
+                f"Nessun utente {ruolo} con prefisso '{prefisso}': esegui prima manage.py popola_db"
+            )
+        utenti[ruolo] = utente
+    return {
+        'admin': str(TokenConRuoloSerializer.get_token(utenti['admin']).access_token),
+        'partecipante': str(TokenConRuoloSerializer.get_token(utenti['partecipante']).access_token),
+        'id_partecipante': utenti['partecipante'].pk,
+    }
+
+
+def porta_libera():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def avvia_uvicorn(porta):
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'gestione_presenze.asgi:application',
+         '--host', '127.0.0.1', '--port', str(porta), '--log-level', 'warning', '--no-access-log'],
+        cwd=PROGETTO,
+    )
+    scadenza = time.monotonic() + 30
+    while time.monotonic() < scadenza:
+        if processo.poll() is not None:
+            raise SystemExit('uvicorn non si è avviato (è installato?)')
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=0.2).close()
+            return processo
+        except OSError:
+            time.sleep(0.1)
+    processo.terminate()
+    raise SystemExit('uvicorn non risponde')
+
+
+class Connessione:
+    """Connessione HTTP/1.1 keep-alive minimale (risposte con Content-Length)"""
+    
+    def __init__(self, porta):
+        self.porta = porta
+        self.reader = self.writer = None
+    
+    async def get(self, percorso, token):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.porta)
+        self.writer.write(
+            f'GET {percorso} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+            f'Authorization: Bearer {token}\r\nAccept: application/json\r\n\r\n'.encode()
+        )
+        await self.writer.drain()
+        
+        intestazioni = await self.reader.readuntil(b'\r\n\r\n')
+        righe = intestazioni.decode('latin-1').split('\r\n')
+        codice = int(righe[0].split()[1])
+        lunghezza = None
+        for riga in righe[1:]:
+            nome, _, valore = riga.partition(':')
+            if nome.lower() == 'content-length':
+                lunghezza = int(valore)
+        if lunghezza is None:
+            raise RuntimeError(f'Risposta senza Content-Length da {percorso}')
+        await self.reader.readexactly(lunghezza)
+        return codice
+    
+    def chiudi(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def carico(porta, percorso, token, richieste, concorrenza):
+    """Esegue `richieste` GET con `concorrenza` client in parallelo"""
+    durate = []
+    errori = 0
+    restanti = iter(range(richieste))
+    
+    async def client():
+        nonlocal errori
+        connessione = Connessione(porta)
+        try:
+            for _ in restanti:
+                inizio = time.perf_counter()
+                codice = await connessione.get(percorso, token)
+                durate.append(time.perf_counter() - inizio)
+                if codice != 200:
+                    errori += 1
+        finally:
+            connessione.chiudi()
+    
+    inizio = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concorrenza)))
+    totale = time.perf_counter() - inizio
+    
+    durate.sort()
+    return {
+        'rps': richieste / totale,
+        'p50_ms': statistics.median(durate) * 1000,
+        'p95_ms': durate[int(len(durate) * 0.95) - 1] * 1000,
+        'errori': errori,
+    }
+
+
+async def esegui(porta, token, args):
+    risultati = []
+    for nome, utente, sincrono, asincrono in ENDPOINT:
+        if args.solo and args.solo not in nome:
+            continue
+        for modalita, percorso in (('sync', sincrono), ('async', asincrono)):
+            percorso = percorso.format(partecipante=token['id_partecipante'])
+            # Riscaldamento: connessioni, cache delle risposte e della verifica utente
+            await carico(porta, percorso, token[utente], 5, 1)
+            for concorrenza in args.concorrenza:
+                misura = await carico(porta, percorso, token[utente], args.richieste, concorrenza)
+                risultati.append((nome, modalita, concorrenza, misura))
+    return risultati
+
+
+def stampa(risultati):
+    intestazione = f"{'endpoint':30} {'modo':>6} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errori':>7}"
+    print(intestazione)
+    print('-' * len(intestazione))
+    for nome, modalita, concorrenza, m in risultati:
+        print(f"{nome:30} {modalita:>6} {concorrenza:>5} {m['rps']:>9.1f} "
+              f"{m['p50_ms']:>9.2f} {m['p95_ms']:>9.2f} {m['errori']:>7}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    token = prepara_token(args.prefisso)
+    porta = args.porta or porta_libera()
+    
+    processo = avvia_uvicorn(porta)
+    try:
+        risultati = asyncio.run(esegui(porta, token, args))
+    finally:
+        processo.terminate()
+        processo.wait()
+    
+    stampa(risultati)
+    return 1 if any(m['errori'] for *_, m in risultati) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
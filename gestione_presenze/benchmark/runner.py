@@ -0,0 +1,197 @@
+"""
+Esecuzione degli scenari con il test client di Django e confronto con la
+baseline salvata in JSON.
+
+Per ogni scenario si misurano:
+- tempo (mediana e massimo su N ripetizioni, dopo un giro di riscaldamento)
+- numero di query SQL
+- scansioni complete di tabelle e indici (EXPLAIN QUERY PLAN, solo SQLite)
+- picco di memoria Python allocata (tracemalloc, in un giro separato per
+  non falsare i tempi)
+- dimensione della risposta
+
+Il confronto con la baseline usa solo le misure deterministiche (stato,
+query, scansioni): a parità di dataset non cambiano tra macchine diverse o
+sotto carico. I tempi sono solo informativi e vengono riportati anche in
+rapporto a uno scenario di riferimento misurato nella stessa esecuzione.
+"""
+import json
+import re
+import statistics
+import time
+import tracemalloc
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Misure confrontate con la baseline (e le sole salvate in baseline.json)
+DETERMINISTICHE = ('stato', 'query', 'scansioni')
+# Scenario leggero usato come unità per i tempi relativi
+SCENARIO_RIFERIMENTO = 'admin_me'
+
+
+class _Annulla(Exception):
+    """Usata per annullare la transazione degli scenari di scrittura"""
+
+
+def crea_client(contesto):
+    """Un client per ruolo: JWT reali per le API, sessione per Django Admin"""
+    clients = {}
+    for ruolo in ('admin', 'partecipante'):
+        token = RefreshToken.for_user(contesto[f'utente_{ruolo}']).access_token
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        clients[ruolo] = client
+    staff = Client()
+    staff.force_login(contesto['utente_admin'])
+    clients['staff'] = staff
+    return clients
+
+
+def _richiesta(client, scenario, contesto):
+    metodo = getattr(client, scenario.metodo)
+    kwargs = {}
+    if scenario.dati is not None:
+        kwargs = {'data': scenario.dati(contesto), 'format': scenario.formato}
+    
+    if not scenario.scrittura:
+        risposta = metodo(scenario.url(contesto), **kwargs)
+        contenuto = b''.join(risposta.streaming_content) if risposta.streaming else risposta.content
+        return risposta, contenuto
+    
+    try:
+        with transaction.atomic():
+            risposta = metodo(scenario.url(contesto), **kwargs)
+            contenuto = risposta.content
+            raise _Annulla
+    except _Annulla:
+        pass
+    return risposta, contenuto
+
+
+def esegui_scenario(scenario, client, contesto, ripetizioni, cache_fredda=True):
+    def prepara():
+        if cache_fredda:
+            for cache in caches.all():
+                cache.clear()
+    
+    # Riscaldamento (e controllo che lo scenario funzioni)
+    prepara()
+    risposta, contenuto = _richiesta(client, scenario, contesto)
+    if risposta.status_code >= 400:
+        raise RuntimeError(
+            f"{scenario.nome}: HTTP {risposta.status_code} - {contenuto[:200]!r}"
+        )
+    
+    tempi = []
+    for _ in range(ripetizioni):
+        prepara()
+        inizio = time.perf_counter()
+        _richiesta(client, scenario, contesto)
+        tempi.append(time.perf_counter() - inizio)
+    
+    prepara()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as query:
+            _, contenuto = _richiesta(client, scenario, contesto)
+        _, picco = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        'stato': risposta.status_code,
+        'query': len(query),
+        'scansioni': _scansioni(query.captured_queries),
+        'ms_mediana': round(statistics.median(tempi) * 1000, 2),
+        'ms_max': round(max(tempi) * 1000, 2),
+        'picco_kb': round(picco / 1024, 1),
+        'byte': len(contenuto),
+    }
+
+
+def _scansioni(query):
+    """
+    Numero di scansioni complete (SCAN, anche su indice) di tabelle del database
+    nei piani delle SELECT eseguite; None se il database non è SQLite
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    tabelle = set(connection.introspection.table_names())
+    scansioni = 0
+    with connection.cursor() as cursor:
+        for eseguita in query:
+            if not eseguita['sql'].startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + eseguita['sql'])
+            for riga in cursor.fetchall():
+                scansione = re.match(r'SCAN (?:TABLE )?(\w+)', riga[3])
+                if scansione and scansione.group(1) in tabelle:
+                    scansioni += 1
+    return scansioni
+
+
+def esegui(scenari, contesto, ripetizioni=5, cache_fredda=True, filtro=None):
+    clients = crea_client(contesto)
+    risultati = {}
+    for scenario in scenari:
+        if filtro and filtro not in scenario.nome:
+            continue
+        risultati[scenario.nome] = esegui_scenario(
+            scenario, clients[scenario.ruolo], contesto, ripetizioni, cache_fredda
+        )
+    return risultati
+
+
+def tempi_relativi(risultati, riferimento=SCENARIO_RIFERIMENTO):
+    """
+    Mediana di ogni scenario divisa per quella dello scenario di riferimento
+    della stessa esecuzione (vuoto se il riferimento non è stato eseguito)
+    """
+    unita = risultati.get(riferimento, {}).get('ms_mediana')
+    if not unita:
+        return {}
+    return {nome: round(r['ms_mediana'] / unita, 2) for nome, r in risultati.items()}
+
+
+def confronta(risultati, baseline):
+    """
+    Ritorna la lista delle regressioni rispetto alla baseline: stato HTTP
+    diverso, più query o più scansioni complete del previsto
+    """
+    regressioni = []
+    for nome, attuale in risultati.items():
+        riferimento = baseline.get(nome)
+        if riferimento is None:
+            continue
+        if attuale['stato'] != riferimento['stato']:
+            regressioni.append(f"{nome}: stato {riferimento['stato']} -> {attuale['stato']}")
+        for metrica in ('query', 'scansioni'):
+            if None not in (attuale[metrica], riferimento.get(metrica)) and attuale[metrica] > riferimento[metrica]:
+                regressioni.append(f"{nome}: {metrica} {riferimento[metrica]} -> {attuale[metrica]}")
+    return regressioni
+
+
+def carica_baseline(percorso):
+    try:
+        with open(percorso, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def salva_risultati(percorso, parametri, risultati):
+    with open(percorso, 'w', encoding='utf-8') as f:
+        json.dump({'parametri': parametri, 'risultati': risultati}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def salva_baseline(percorso, parametri, risultati):
+    """Come salva_risultati, con le sole misure deterministiche"""
+    salva_risultati(percorso, parametri, {
+        nome: {metrica: r[metrica] for metrica in DETERMINISTICHE}
+        for nome, r in risultati.items()
+    })
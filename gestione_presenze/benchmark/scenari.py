@@ -0,0 +1,109 @@
+"""
+Scenari di benchmark: un elemento per ogni endpoint API e changelist admin.
+
+url e dati sono funzioni del contesto (utenti e parametri del dataset), così
+gli scenari funzionano con qualunque dimensione di dataset.
+"""
+from dataclasses import dataclass, field
+from importlib.util import find_spec
+from typing import Callable, Optional
+
+
+@dataclass
+class Scenario:
+    nome: str
+    url: Callable[[dict], str]
+    ruolo: str = 'admin'  # admin | partecipante | staff (sessione Django Admin)
+    metodo: str = 'get'
+    dati: Optional[Callable[[dict], object]] = None
+    formato: str = 'json'
+    scrittura: bool = False  # eseguito in una transazione annullata alla fine
+    parametri: dict = field(default_factory=dict)
+
+
+def _riga_registro(contesto):
+    return {
+        'partecipante': contesto['partecipante'].pk,
+        'data': str(contesto['ultimo_giorno']),
+        'ore_totali': '8.00',
+        'assenze': '1.00',
+    }
+
+
+def _lotto_nuovi_registri(contesto):
+    # Un giorno nuovo (prima dell'inizio del dataset) per tutti i partecipanti
+    return [
+        {'partecipante': pk, 'data': str(contesto['giorno_libero']), 'ore_totali': '8.00', 'assenze': '0.00'}
+        for pk in contesto['partecipanti_ids']
+    ]
+
+
+SCENARI = [
+    # Registro
+    Scenario('registro_lista', lambda c: '/api/registro/'),
+    Scenario('registro_lista_intervallo', lambda c: (
+        f"/api/registro/?data_inizio={c['inizio_intervallo']}&data_fine={c['ultimo_giorno']}"
+    )),
+    Scenario('registro_lista_pagina_profonda', lambda c: c['cursore_profondo']),
+    Scenario('registro_lista_partecipante', lambda c: '/api/registro/', ruolo='partecipante'),
+    # Sparse fieldset: stessa pagina grande di formato_registro_lista_json
+    Scenario('registro_lista_campi_ridotti', lambda c: (
+        '/api/registro/?page_size=1000&fields=partecipante,data,assenze'
+    )),
+    Scenario('registro_export_csv', lambda c: '/api/registro/export/?format=csv'),
+    Scenario('registro_export_ndjson', lambda c: '/api/registro/export/?format=ndjson'),
+    Scenario('registro_matrice', lambda c: '/api/registro/matrix/'),
+    Scenario('registro_matrice_intervallo', lambda c: (
+        f"/api/registro/matrix/?data_inizio={c['inizio_intervallo']}&data_fine={c['ultimo_giorno']}"
+    )),
+    Scenario('registro_summary', lambda c: '/api/registro/summary/'),
+    Scenario('registro_summary_settimana', lambda c: '/api/registro/summary/?group_by=week'),
+    Scenario('registro_summary_partecipante', lambda c: '/api/registro/summary/?group_by=partecipante'),
+    Scenario(
+        'registro_update_registro', lambda c: '/api/registro/update_registro/',
+        metodo='put', dati=_riga_registro, scrittura=True
+    ),
+    Scenario(
+        'registro_bulk', lambda c: '/api/registro/bulk/',
+        metodo='post', dati=_lotto_nuovi_registri, scrittura=True
+    ),
+    Scenario('registro_cache_stats', lambda c: '/api/registro/cache_stats/'),
+    # Partecipante
+    Scenario('partecipante_lista', lambda c: '/api/partecipante/'),
+    Scenario('partecipante_lista_campi_ridotti', lambda c: '/api/partecipante/?fields=utente'),
+    Scenario('partecipante_dettaglio', lambda c: f"/api/partecipante/{c['partecipante'].pk}/"),
+    Scenario('partecipante_stats', lambda c: f"/api/partecipante/{c['partecipante'].pk}/stats/"),
+    Scenario('partecipante_me', lambda c: '/api/partecipante/me/', ruolo='partecipante'),
+    Scenario('partecipante_classifica', lambda c: (
+        f"/api/partecipante/classifica/?page=2&page_size=20&partecipante={c['partecipante'].pk}"
+    )),
+    Scenario('partecipante_classifica_posizione', lambda c: '/api/partecipante/classifica/', ruolo='partecipante'),
+    Scenario('partecipante_a_rischio', lambda c: '/api/partecipante/a_rischio/?soglia=95&ore_corso=400'),
+    # Admin profile
+    Scenario('admin_lista', lambda c: '/api/admin/profile/'),
+    Scenario('admin_me', lambda c: '/api/admin/profile/me/'),
+    # Monitoraggio
+    Scenario('metrics', lambda c: '/api/metrics/'),
+    # Changelist Django Admin
+    Scenario('changelist_registro', lambda c: '/admin/registro/registro/', ruolo='staff'),
+    Scenario('changelist_registro_mese', lambda c: (
+        f"/admin/registro/registro/?data__year={c['ultimo_giorno'].year}&data__month={c['ultimo_giorno'].month}"
+    ), ruolo='staff'),
+    Scenario('changelist_partecipante', lambda c: '/admin/partecipante/partecipante/', ruolo='staff'),
+    Scenario('changelist_utente', lambda c: '/admin/partecipante/utente/', ruolo='staff'),
+    Scenario('changelist_riepilogo', lambda c: '/admin/registro/riepilogopresenze/', ruolo='staff'),
+]
+
+# Stesse liste nei formati di risposta: dimensione e tempo di rendering
+# rispetto al JSON (pagina grande perché il rendering pesi sul totale)
+FORMATI = ['json', 'columnar'] + (['msgpack'] if find_spec('msgpack') else [])
+
+for _formato in FORMATI:
+    SCENARI += [
+        Scenario(f'formato_registro_lista_{_formato}', lambda c, f=_formato: (
+            f'/api/registro/?page_size=1000&format={f}'
+        )),
+        Scenario(f'formato_partecipante_lista_{_formato}', lambda c, f=_formato: (
+            f'/api/partecipante/?format={f}'
+        )),
+    ]
@@ -0,0 +1,135 @@
+"""
+Confronto tra la serializzazione delle liste con ModelSerializer (un'istanza
+del modello per riga, campi calcolati in Python) e la lettura con values()
+usata da RegistroViewSet.list e PartecipanteViewSet.list (campi calcolati in
+SQL, vedi gestione_presenze/valori.py).
+
+Per ogni lista legge e rende in JSON tutte le righe nei due modi, controlla
+che il risultato sia identico e riporta righe al secondo e accelerazione.
+Usa un database di test separato, come python -m benchmark.
+
+    python -m benchmark.serializzazione                      # 500 x 100 = 50.000 registri
+    python -m benchmark.serializzazione --partecipanti 1000 --minimo 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark.serializzazione', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partecipanti', type=int, default=500)
+    parser.add_argument('--giorni', type=int, default=100, help='giorni lavorativi di registro')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ripetizioni', type=int, default=3)
+    parser.add_argument('--minimo', type=float, default=3.0,
+                        help='accelerazione minima attesa per il registro (codice di uscita 1 se inferiore)')
+    return parser.parse_args(argv)
+
+
+def misura(funzione, ripetizioni):
+    """(mediana dei secondi, ultimo risultato)"""
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        risultato = funzione()
+        tempi.append(time.perf_counter() - inizio)
+    return statistics.median(tempi), risultato
+
+
+def confronti():
+    """nome -> (queryset, classe del serializer, espressioni dei campi calcolati)"""
+    from partecipante.models import Partecipante
+    from partecipante.serializers import PartecipanteSerializer
+    from partecipante.views import PartecipanteViewSet
+    from registro.models import Registro
+    from registro.serializers import RegistroSerializer
+    from registro.views import RegistroViewSet
+    
+    return {
+        'registro': (
+            Registro.objects.select_related('partecipante__utente').order_by('-data', '-id'),
+            RegistroSerializer,
+            RegistroViewSet.espressioni_valori,
+        ),
+        'partecipante': (
+            Partecipante.objects.select_related('utente').con_presenze().order_by('pk'),
+            PartecipanteSerializer,
+            PartecipanteViewSet.espressioni_valori,
+        ),
+    }
+
+
+def esegui(ripetizioni):
+    from rest_framework.renderers import JSONRenderer
+    from gestione_presenze.valori import LettoreValori
+    
+    renderer = JSONRenderer()
+    risultati = {}
+    for nome, (queryset, serializer_class, espressioni) in confronti().items():
+        def con_serializer():
+            return renderer.render(serializer_class(queryset.all(), many=True).data)
+        
+        def con_values():
+            lettore = LettoreValori(serializer_class(many=True), espressioni)
+            return renderer.render(lettore.rappresenta(lettore.queryset(queryset.all())))
+        
+        secondi_serializer, atteso = misura(con_serializer, ripetizioni)
+        secondi_values, ottenuto = misura(con_values, ripetizioni)
+        if ottenuto != atteso:
+            raise SystemExit(f'{nome}: la lettura con values() non produce lo stesso JSON del serializer')
+        
+        righe = queryset.count()
+        risultati[nome] = {
+            'righe': righe,
+            'serializer_righe_s': righe / secondi_serializer,
+            'values_righe_s': righe / secondi_values,
+            'accelerazione': secondi_serializer / secondi_values,
+        }
+    return risultati
+
+
+def stampa(risultati):
+    intestazione = f"{'lista':14} {'righe':>8} {'serializer righe/s':>19} {'values righe/s':>15} {'x':>6}"
+    print(intestazione)
+    print('-' * len(intestazione))
+    for nome, r in risultati.items():
+        print(f"{nome:14} {r['righe']:>8} {r['serializer_righe_s']:>19.0f} "
+              f"{r['values_righe_s']:>15.0f} {r['accelerazione']:>6.1f}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestione_presenze.settings')
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import django
+    django.setup()
+    
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from registro.dataset import genera_dataset
+    
+    setup_test_environment()
+    test_runner = DiscoverRunner(verbosity=0)
+    database = test_runner.setup_databases()
+    try:
+        genera_dataset(partecipanti=args.partecipanti, giorni=args.giorni, seed=args.seed)
+        risultati = esegui(args.ripetizioni)
+    finally:
+        test_runner.teardown_databases(database)
+        teardown_test_environment()
+    
+    stampa(risultati)
+    if risultati['registro']['accelerazione'] < args.minimo:
+        print(f"\nAccelerazione del registro inferiore a {args.minimo}x")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
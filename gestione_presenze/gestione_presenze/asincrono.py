@@ -0,0 +1,76 @@
+"""
+Supporto per le viste asincrone di sola lettura (ASGI).
+
+DRF esegue le viste solo in modo sincrono: sotto ASGI ogni richiesta passa
+a un thread e lo tiene occupato per tutto l'I/O sul database. Le viste
+decorate con vista_async sono coroutine Django che usano l'ORM asincrono;
+il decoratore replica le parti di DRF che servono alle letture:
+autenticazione JWT, controllo del ruolo, gestione delle eccezioni API e
+rendering JSON identico a quello delle viste sincrone.
+"""
+from functools import wraps
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from partecipante.authentication import JWTClaimsAuthentication
+from .metriche import misura_render
+
+
+def _risposta_json(dati, codice):
+    renderer = JSONRenderer()
+    with misura_render():
+        contenuto = renderer.render(dati)
+    return HttpResponse(contenuto, status=codice, content_type=renderer.media_type)
+
+
+def _risposta_errore(exc):
+    dati = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    response = _risposta_json(dati, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+def vista_async(ruoli=None):
+    """
+    Trasforma una coroutine (request, ...) -> Response in una vista Django async
+    (può anche restituire direttamente una HttpResponse, ad esempio un 304)
+    La request passata è una Request DRF già autenticata (query_params, user, auth)
+    ruoli: se indicato, gli altri ruoli ricevono 403
+    """
+    def decoratore(funzione):
+        @wraps(funzione)
+        async def vista(request, *args, **kwargs):
+            if request.method != 'GET':
+                return _risposta_errore(exceptions.MethodNotAllowed(request.method))
+            
+            try:
+                autenticato = await JWTClaimsAuthentication().aauthenticate(request)
+                if autenticato is None:
+                    raise exceptions.NotAuthenticated()
+                
+                richiesta = Request(request, authenticators=())
+                richiesta.user, richiesta.auth = autenticato
+                if ruoli and richiesta.user.ruolo not in ruoli:
+                    raise exceptions.PermissionDenied()
+                
+                response = await funzione(richiesta, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return _risposta_errore(exc)
+            
+            if not isinstance(response, Response):
+                return response
+            finale = _risposta_json(response.data, response.status_code)
+            for intestazione, valore in response.items():
+                if intestazione.lower() != 'content-type':
+                    finale[intestazione] = valore
+            return finale
+        return vista
+    return decoratore
+
+
+def errore(messaggio, codice=status.HTTP_400_BAD_REQUEST):
+    """Risposta di errore nello stesso formato delle viste sincrone"""
+    return Response({'error': messaggio}, status=codice)
@@ -0,0 +1,86 @@
+"""
+Sparse fieldset: ?fields=a,b e ?exclude=c sulle letture delle API.
+
+I campi esclusi non vengono solo tolti dalla risposta: ogni vista dichiara
+quali colonne del database servono a ciascun campo del serializer, così la
+query legge solo quelle (.only()) e fa le join (select_related) solo se un
+campo richiesto le usa. Le risposte ridotte costano meno anche sul database.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def campi_richiesti(query_params, colonne_campi):
+    """
+    Campi da includere, nell'ordine di colonne_campi, o None se la risposta
+    li contiene tutti (nessun parametro). Campi sconosciuti: ValidationError
+    """
+    richiesti = {}
+    for param in ('fields', 'exclude'):
+        valore = query_params.get(param, '')
+        richiesti[param] = [campo.strip() for campo in valore.split(',') if campo.strip()]
+    if not richiesti['fields'] and not richiesti['exclude']:
+        return None
+    
+    sconosciuti = [
+        campo for campo in richiesti['fields'] + richiesti['exclude'] if campo not in colonne_campi
+    ]
+    if sconosciuti:
+        raise ValidationError({
+            'fields': f"Campi non validi: {', '.join(sconosciuti)}. Disponibili: {', '.join(colonne_campi)}"
+        })
+    
+    return [
+        campo for campo in colonne_campi
+        if (not richiesti['fields'] or campo in richiesti['fields']) and campo not in richiesti['exclude']
+    ]
+
+
+def solo_colonne(queryset, colonne_campi, campi, sempre=()):
+    """
+    Limita il queryset alle colonne dei campi richiesti (più quelle sempre
+    necessarie alla vista, es. ordinamento e permessi) e alle sole join usate
+    """
+    if campi is None:
+        return queryset
+    colonne = [*sempre, *(colonna for campo in campi for colonna in colonne_campi[campo])]
+    relazioni = {colonna.rsplit('__', 1)[0] for colonna in colonne if '__' in colonna}
+    queryset = queryset.select_related(None)
+    if relazioni:
+        queryset = queryset.select_related(*relazioni)
+    return queryset.only(*colonne)
+
+
+def riduci_serializer(serializer, campi):
+    """Toglie dal serializer (o dal child di un serializer many=True) i campi non richiesti"""
+    if campi is None:
+        return serializer
+    campi_serializer = getattr(serializer, 'child', serializer).fields
+    for campo in list(campi_serializer):
+        if campo not in campi:
+            campi_serializer.pop(campo)
+    return serializer
+
+
+class CampiParzialiMixin:
+    """
+    ?fields= / ?exclude= per le azioni di lettura di un ViewSet
+    colonne_campi: campo del serializer -> colonne da leggere ('relazione__campo' per le join)
+    colonne_sempre: colonne che servono comunque alla vista
+    get_queryset deve passare il proprio queryset da riduci_queryset()
+    """
+    colonne_campi = {}
+    colonne_sempre = ()
+    azioni_campi_parziali = ('list', 'retrieve')
+    
+    def campi_richiesti(self):
+        if self.action not in self.azioni_campi_parziali:
+            return None
+        if not hasattr(self, '_campi_richiesti'):
+            self._campi_richiesti = campi_richiesti(self.request.query_params, self.colonne_campi)
+        return self._campi_richiesti
+    
+    def riduci_queryset(self, queryset):
+        return solo_colonne(queryset, self.colonne_campi, self.campi_richiesti(), self.colonne_sempre)
+    
+    def get_serializer(self, *args, **kwargs):
+        return riduci_serializer(super().get_serializer(*args, **kwargs), self.campi_richiesti())
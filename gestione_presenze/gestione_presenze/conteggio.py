@@ -0,0 +1,46 @@
+"""
+Conteggio stimato per le changelist admin delle tabelle molto grandi.
+
+La paginazione dell'admin esegue un COUNT(*) a ogni pagina: su milioni di
+righe è la query più lenta della changelist. Senza filtri né ricerca il
+totale serve solo per il numero di pagine, quindi basta una stima: le
+statistiche del database su PostgreSQL. Gli altri database non hanno una
+stima affidabile (l'id più alto non tiene conto delle eliminazioni) e
+contano sempre. Con filtri o ricerca il conteggio resta esatto. La stima è
+usata solo oltre ADMIN_CONTEGGIO_STIMATO_DA righe (None: sempre esatto).
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def stima_righe(model, using='default'):
+    """Numero approssimato di righe della tabella del modello, None se non disponibile"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table]
+        )
+        riga = cursor.fetchone()
+    # -1 / 0: tabella mai analizzata
+    if riga and riga[0] > 0:
+        return riga[0]
+    return None
+
+
+class PaginatorStimato(Paginator):
+    """Paginator con conteggio stimato per le liste senza filtri (vedi modulo)"""
+    
+    @cached_property
+    def count(self):
+        soglia = getattr(settings, 'ADMIN_CONTEGGIO_STIMATO_DA', None)
+        queryset = self.object_list
+        if soglia is not None and not queryset.query.where:
+            stima = stima_righe(queryset.model, queryset.db)
+            if stima is not None and stima >= soglia:
+                return stima
+        return super().count
@@ -0,0 +1,347 @@
+"""
+Metriche per richiesta: numero e tempo delle query SQL, tempo di
+serializzazione e di rendering della risposta e tempo totale della view.
+
+Il middleware le aggiunge alla risposta come header Server-Timing e le
+accumula in istogrammi per route (nome della view), esposti in formato
+Prometheus dall'endpoint /api/metrics/ (solo admin).
+
+Il costo per richiesta è di qualche chiamata a perf_counter e di un
+aggiornamento degli istogrammi sotto lock: può restare attivo in produzione.
+
+Le query sono contate da un execute_wrapper installato su ogni connessione,
+che scrive nelle misure della richiesta corrente (ContextVar): funziona sia
+per le viste sincrone sia per quelle asincrone, dove l'ORM esegue le query
+in un altro thread. Il rendering è misurato dal middleware stesso, tra
+process_template_response e la fine di render() della risposta DRF, senza
+modificare serializer o renderer. La serializzazione (righe lette -> dati
+della risposta) avviene invece dentro la view: la misura LettoreValori,
+usato dalle liste sincrone e asincrone, con misura_serializzazione(), senza
+contare la lettura delle righe. Le risposte in streaming (export) sono
+registrate a fine stream, così includono anche le query eseguite durante
+l'invio; l'header Server-Timing, già inviato, riporta solo la parte iniziale.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from rest_framework.views import APIView
+from registro import cache
+from registro.permissions import IsAdmin
+
+# Limiti superiori dei bucket (secondi per i tempi, numero per le query)
+BUCKET_TEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_QUERY = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUANTILI = (0.5, 0.95, 0.99)
+
+METRICHE = {
+    # nome: (descrizione, bucket)
+    'gp_view_durata_secondi': ('Tempo totale della view', BUCKET_TEMPO),
+    'gp_sql_durata_secondi': ('Tempo speso in query SQL', BUCKET_TEMPO),
+    'gp_serializzazione_durata_secondi': ('Tempo di serializzazione dei dati della risposta', BUCKET_TEMPO),
+    'gp_render_durata_secondi': ('Tempo di rendering della risposta', BUCKET_TEMPO),
+    'gp_sql_query': ('Numero di query SQL per richiesta', BUCKET_QUERY),
+}
+
+_misure_correnti = ContextVar('misure_correnti', default=None)
+
+
+class _Misure:
+    __slots__ = ('query', 'sql', 'serializzazione', 'render')
+    
+    def __init__(self):
+        self.query = 0
+        self.sql = 0.0
+        self.serializzazione = 0.0
+        self.render = 0.0
+
+
+class Istogramma:
+    """Istogramma a bucket fissi (cumulativi solo in esportazione)"""
+    
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.conteggi = [0] * (len(bucket) + 1)
+        self.somma = 0.0
+        self.totale = 0
+    
+    def osserva(self, valore):
+        self.conteggi[bisect_left(self.bucket, valore)] += 1
+        self.somma += valore
+        self.totale += 1
+    
+    def quantile(self, q):
+        """Stima del quantile per interpolazione lineare nel bucket"""
+        if not self.totale:
+            return 0.0
+        obiettivo = q * self.totale
+        cumulato = 0
+        for indice, conteggio in enumerate(self.conteggi):
+            if cumulato + conteggio >= obiettivo and conteggio:
+                inferiore = self.bucket[indice - 1] if indice else 0.0
+                if indice == len(self.bucket):
+                    # Oltre l'ultimo bucket non c'è un limite superiore
+                    return float(self.bucket[-1])
+                frazione = (obiettivo - cumulato) / conteggio
+                return inferiore + (self.bucket[indice] - inferiore) * frazione
+            cumulato += conteggio
+        return float(self.bucket[-1])
+
+
+class RaccoltaMetriche:
+    """Istogrammi per (metrica, route, metodo), condivisi nel processo"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._istogrammi = {}
+    
+    def registra(self, route, metodo, valori):
+        with self._lock:
+            for nome, valore in valori.items():
+                chiave = (nome, route, metodo)
+                istogramma = self._istogrammi.get(chiave)
+                if istogramma is None:
+                    istogramma = self._istogrammi[chiave] = Istogramma(METRICHE[nome][1])
+                istogramma.osserva(valore)
+    
+    def azzera(self):
+        with self._lock:
+            self._istogrammi.clear()
+    
+    def prometheus(self):
+        """Esporta gli istogrammi (e i quantili stimati) nel formato testuale Prometheus"""
+        with self._lock:
+            istogrammi = sorted(self._istogrammi.items())
+            righe = []
+            for nome, (descrizione, _) in METRICHE.items():
+                righe.append(f'# HELP {nome} {descrizione}')
+                righe.append(f'# TYPE {nome} histogram')
+                quantili = []
+                for (metrica, route, metodo), istogramma in istogrammi:
+                    if metrica != nome:
+                        continue
+                    etichette = f'route="{route}",method="{metodo}"'
+                    cumulato = 0
+                    for limite, conteggio in zip(istogramma.bucket, istogramma.conteggi):
+                        cumulato += conteggio
+                        righe.append(f'{nome}_bucket{{{etichette},le="{limite}"}} {cumulato}')
+                    righe.append(f'{nome}_bucket{{{etichette},le="+Inf"}} {istogramma.totale}')
+                    righe.append(f'{nome}_sum{{{etichette}}} {istogramma.somma:.6f}')
+                    righe.append(f'{nome}_count{{{etichette}}} {istogramma.totale}')
+                    for q in QUANTILI:
+                        quantili.append(
+                            f'{nome}_quantile{{{etichette},quantile="{q}"}} {istogramma.quantile(q):.6f}'
+                        )
+                righe.append(f'# HELP {nome}_quantile {descrizione} (quantili stimati dai bucket)')
+                righe.append(f'# TYPE {nome}_quantile gauge')
+                righe.extend(quantili)
+        
+        statistiche_cache = cache.statistiche()
+        for evento in ('hit', 'miss', 'invalidazioni'):
+            righe.append(f'# TYPE gp_cache_{evento}_total counter')
+            righe.append(f'gp_cache_{evento}_total {statistiche_cache[evento]}')
+        return '\n'.join(righe) + '\n'
+
+
+metriche = RaccoltaMetriche()
+
+
+@contextmanager
+def _cronometro(attributo):
+    """Aggiunge la durata del blocco alla misura indicata della richiesta corrente"""
+    misure = _misure_correnti.get()
+    inizio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if misure is not None:
+            setattr(misure, attributo, getattr(misure, attributo) + time.perf_counter() - inizio)
+
+
+def misura_render():
+    """
+    Aggiunge al tempo di rendering della richiesta corrente il blocco eseguito
+    (per le viste che producono il corpo da sole, es. quelle asincrone)
+    """
+    return _cronometro('render')
+
+
+def misura_serializzazione():
+    """Aggiunge al tempo di serializzazione della richiesta corrente il blocco eseguito"""
+    return _cronometro('serializzazione')
+
+
+def _conta_query(execute, sql, params, many, context):
+    misure = _misure_correnti.get()
+    if misure is None:
+        return execute(sql, params, many, context)
+    inizio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        misure.sql += time.perf_counter() - inizio
+        misure.query += 1
+
+
+def _strumenta_connessione(connection, **kwargs):
+    if _conta_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_conta_query)
+
+
+def _strumenta_connessioni():
+    """Connessioni del thread corrente (quelle nuove passano da connection_created)"""
+    for alias in connections:
+        _strumenta_connessione(connections[alias])
+
+
+class MetricheMiddleware:
+    """
+    Misura ogni richiesta e aggiunge l'header Server-Timing
+    Compatibile con viste sincrone e asincrone (non forza il passaggio a un thread)
+    Disattivabile con METRICHE_ATTIVE = False nei settings
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+        self.attivo = getattr(settings, 'METRICHE_ATTIVE', True)
+        if self.attivo:
+            connection_created.connect(_strumenta_connessione, dispatch_uid='metriche_query')
+    
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if not self.attivo:
+            return self.get_response(request)
+        
+        _strumenta_connessioni()
+        misure = _Misure()
+        token = _misure_correnti.set(misure)
+        inizio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _misure_correnti.reset(token)
+        return self._registra(request, response, misure, inizio)
+    
+    async def __acall__(self, request):
+        if not self.attivo:
+            return await self.get_response(request)
+        
+        misure = _Misure()
+        token = _misure_correnti.set(misure)
+        inizio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _misure_correnti.reset(token)
+        return self._registra(request, response, misure, inizio)
+    
+    def process_template_response(self, request, response):
+        """
+        Chiamato subito prima di render() (è il primo middleware, quindi l'ultimo
+        a ricevere la risposta): il tempo fino alla fine di render() è il rendering
+        """
+        misure = _misure_correnti.get()
+        if misure is not None:
+            inizio = time.perf_counter()
+            
+            def fine_render(response):
+                misure.render += time.perf_counter() - inizio
+            
+            response.add_post_render_callback(fine_render)
+        return response
+    
+    def _registra(self, request, response, misure, inizio):
+        durata = time.perf_counter() - inizio
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={misure.sql * 1000:.1f};desc="{misure.query} query"',
+            f'serializzazione;dur={misure.serializzazione * 1000:.1f}',
+            f'render;dur={misure.render * 1000:.1f}',
+            f'view;dur={durata * 1000:.1f}',
+        ])
+        
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else 'non_risolta'
+        
+        def registra():
+            metriche.registra(route, request.method, {
+                'gp_view_durata_secondi': time.perf_counter() - inizio,
+                'gp_sql_durata_secondi': misure.sql,
+                'gp_serializzazione_durata_secondi': misure.serializzazione,
+                'gp_render_durata_secondi': misure.render,
+                'gp_sql_query': misure.query,
+            })
+        
+        if not response.streaming:
+            registra()
+        elif response.is_async:
+            response.streaming_content = _acontenuto_misurato(
+                response.streaming_content, misure, registra
+            )
+        else:
+            response.streaming_content = _contenuto_misurato(
+                response.streaming_content, misure, registra
+            )
+        return response
+
+
+def _contenuto_misurato(contenuto, misure, registra):
+    """
+    Contenuto in streaming con le misure della richiesta attive durante ogni
+    blocco (le query dell'export sono eseguite qui); a fine stream le registra
+    """
+    iteratore = iter(contenuto)
+    try:
+        while True:
+            token = _misure_correnti.set(misure)
+            try:
+                blocco = next(iteratore, None)
+            finally:
+                _misure_correnti.reset(token)
+            if blocco is None:
+                return
+            yield blocco
+    finally:
+        registra()
+
+
+async def _acontenuto_misurato(contenuto, misure, registra):
+    """Come _contenuto_misurato, per lo streaming asincrono"""
+    iteratore = aiter(contenuto)
+    try:
+        while True:
+            token = _misure_correnti.set(misure)
+            try:
+                blocco = await anext(iteratore, None)
+            finally:
+                _misure_correnti.reset(token)
+            if blocco is None:
+                return
+            yield blocco
+    finally:
+        registra()
+
+
+class MetricheView(APIView):
+    """
+    Endpoint con le metriche per route in formato Prometheus
+    Solo per admin
+    """
+    permission_classes = [IsAdmin]
+    
+    def get(self, request):
+        return HttpResponse(
+            metriche.prometheus(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
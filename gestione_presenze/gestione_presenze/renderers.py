@@ -0,0 +1,83 @@
+"""
+Formati compatti per le risposte grandi, in aggiunta al JSON di DRF.
+
+- ColumnarJSONRenderer (?format=columnar): le liste di oggetti diventano
+  {"columns": [...], "rows": [[...]]}, con i nomi dei campi scritti una volta
+  sola invece che in ogni elemento. Le liste paginate mantengono next/previous.
+- MessagePackRenderer (?format=msgpack): MessagePack binario, disponibile se
+  è installato il pacchetto msgpack (pip install msgpack).
+
+Entrambi scrivono i decimali come numeri: le viste che usano
+DecimaliNumericiMixin disattivano la conversione in stringa dei DecimalField
+quando la risposta è in uno di questi formati.
+"""
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _colonnare(elementi):
+    """Lista di dizionari -> (colonne, righe) con le chiavi del primo elemento"""
+    colonne = list(elementi[0]) if elementi else []
+    return colonne, [[elemento[colonna] for colonna in colonne] for elemento in elementi]
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.columnar+json'
+    format = 'columnar'
+    decimali_numerici = True
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list) and all(isinstance(elemento, dict) for elemento in data):
+            colonne, righe = _colonnare(data)
+            data = {'columns': colonne, 'rows': righe}
+        elif isinstance(data, dict) and isinstance(data.get('results'), list):
+            # Lista paginata: next/previous restano, results diventa colonnare
+            colonne, righe = _colonnare(data['results'])
+            data = {
+                **{chiave: valore for chiave, valore in data.items() if chiave != 'results'},
+                'columns': colonne,
+                'rows': righe,
+            }
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    decimali_numerici = True
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Date, Decimal, UUID, ... come nel JSON di DRF
+        return msgpack.packb(data, default=JSONEncoder().default)
+
+
+class DecimaliNumericiMixin:
+    """
+    Per le viste DRF: con un renderer che ha decimali_numerici i DecimalField
+    del serializer sono resi come numeri invece che come stringhe
+    """
+    
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        if getattr(renderer, 'decimali_numerici', False):
+            _decimali_numerici(getattr(serializer, 'child', serializer))
+        return serializer
+
+
+def _decimali_numerici(serializer):
+    for campo in serializer.fields.values():
+        if isinstance(campo, serializers.DecimalField):
+            campo.coerce_to_string = False
+        elif isinstance(campo, serializers.BaseSerializer):
+            _decimali_numerici(getattr(campo, 'child', campo))
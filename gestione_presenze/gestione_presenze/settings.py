@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primo della lista: misura anche il tempo degli altri middleware
+    'gestione_presenze.metriche.MetricheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,6 +93,39 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Local-memory di default: in produzione con più processi usare un backend
+# condiviso (es. django.core.cache.backends.redis.RedisCache)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gestione-presenze',
+    }
+}
+
+# Cache delle risposte stats/summary (invalidata ad ogni scrittura sul registro)
+REGISTRO_CACHE_ALIAS = 'default'
+REGISTRO_CACHE_TIMEOUT = 60 * 60
+
+# Feed di sincronizzazione: giorni di conservazione delle tracce dei registri
+# eliminati (comando pulisci_eliminati); i cursori più vecchi ripartono da capo
+REGISTRO_SYNC_CONSERVAZIONE_GIORNI = 90
+
+# Percentuale minima di presenza richiesta dal corso (default di /api/partecipante/a_rischio/)
+REGISTRO_PRESENZA_MINIMA = 80
+
+# Changelist admin senza filtri: oltre queste righe il totale è stimato dalle
+# statistiche di PostgreSQL invece di contato con COUNT(*) (gli altri database
+# contano sempre). None: sempre conteggio esatto
+ADMIN_CONTEGGIO_STIMATO_DA = 500000
+
+
+# Metriche per richiesta (header Server-Timing + /api/metrics/)
+METRICHE_ATTIVE = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -133,14 +168,32 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT con ruolo e profili nei claim: nessuna query per autenticare
+        'partecipante.authentication.JWTClaimsAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        # Formati compatti per le liste grandi (Accept o ?format=columnar)
+        'gestione_presenze.renderers.ColumnarJSONRenderer',
     ],
 }
 
+# MessagePack (?format=msgpack) solo se il pacchetto msgpack è installato
+from importlib.util import find_spec
+
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('gestione_presenze.renderers.MessagePackRenderer')
+
 # JWT Settings
 from datetime import timedelta
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'partecipante.authentication.TokenConRuoloSerializer',
 }
+
+# Ogni quanto (secondi, per processo) ricontrollare che l'utente del token sia
+# ancora attivo e con lo stesso ruolo. None: nessun controllo sul database.
+JWT_VERIFICA_UTENTE_SECONDI = 60
@@ -16,6 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
+from .metriche import MetricheView
+from admin_profile import views_async as admin_async
+from partecipante import views_async as partecipante_async
+from registro import views_async as registro_async
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -31,4 +35,15 @@ urlpatterns = [
     path('api/partecipante/', include('partecipante.urls')),
     path('api/admin/', include('admin_profile.urls')),
     path('api/registro/', include('registro.urls')),
+    
+    # Letture asincrone (ASGI): stesse risposte degli endpoint corrispondenti
+    path('api/async/registro/', registro_async.lista, name='registro-async-list'),
+    path('api/async/registro/summary/', registro_async.summary, name='registro-async-summary'),
+    path('api/async/partecipante/me/', partecipante_async.me, name='partecipante-async-me'),
+    path('api/async/partecipante/<int:pk>/stats/', partecipante_async.stats,
+         name='partecipante-async-stats'),
+    path('api/async/admin/profile/me/', admin_async.me, name='admin-profile-async-me'),
+    
+    # Monitoraggio (solo admin)
+    path('api/metrics/', MetricheView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,104 @@
+"""
+Lettura veloce delle liste: dizionari da values() invece di istanze del
+modello passate al serializer.
+
+I campi da leggere sono ricavati dal serializer della vista (già ridotto da
+?fields= / ?exclude=): i campi del modello diventano colonne di values(), i
+campi calcolati (SerializerMethodField, metodi) espressioni SQL fornite dalla
+vista. Ogni valore passa poi dal to_representation del proprio campo, così
+la risposta è identica a quella del serializer (formati di date e decimali,
+fuso orario, ...).
+"""
+from rest_framework import serializers
+from rest_framework.relations import RelatedField
+from rest_framework.response import Response
+from .metriche import misura_serializzazione
+
+
+class LettoreValori:
+    """
+    Colonne da leggere e rappresentazione delle righe per un serializer
+    espressioni: 'campo' (o 'annidato.campo') -> percorso, espressione SQL,
+    oppure (espressione, funzione) per correggere il valore letto in Python
+    """
+    
+    def __init__(self, serializer, espressioni=None):
+        self.espressioni = espressioni or {}
+        self.colonne = []
+        self.annotazioni = {}
+        self.campi = self._campi(getattr(serializer, 'child', serializer), '', '')
+    
+    def _campi(self, serializer, nome_padre, sorgente_padre):
+        campi = []
+        for nome, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            percorso = nome_padre + nome
+            if isinstance(campo, serializers.BaseSerializer):
+                sorgente = sorgente_padre + '__'.join(campo.source_attrs) + '__'
+                campi.append((nome, None, None, self._campi(campo, percorso + '.', sorgente)))
+                continue
+            
+            if percorso in self.espressioni:
+                espressione = self.espressioni[percorso]
+                formatta = None
+                if isinstance(espressione, tuple):
+                    espressione, formatta = espressione
+                if isinstance(espressione, str):
+                    chiave = espressione
+                    self.colonne.append(chiave)
+                else:
+                    chiave = percorso.replace('.', '_')
+                    self.annotazioni[chiave] = espressione
+            elif isinstance(campo, serializers.SerializerMethodField):
+                raise ValueError(f"Manca l'espressione per il campo calcolato '{percorso}'")
+            else:
+                chiave = sorgente_padre + '__'.join(campo.source_attrs)
+                self.colonne.append(chiave)
+                # Chiavi primarie: values() restituisce già l'id
+                formatta = None if isinstance(campo, RelatedField) else campo.to_representation
+            campi.append((nome, chiave, formatta, None))
+        return campi
+    
+    def queryset(self, queryset, *extra):
+        """values() con le colonne del serializer e quelle richieste dalla vista (extra)"""
+        return queryset.values(*dict.fromkeys([*self.colonne, *extra]), **self.annotazioni)
+    
+    def rappresenta(self, righe):
+        # Le righe sono lette prima: la lettura è tempo SQL, non di serializzazione
+        righe = list(righe)
+        with misura_serializzazione():
+            return [self._riga(riga, self.campi) for riga in righe]
+    
+    def _riga(self, riga, campi):
+        dati = {}
+        for nome, chiave, formatta, annidati in campi:
+            if annidati is not None:
+                dati[nome] = self._riga(riga, annidati)
+                continue
+            valore = riga[chiave]
+            dati[nome] = valore if formatta is None or valore is None else formatta(valore)
+        return dati
+
+
+class ListaValoriMixin:
+    """
+    list() di un ViewSet letta con values() (vedi LettoreValori)
+    espressioni_valori: espressioni dei campi calcolati del serializer
+    colonne_valori: colonne che servono comunque alla vista (es. paginazione)
+    """
+    espressioni_valori = {}
+    colonne_valori = ()
+    
+    def list(self, request, *args, **kwargs):
+        lettore = LettoreValori(self.get_serializer(many=True), self.espressioni_valori)
+        righe = lettore.queryset(self.filter_queryset(self.get_queryset()), *self.colonne_valori)
+        
+        pagina = self.paginate_queryset(righe)
+        if pagina is not None:
+            return self.risposta_pagina(pagina, lettore)
+        return Response(lettore.rappresenta(righe))
+    
+    def risposta_pagina(self, pagina, lettore):
+        """Risposta per le righe della pagina già lette (le viste possono intervenire prima della rappresentazione)"""
+        return self.get_paginated_response(lettore.rappresenta(pagina))
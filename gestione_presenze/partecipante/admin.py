@@ -14,8 +14,14 @@ class PartecipanteAdmin(admin.ModelAdmin):
     list_display = ['utente', 'attivo', 'get_percentuale_presenza']
     list_filter = ['attivo']
     search_fields = ['utente__nome', 'utente__cognome']
+    list_select_related = ['utente']
+    
+    def get_queryset(self, request):
+        # Percentuale calcolata dal database (join con il riepilogo), ordinabile
+        return super().get_queryset(request).con_presenze()
     
     def get_percentuale_presenza(self, obj):
-        return f"{obj.calcola_percentuale_presenza()}%"
+        return f"{obj.percentuale_presenza:.2f}%"
     get_percentuale_presenza.short_description = 'Presenza %'
+    get_percentuale_presenza.admin_order_field = 'percentuale_presenza'
 
@@ -0,0 +1,149 @@
+"""
+Autenticazione JWT basata sui claim del token.
+
+I token emessi dal login contengono ruolo e id dei profili, quindi ad ogni
+richiesta l'utente viene ricostruito dal token senza leggere il database.
+Per poter comunque revocare l'accesso (utente disattivato o cambio ruolo)
+lo stato dell'utente viene riletto al massimo una volta ogni
+JWT_VERIFICA_UTENTE_SECONDI per processo (None disattiva il controllo).
+"""
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .models import Utente
+
+
+class TokenConRuoloSerializer(TokenObtainPairSerializer):
+    """Aggiunge al token i dati usati dai permessi e dai filtri delle API"""
+    
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['ruolo'] = user.ruolo
+        token['username'] = user.username
+        token['partecipante_id'] = user.partecipante_id
+        token['admin_id'] = user.admin_id
+        return token
+
+
+class UtenteToken(TokenUser):
+    """
+    Utente ricostruito dai claim del token (nessuna query)
+    Espone gli stessi attributi di Utente usati da viste e permessi
+    """
+    
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+    
+    @cached_property
+    def ruolo(self):
+        return self.token['ruolo']
+    
+    @cached_property
+    def partecipante_id(self):
+        return self.token.get('partecipante_id')
+    
+    @cached_property
+    def admin_id(self):
+        return self.token.get('admin_id')
+
+
+class _VerificaUtenti:
+    """Cache in memoria dello stato (attivo, ruolo) degli utenti, con scadenza"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stati = {}
+    
+    def _valido(self, user_id):
+        with self._lock:
+            valore = self._stati.get(user_id)
+        if valore is not None and valore[0] > time.monotonic():
+            return valore
+        return None
+    
+    def _salva(self, user_id, durata, stato):
+        with self._lock:
+            self._stati[user_id] = (time.monotonic() + durata, stato)
+        return stato
+    
+    def _query(self, user_id):
+        return Utente.objects.filter(pk=user_id).values_list('is_active', 'ruolo')
+    
+    def stato(self, user_id, durata):
+        valore = self._valido(user_id)
+        if valore is not None:
+            return valore[1]
+        return self._salva(user_id, durata, self._query(user_id).first())
+    
+    async def astato(self, user_id, durata):
+        valore = self._valido(user_id)
+        if valore is not None:
+            return valore[1]
+        return self._salva(user_id, durata, await self._query(user_id).afirst())
+    
+    def svuota(self):
+        with self._lock:
+            self._stati.clear()
+
+
+verifica_utenti = _VerificaUtenti()
+
+
+class JWTClaimsAuthentication(JWTAuthentication):
+    """
+    Come JWTAuthentication, ma senza caricare l'utente dal database quando il
+    token contiene già il ruolo. I token emessi prima dell'aggiunta dei claim
+    continuano a funzionare con la lettura dal database.
+    """
+    
+    def get_user(self, validated_token):
+        if 'ruolo' not in validated_token:
+            return super().get_user(validated_token)
+        
+        user = UtenteToken(validated_token)
+        durata = getattr(settings, 'JWT_VERIFICA_UTENTE_SECONDI', 60)
+        if durata is not None:
+            self._verifica(user, verifica_utenti.stato(user.id, durata))
+        return user
+    
+    async def aauthenticate(self, request):
+        """Come authenticate(), per le viste asincrone"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+    
+    async def aget_user(self, validated_token):
+        if 'ruolo' not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token)
+        
+        user = UtenteToken(validated_token)
+        durata = getattr(settings, 'JWT_VERIFICA_UTENTE_SECONDI', 60)
+        if durata is not None:
+            self._verifica(user, await verifica_utenti.astato(user.id, durata))
+        return user
+    
+    def _verifica(self, user, stato):
+        """Rifiuta il token se l'utente non esiste più, è disattivato o ha cambiato ruolo"""
+        if stato is None:
+            raise AuthenticationFailed('Utente non trovato', code='user_not_found')
+        attivo, ruolo = stato
+        if not attivo:
+            raise AuthenticationFailed('Utente disattivato', code='user_inactive')
+        if ruolo != user.ruolo:
+            raise AuthenticationFailed(
+                'Ruolo modificato, effettua di nuovo il login', code='token_not_valid'
+            )
@@ -0,0 +1,77 @@
+"""
+Classifica presenze con le funzioni finestra del database.
+
+Posizione, percentile e quartile di ogni partecipante sono calcolati da SQL
+(RANK, PERCENT_RANK, COUNT) sui totali del riepilogo presenze, senza caricare
+in Python le statistiche di tutti i partecipanti. Una pagina della classifica
+e la posizione di un singolo partecipante arrivano dalla stessa query.
+"""
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Q, Window
+from django.db.models.functions import PercentRank, Rank, Round, RowNumber
+from .models import Partecipante
+
+# Migliore presenza prima; a parità l'ordine alfabetico rende stabili le pagine
+ORDINAMENTO = [
+    F('percentuale_presenza').desc(),
+    F('utente__cognome').asc(),
+    F('utente__nome').asc(),
+    F('pk').asc(),
+]
+
+CAMPI = [
+    'nome', 'cognome', 'percentuale_presenza',
+    'posizione', 'percentile', 'quartile', 'totale', 'riga',
+]
+
+
+def classifica():
+    """
+    Partecipanti attivi con almeno un'ora registrata, annotati con:
+    - posizione: 1 per la presenza più alta, a pari percentuale stessa posizione
+    - percentile: percentuale degli altri partecipanti con presenza più bassa
+    - quartile: 1 per il primo 25% della classifica, 4 per l'ultimo; calcolato
+      dalla posizione, quindi a pari percentuale stesso quartile
+    - totale: partecipanti in classifica
+    - riga: numero di riga, per la paginazione
+    """
+    posizione = Window(Rank(), order_by=F('percentuale_presenza').desc())
+    totale = Window(Count('pk'))
+    return (
+        Partecipante.objects.con_presenze()
+        .filter(attivo=True, riepilogo__totale_ore__gt=0)
+        .annotate(
+            nome=F('utente__nome'),
+            cognome=F('utente__cognome'),
+            posizione=posizione,
+            percentile=Round(
+                Window(PercentRank(), order_by=F('percentuale_presenza').asc()) * 100, 2
+            ),
+            # Divisione intera: (posizione - 1) * 4 / totale va da 0 a 3
+            quartile=ExpressionWrapper((posizione - 1) * 4 / totale + 1, output_field=IntegerField()),
+            totale=totale,
+            riga=Window(RowNumber(), order_by=ORDINAMENTO),
+        )
+        .order_by('riga')
+    )
+
+
+def pagina_classifica(inizio, fine, partecipante_id=None):
+    """
+    Righe della classifica da inizio (escluso) a fine (incluso) e, se indicato,
+    la riga del partecipante: (righe, riga_partecipante o None) con una query
+    I filtri sulle funzioni finestra sono applicati dopo il calcolo della
+    classifica; il filtro sul partecipante è in OR con quello sulle righe, così
+    resta anch'esso esterno e non riduce i partecipanti classificati
+    """
+    filtro = Q(riga__gt=inizio, riga__lte=fine)
+    if partecipante_id is not None:
+        filtro |= Q(pk=partecipante_id)
+    
+    righe = []
+    propria = None
+    for riga in classifica().filter(filtro).values(*CAMPI, id=F('pk')):
+        if riga['id'] == partecipante_id:
+            propria = riga
+        if inizio < riga['riga'] <= fine:
+            righe.append(riga)
+    return righe, propria
@@ -1,4 +1,7 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 
 
@@ -27,6 +30,36 @@ class Utente(AbstractUser):
     
     def __str__(self):
         return f"{self.nome} {self.cognome} ({self.ruolo})"
+    
+    @property
+    def partecipante_id(self):
+        """Id del profilo partecipante (coincide con l'id utente), se esiste"""
+        return self.pk if hasattr(self, 'partecipante_profile') else None
+    
+    @property
+    def admin_id(self):
+        """Id del profilo admin (coincide con l'id utente), se esiste"""
+        return self.pk if hasattr(self, 'admin_profile') else None
+
+
+class PartecipanteQuerySet(models.QuerySet):
+    def con_presenze(self):
+        """
+        Annota totale_ore, totale_assenze e percentuale_presenza calcolati dal DB
+        (join con il riepilogo presenze, nessuna query aggiuntiva per riga)
+        La percentuale è arrotondata al pari come RiepilogoPresenze.percentuale_presenza()
+        """
+        # Import locale: registro.models importa già questo modulo
+        from registro.models import percentuale_presenza_sql
+        
+        zero = Value(Decimal('0.00'))
+        decimale = DecimalField(max_digits=10, decimal_places=2)
+        return self.annotate(
+            totale_ore=Coalesce('riepilogo__totale_ore', zero, output_field=decimale),
+            totale_assenze=Coalesce('riepilogo__totale_assenze', zero, output_field=decimale),
+        ).annotate(
+            percentuale_presenza=percentuale_presenza_sql('totale_ore', 'totale_assenze'),
+        )
 
 
 class Partecipante(models.Model):
@@ -42,6 +75,8 @@ class Partecipante(models.Model):
     profilo = models.TextField(blank=True, null=True, help_text="Bio o informazioni aggiuntive")
     attivo = models.BooleanField(default=True)
     
+    objects = PartecipanteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Partecipante"
         verbose_name_plural = "Partecipanti"
@@ -51,18 +86,10 @@ class Partecipante(models.Model):
     
     def calcola_percentuale_presenza(self):
         """
-        Calcola la percentuale di presenza basata sui record registro
+        Calcola la percentuale di presenza dal riepilogo presenze
+        (mantenuto aggiornato ad ogni modifica del registro)
         """
-        registri = self.registro_set.all()
-        if not registri:
-            return 0.0
-        
-        totale_ore = sum(r.ore_totali for r in registri)
-        totale_assenze = sum(r.assenze for r in registri)
-        
-        if totale_ore == 0:
+        riepilogo = getattr(self, 'riepilogo', None)
+        if riepilogo is None:
             return 0.0
-        
-        ore_presenti = totale_ore - totale_assenze
-        percentuale = (ore_presenti / totale_ore) * 100
-        return round(percentuale, 2)
+        return riepilogo.percentuale_presenza()
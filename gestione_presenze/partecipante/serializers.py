@@ -47,6 +47,9 @@ class PartecipanteSerializer(serializers.ModelSerializer):
         ]
     
     def get_percentuale_presenza(self, obj):
+        # Valore annotato dal queryset (con_presenze) se disponibile
+        if hasattr(obj, 'percentuale_presenza'):
+            return obj.percentuale_presenza
         return obj.calcola_percentuale_presenza()
 
 
@@ -63,3 +66,32 @@ class PartecipanteStatsSerializer(serializers.Serializer):
     totale_assenze = serializers.DecimalField(max_digits=10, decimal_places=2)
     ore_presenti = serializers.DecimalField(max_digits=10, decimal_places=2)
     percentuale_presenza = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+class PartecipanteRischioSerializer(serializers.Serializer):
+    """Partecipante sotto la soglia di presenza, con le ore di assenza ancora possibili"""
+    id = serializers.IntegerField(source='partecipante')
+    nome = serializers.CharField()
+    cognome = serializers.CharField()
+    ore_totali = serializers.DecimalField(max_digits=10, decimal_places=2)
+    assenze = serializers.DecimalField(max_digits=10, decimal_places=2)
+    percentuale_presenza = serializers.DecimalField(max_digits=5, decimal_places=2)
+    # Negative: assenze già oltre il massimo consentito
+    ore_assenza_residue = serializers.DecimalField(max_digits=10, decimal_places=2)
+    
+    # Solo con la proiezione sulle ore previste dal corso
+    ore_da_svolgere = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    percentuale_massima = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+
+
+class PartecipanteClassificaSerializer(serializers.Serializer):
+    """Riga della classifica presenze (posizione, percentile e quartile calcolati dal DB)"""
+    id = serializers.IntegerField()
+    nome = serializers.CharField()
+    cognome = serializers.CharField()
+    # Float come in PartecipanteSerializer
+    percentuale_presenza = serializers.FloatField()
+    posizione = serializers.IntegerField()
+    percentile = serializers.FloatField()
+    quartile = serializers.IntegerField()
+    totale = serializers.IntegerField()
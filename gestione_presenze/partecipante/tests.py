@@ -1,3 +1,408 @@
-from django.test import TestCase
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from registro.models import Registro, RiepilogoPresenze
+from .authentication import TokenConRuoloSerializer, verifica_utenti
+from .views import PartecipanteViewSet
+from .models import Utente, Partecipante
+from .serializers import PartecipanteSerializer
 
-# Create your tests here.
+
+def crea_utente(username, ruolo='partecipante'):
+    return Utente.objects.create(
+        username=username,
+        nome=username.capitalize(),
+        cognome='Test',
+        email=f'{username}@example.com',
+        ruolo=ruolo
+    )
+
+
+def crea_partecipanti(quanti, giorni=3, inizio=0):
+    oggi = date.today()
+    partecipanti = []
+    for i in range(inizio, inizio + quanti):
+        partecipante = Partecipante.objects.create(utente=crea_utente(f'part{i}'))
+        for g in range(giorni):
+            Registro.objects.create(
+                partecipante=partecipante,
+                data=oggi - timedelta(days=g),
+                ore_totali=Decimal('8.00'),
+                assenze=Decimal('1.00') if g == 0 else Decimal('0.00')
+            )
+        partecipanti.append(partecipante)
+    return partecipanti
+
+
+class PartecipanteListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(crea_utente('admin1', ruolo='admin'))
+    
+    def test_numero_query_costante(self):
+        crea_partecipanti(2)
+        with self.assertNumQueries(1):
+            risposta = self.client.get('/api/partecipante/')
+        self.assertEqual(len(risposta.json()), 2)
+        
+        crea_partecipanti(10, inizio=2)
+        with self.assertNumQueries(1):
+            risposta = self.client.get('/api/partecipante/')
+        self.assertEqual(len(risposta.json()), 12)
+    
+    def test_percentuale_uguale_al_calcolo_del_modello(self):
+        partecipante = crea_partecipanti(1)[0]
+        Partecipante.objects.create(utente=crea_utente('senza_registro'))
+        
+        risposta = self.client.get('/api/partecipante/')
+        
+        valori = {p['utente']['username']: p['percentuale_presenza'] for p in risposta.json()}
+        self.assertEqual(valori['part0'], float(partecipante.calcola_percentuale_presenza()))
+        self.assertEqual(valori['senza_registro'], 0.0)
+    
+    def test_arrotondamento_al_pari_su_tutti_gli_endpoint(self):
+        # 7.97 / 8 = 99.625: a metà, arrotondato al pari 99.62
+        partecipante = crea_partecipanti(1, giorni=1)[0]
+        Registro.objects.filter(partecipante=partecipante).update(assenze=Decimal('0.03'))
+        RiepilogoPresenze.ricalcola([partecipante.pk])
+        atteso = RiepilogoPresenze.objects.get(partecipante=partecipante).percentuale_presenza()
+        self.assertEqual(atteso, Decimal('99.62'))
+        
+        lista = {p['utente']['username']: p['percentuale_presenza'] for p in self.client.get('/api/partecipante/').json()}
+        classifica = self.client.get('/api/partecipante/classifica/').json()['results']
+        stats = self.client.get(f'/api/partecipante/{partecipante.pk}/stats/').json()
+        self.client.force_authenticate(partecipante.utente)
+        me = self.client.get('/api/partecipante/me/').json()
+        
+        self.assertEqual(lista['part0'], float(atteso))
+        self.assertEqual(classifica[0]['percentuale_presenza'], float(atteso))
+        self.assertEqual(Decimal(stats['percentuale_presenza']), atteso)
+        self.assertEqual(me['percentuale_presenza'], float(atteso))
+    
+    def test_uguale_al_serializer(self):
+        crea_partecipanti(3)
+        Utente.objects.filter(username='part1').update(first_name=' Maria ', last_name='')
+        Partecipante.objects.create(utente=crea_utente('senza_registro'), profilo='Sviluppo', attivo=False)
+        
+        risposta = self.client.get('/api/partecipante/')
+        
+        attesi = PartecipanteSerializer(
+            Partecipante.objects.select_related('utente').con_presenze(), many=True
+        ).data
+        self.assertEqual(risposta.json(), json.loads(JSONRenderer().render(attesi)))
+        self.assertEqual(risposta.json()[1]['utente']['full_name'], 'Maria')
+    
+    def test_formato_colonnare(self):
+        crea_partecipanti(3)
+        attesa = self.client.get('/api/partecipante/').json()
+        
+        with self.assertNumQueries(1):
+            dati = self.client.get('/api/partecipante/', {'format': 'columnar'}).json()
+        
+        self.assertEqual(dati['columns'], list(attesa[0]))
+        self.assertEqual([dict(zip(dati['columns'], riga)) for riga in dati['rows']], attesa)
+
+
+class PartecipanteCampiParzialiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(crea_utente('admin1', ruolo='admin'))
+        crea_partecipanti(2)
+        self.completi = self.client.get('/api/partecipante/').json()
+    
+    def lista(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            risposta = self.client.get('/api/partecipante/', params)
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        return risposta.json(), ctx.captured_queries[0]['sql']
+    
+    def test_colonne_per_tutti_i_campi(self):
+        self.assertEqual(list(PartecipanteViewSet.colonne_campi), list(PartecipanteSerializer().fields))
+    
+    def test_senza_join(self):
+        dati, sql = self.lista(fields='attivo,profilo')
+        
+        self.assertEqual(dati, [{'profilo': p['profilo'], 'attivo': p['attivo']} for p in self.completi])
+        self.assertNotIn('JOIN', sql)
+    
+    def test_utente_senza_presenze(self):
+        dati, sql = self.lista(exclude='percentuale_presenza,profilo,attivo')
+        
+        self.assertEqual(dati, [{'utente': p['utente']} for p in self.completi])
+        self.assertNotIn('riepilogo', sql)
+        self.assertNotIn('"password"', sql)
+    
+    def test_solo_presenze(self):
+        dati, sql = self.lista(fields='percentuale_presenza')
+        
+        self.assertEqual(dati, [{'percentuale_presenza': p['percentuale_presenza']} for p in self.completi])
+        self.assertNotIn('partecipante_utente', sql)
+
+
+class PartecipanteAdminTest(TestCase):
+    def test_percentuale_ordinabile_senza_query_per_riga(self):
+        admin = crea_utente('admin1', ruolo='admin')
+        admin.is_staff = admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+        for i, partecipante in enumerate(crea_partecipanti(4)):
+            for registro in Registro.objects.filter(partecipante=partecipante):
+                registro.assenze = Decimal((3 * i) % 5)
+                registro.save()
+        Partecipante.objects.create(utente=crea_utente('senza_registro'))
+        
+        with self.assertNumQueries(5):
+            risposta = self.client.get('/admin/partecipante/partecipante/', {'o': '3'})
+        
+        righe = risposta.context['cl'].result_list
+        percentuali = [partecipante.calcola_percentuale_presenza() for partecipante in righe]
+        self.assertEqual(percentuali, sorted(percentuali))
+        self.assertContains(risposta, f'{percentuali[-1]:.2f}%')
+
+
+class PartecipanteStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.partecipante = crea_partecipanti(1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.partecipante.utente)
+        self.url = f'/api/partecipante/{self.partecipante.pk}/stats/'
+    
+    def test_statistiche(self):
+        dati = self.client.get(self.url).json()
+        self.assertEqual(dati['totale_giorni'], 3)
+        self.assertEqual(dati['totale_assenze'], '1.00')
+        self.assertEqual(dati['percentuale_presenza'], '95.83')
+    
+    def test_cache_invalidata_dalle_scritture(self):
+        self.client.get(self.url)
+        registro = self.partecipante.registro_set.order_by('data').first()
+        registro.assenze = Decimal('8.00')
+        registro.save()
+        
+        dati = self.client.get(self.url).json()
+        self.assertEqual(dati['totale_assenze'], '9.00')
+
+
+class PartecipanteARischioTest(TestCase):
+    def setUp(self):
+        # 24 ore ciascuno: 8 assenze (66.67%), 4 assenze (83.33%), 1 assenza (95.83%)
+        self.partecipanti = crea_partecipanti(4)
+        for partecipante, assenze in zip(self.partecipanti, ('8.00', '4.00', '1.00', '8.00')):
+            registro = partecipante.registro_set.order_by('-data').first()
+            registro.assenze = Decimal(assenze)
+            registro.save()
+        Partecipante.objects.filter(pk=self.partecipanti[3].pk).update(attivo=False)
+        
+        self.client = APIClient()
+        self.client.force_authenticate(crea_utente('admin1', ruolo='admin'))
+        self.url = '/api/partecipante/a_rischio/'
+    
+    def test_soglia_di_default(self):
+        with self.assertNumQueries(1):
+            dati = self.client.get(self.url).json()
+        
+        self.assertEqual(dati['totale'], 1)
+        riga = dati['partecipanti'][0]
+        self.assertEqual(riga['id'], self.partecipanti[0].pk)
+        self.assertEqual(riga['ore_totali'], '24.00')
+        self.assertEqual(riga['assenze'], '8.00')
+        self.assertEqual(riga['percentuale_presenza'], '66.67')
+        # 20% di 24 ore = 4.80, già superate di 3.20
+        self.assertEqual(riga['ore_assenza_residue'], '-3.20')
+        self.assertNotIn('percentuale_massima', riga)
+    
+    def test_soglia_e_ordinamento(self):
+        dati = self.client.get(self.url, {'soglia': '90'}).json()
+        
+        self.assertEqual(
+            [riga['id'] for riga in dati['partecipanti']],
+            [self.partecipanti[0].pk, self.partecipanti[1].pk]
+        )
+        self.assertEqual(dati['partecipanti'][1]['ore_assenza_residue'], '-1.60')
+    
+    def test_soglia_esatta(self):
+        # 2.64 / 3.30 = 80% esatto, ma in virgola mobile 79.99999999999999
+        partecipante = crea_partecipanti(1, giorni=1, inizio=10)[0]
+        Registro.objects.filter(partecipante=partecipante).update(
+            ore_totali=Decimal('3.30'), assenze=Decimal('0.66')
+        )
+        
+        ids = [riga['id'] for riga in self.client.get(self.url).json()['partecipanti']]
+        self.assertNotIn(partecipante.pk, ids)
+        ids = [riga['id'] for riga in self.client.get(self.url, {'soglia': '80.01'}).json()['partecipanti']]
+        self.assertIn(partecipante.pk, ids)
+    
+    def test_proiezione_sulle_ore_del_corso(self):
+        dati = self.client.get(self.url, {'ore_corso': '100'}).json()
+        
+        riga = dati['partecipanti'][0]
+        self.assertEqual(riga['ore_assenza_residue'], '12.00')
+        self.assertEqual(riga['ore_da_svolgere'], '76.00')
+        self.assertEqual(riga['percentuale_massima'], '92.00')
+    
+    def test_ore_corso_inferiori_alle_assenze(self):
+        # 8 ore di assenza su un corso di 1 ora: proiezione limitata a 0
+        riga = self.client.get(self.url, {'ore_corso': '1'}).json()['partecipanti'][0]
+        self.assertEqual(riga['percentuale_massima'], '0.00')
+        self.assertEqual(riga['ore_da_svolgere'], '0.00')
+    
+    def test_parametri_non_validi(self):
+        for parametri in (
+            {'soglia': 'abc'}, {'soglia': '0'}, {'soglia': '101'}, {'ore_corso': '-5'},
+            {'ore_corso': 'Infinity'}, {'ore_corso': 'NaN'}, {'ore_corso': '1e30'},
+        ):
+            risposta = self.client.get(self.url, parametri)
+            self.assertEqual(risposta.status_code, 400, parametri)
+    
+    def test_vietato_al_partecipante(self):
+        self.client.force_authenticate(self.partecipanti[0].utente)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class PartecipanteClassificaTest(TestCase):
+    def setUp(self):
+        # 24 ore ciascuno: 66.67%, 95.83%, 95.83% (pari merito), 100%, non attivo
+        self.partecipanti = crea_partecipanti(5)
+        for partecipante, assenze in zip(self.partecipanti, ('8.00', '1.00', '1.00', '0.00', '1.00')):
+            registro = partecipante.registro_set.order_by('-data').first()
+            registro.assenze = Decimal(assenze)
+            registro.save()
+        Partecipante.objects.filter(pk=self.partecipanti[4].pk).update(attivo=False)
+        # Senza ore registrate: fuori classifica
+        crea_partecipanti(1, giorni=0, inizio=5)
+        
+        self.client = APIClient()
+        self.client.force_authenticate(crea_utente('admin1', ruolo='admin'))
+        self.url = '/api/partecipante/classifica/'
+    
+    def test_classifica(self):
+        with self.assertNumQueries(1):
+            dati = self.client.get(self.url).json()
+        
+        p0, p1, p2, p3 = (partecipante.pk for partecipante in self.partecipanti[:4])
+        self.assertEqual([riga['id'] for riga in dati['results']], [p3, p1, p2, p0])
+        self.assertEqual([riga['posizione'] for riga in dati['results']], [1, 2, 2, 4])
+        self.assertEqual([riga['percentile'] for riga in dati['results']], [100.0, 33.33, 33.33, 0.0])
+        # Quartile dalla posizione: i pari merito non vengono separati
+        self.assertEqual([riga['quartile'] for riga in dati['results']], [1, 2, 2, 4])
+        self.assertEqual(dati['results'][3]['percentuale_presenza'], 66.67)
+        self.assertEqual({riga['totale'] for riga in dati['results']}, {4})
+        self.assertIsNone(dati['next'])
+        self.assertIsNone(dati['posizione'])
+    
+    def test_paginazione_e_posizione_nella_stessa_query(self):
+        p0 = self.partecipanti[0].pk
+        with self.assertNumQueries(1):
+            dati = self.client.get(self.url, {'page_size': 2, 'partecipante': p0}).json()
+        
+        self.assertEqual(len(dati['results']), 2)
+        self.assertIn('page=2', dati['next'])
+        self.assertIsNone(dati['previous'])
+        # La posizione non dipende dalla pagina richiesta
+        self.assertEqual(dati['posizione']['id'], p0)
+        self.assertEqual(dati['posizione']['posizione'], 4)
+        
+        dati = self.client.get(dati['next']).json()
+        self.assertEqual([riga['id'] for riga in dati['results']], [self.partecipanti[2].pk, p0])
+        self.assertIsNone(dati['next'])
+        self.assertIn('page=1', dati['previous'])
+    
+    def test_partecipante_vede_solo_la_propria_posizione(self):
+        self.client.force_authenticate(self.partecipanti[1].utente)
+        with self.assertNumQueries(1):
+            dati = self.client.get(self.url).json()
+        
+        self.assertEqual(list(dati), ['posizione'])
+        self.assertEqual(dati['posizione']['id'], self.partecipanti[1].pk)
+        self.assertEqual(dati['posizione']['posizione'], 2)
+        self.assertEqual(dati['posizione']['totale'], 4)
+    
+    def test_parametri_non_validi(self):
+        self.assertEqual(self.client.get(self.url, {'page': '0'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'page': 'abc'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'partecipante': 'abc'}).status_code, 400)
+
+
+class TokenConRuoloTest(TestCase):
+    def setUp(self):
+        verifica_utenti.svuota()
+        self.client = APIClient()
+        self.utente = crea_utente('part_token')
+        self.utente.set_password('segreta123')
+        self.utente.save()
+        Partecipante.objects.create(utente=self.utente)
+    
+    def login(self):
+        risposta = self.client.post(
+            '/api/auth/login/', {'username': 'part_token', 'password': 'segreta123'}, format='json'
+        )
+        self.assertEqual(risposta.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {risposta.json()['access']}")
+        return risposta.json()['access']
+    
+    def test_claim_nel_token(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        token = AccessToken(self.login())
+        self.assertEqual(token['ruolo'], 'partecipante')
+        self.assertEqual(token['partecipante_id'], self.utente.pk)
+        self.assertIsNone(token['admin_id'])
+    
+    @override_settings(JWT_VERIFICA_UTENTE_SECONDI=None)
+    def test_nessuna_query_di_autenticazione(self):
+        self.login()
+        # Solo la query del profilo: l'utente arriva dal token
+        with self.assertNumQueries(1):
+            risposta = self.client.get('/api/partecipante/me/')
+        self.assertEqual(risposta.status_code, 200)
+    
+    def test_verifica_utente_in_cache(self):
+        self.login()
+        with self.assertNumQueries(2):
+            self.client.get('/api/partecipante/me/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/partecipante/me/')
+    
+    def test_utente_disattivato_revocato(self):
+        self.login()
+        Utente.objects.filter(pk=self.utente.pk).update(is_active=False)
+        verifica_utenti.svuota()
+        
+        risposta = self.client.get('/api/registro/')
+        
+        self.assertEqual(risposta.status_code, 401)
+
+
+class PartecipanteAsyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        verifica_utenti.svuota()
+        self.partecipante = crea_partecipanti(1)[0]
+        self.client = APIClient()
+        token = TokenConRuoloSerializer.get_token(self.partecipante.utente).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_me_uguale_al_sincrono(self):
+        asincrona = self.client.get('/api/async/partecipante/me/')
+        
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.content, self.client.get('/api/partecipante/me/').content)
+    
+    def test_stats_uguale_al_sincrono(self):
+        url = f'/api/partecipante/{self.partecipante.pk}/stats/'
+        asincrona = self.client.get(f'/api/async/partecipante/{self.partecipante.pk}/stats/')
+        
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.content, self.client.get(url).content)
+    
+    def test_stats_di_altri_non_visibili(self):
+        altro = crea_partecipanti(1, inizio=1)[0]
+        risposta = self.client.get(f'/api/async/partecipante/{altro.pk}/stats/')
+        self.assertEqual(risposta.status_code, 404)
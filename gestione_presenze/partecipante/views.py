@@ -1,33 +1,70 @@
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Concat, Greatest, Round
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from registro import cache, condizionali
+from gestione_presenze.campi import CampiParzialiMixin
+from gestione_presenze.renderers import DecimaliNumericiMixin
+from gestione_presenze.valori import ListaValoriMixin
+from registro.models import Registro, RiepilogoPresenze
+from registro.pagination import RegistroCursorPagination
+from registro.permissions import IsAdmin
+from .classifica import pagina_classifica
 from .models import Partecipante
-from .serializers import PartecipanteSerializer, PartecipanteStatsSerializer
+from .serializers import (
+    PartecipanteClassificaSerializer,
+    PartecipanteRischioSerializer,
+    PartecipanteSerializer,
+    PartecipanteStatsSerializer,
+)
 
+# Massimo dei totali di ore del riepilogo (max_digits=10, 2 decimali)
+ORE_CORSO_MASSIME = Decimal('99999999.99')
 
-class PartecipanteViewSet(viewsets.ModelViewSet):
+
+class PartecipanteViewSet(CampiParzialiMixin, DecimaliNumericiMixin, ListaValoriMixin, viewsets.ModelViewSet):
     """
     ViewSet per gestire i profili Partecipante
     """
     queryset = Partecipante.objects.all()
     serializer_class = PartecipanteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Colonne lette per ogni campo di PartecipanteSerializer (?fields= / ?exclude=)
+    colonne_campi = {
+        'utente': [
+            f'utente__{campo}'
+            for campo in (
+                'username', 'email', 'nome', 'cognome', 'ruolo', 'is_active', 'created_at',
+                # full_name (get_full_name di AbstractUser)
+                'first_name', 'last_name',
+            )
+        ],
+        'profilo': ['profilo'],
+        'attivo': ['attivo'],
+        # Annotata da con_presenze()
+        'percentuale_presenza': [],
+    }
+    # Lista letta con values()
+    espressioni_valori = {
+        'percentuale_presenza': 'percentuale_presenza',
+        # get_full_name di AbstractUser: strip() come in Python
+        'utente.full_name': (Concat('utente__first_name', Value(' '), 'utente__last_name'), str.strip),
+    }
     
     def get_queryset(self):
         """
         Filtra i risultati in base all'utente
+        Con ?fields= / ?exclude= legge solo le colonne (e le join) dei campi richiesti
         """
-        user = self.request.user
-        
-        # Admin può vedere tutti i partecipanti
-        if user.ruolo == 'admin':
-            return Partecipante.objects.all()
-        
-        # Partecipante può vedere solo se stesso
-        if user.ruolo == 'partecipante':
-            return Partecipante.objects.filter(utente=user)
-        
-        return Partecipante.objects.none()
+        campi = self.campi_richiesti()
+        return self.riduci_queryset(partecipanti_visibili(
+            self.request.user, presenze=campi is None or 'percentuale_presenza' in campi
+        ))
     
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -35,7 +72,9 @@ class PartecipanteViewSet(viewsets.ModelViewSet):
         Endpoint per ottenere il proprio profilo partecipante
         """
         try:
-            partecipante = Partecipante.objects.get(utente=request.user)
+            partecipante = Partecipante.objects.select_related('utente').con_presenze().get(
+                pk=request.user.pk
+            )
             serializer = self.get_serializer(partecipante)
             return Response(serializer.data)
         except Partecipante.DoesNotExist:
@@ -44,37 +83,238 @@ class PartecipanteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def a_rischio(self, request):
+        """
+        Endpoint per i partecipanti attivi sotto la soglia di presenza, dal più basso
+        Query params opzionali:
+        - soglia: percentuale minima richiesta (default REGISTRO_PRESENZA_MINIMA)
+        - ore_corso: ore totali previste dal corso, per calcolare le assenze ancora
+          possibili sull'intero corso invece che sulle ore già svolte
+        Solo per admin
+        """
+        try:
+            soglia = Decimal(request.query_params.get('soglia', settings.REGISTRO_PRESENZA_MINIMA))
+            if not 0 < soglia <= 100:
+                raise ValueError
+        except (InvalidOperation, ValueError):
+            return Response(
+                {'error': 'soglia deve essere una percentuale tra 0 e 100'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        ore_corso = request.query_params.get('ore_corso')
+        if ore_corso is not None:
+            try:
+                ore_corso = Decimal(ore_corso)
+                # Infinity passerebbe il confronto ma non entra nei campi decimali
+                if not ore_corso.is_finite() or not 0 < ore_corso <= ORE_CORSO_MASSIME:
+                    raise ValueError
+            except (InvalidOperation, ValueError):
+                return Response(
+                    {'error': f'ore_corso deve essere un numero positivo fino a {ORE_CORSO_MASSIME}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        righe = list(partecipanti_a_rischio(soglia, ore_corso))
+        return Response({
+            'soglia': soglia,
+            'ore_corso': ore_corso,
+            'totale': len(righe),
+            'partecipanti': PartecipanteRischioSerializer(righe, many=True).data,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def classifica(self, request):
+        """
+        Endpoint per la classifica dei partecipanti attivi per percentuale di presenza
+        Admin: pagine della classifica (?page=, ?page_size=) e, con ?partecipante=<id>,
+        la posizione di quel partecipante
+        Partecipante: solo la propria posizione
+        Pagina e posizione sono calcolate con una sola query
+        """
+        if request.user.ruolo != 'admin':
+            _, propria = pagina_classifica(0, 0, request.user.pk)
+            return Response({'posizione': self._riga_classifica(propria)})
+        
+        partecipante_id = request.query_params.get('partecipante')
+        if partecipante_id is not None:
+            try:
+                partecipante_id = int(partecipante_id)
+            except ValueError:
+                return Response(
+                    {'error': 'partecipante deve essere un id numerico'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            pagina = int(request.query_params.get('page', 1))
+            if pagina < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound('Pagina non valida')
+        # Stessi limiti di ?page_size= della lista del registro
+        page_size = RegistroCursorPagination().get_page_size(request)
+        
+        # Una riga in più per sapere se esiste la pagina successiva
+        inizio = (pagina - 1) * page_size
+        righe, propria = pagina_classifica(inizio, inizio + page_size + 1, partecipante_id)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', pagina + 1) if len(righe) > page_size else None,
+            'previous': replace_query_param(url, 'page', pagina - 1) if pagina > 1 else None,
+            'results': PartecipanteClassificaSerializer(righe[:page_size], many=True).data,
+            'posizione': self._riga_classifica(propria),
+        })
+    
+    @staticmethod
+    def _riga_classifica(riga):
+        return None if riga is None else PartecipanteClassificaSerializer(riga).data
+    
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
         """
         Endpoint per ottenere statistiche di un partecipante
         Include anche i dati personali del partecipante
+        Risponde 304 se registri e dati personali non sono cambiati
         """
         partecipante = self.get_object()
+        etag = validatore_stats(partecipante, request)
+        non_modificato = condizionali.non_modificato(request, etag)
+        if non_modificato is not None:
+            return non_modificato
         
-        # Calcola statistiche
-        registri = partecipante.registro_set.all()
-        totale_giorni = registri.count()
-        totale_ore = sum(r.ore_totali for r in registri)
-        totale_assenze = sum(r.assenze for r in registri)
-        ore_presenti = totale_ore - totale_assenze
+        def calcola():
+            # Statistiche lette dal riepilogo presenze
+            return dati_stats(partecipante, RiepilogoPresenze.per_partecipante(partecipante))
         
-        percentuale_presenza = 0.0
-        if totale_ore > 0:
-            percentuale_presenza = (ore_presenti / totale_ore) * 100
-        
-        stats_data = {
-            # Dati personali
-            'nome': partecipante.utente.nome,
-            'cognome': partecipante.utente.cognome,
-            'email': partecipante.utente.email,
-            # Statistiche
-            'totale_giorni': totale_giorni,
-            'totale_ore': totale_ore,
-            'totale_assenze': totale_assenze,
-            'ore_presenti': ore_presenti,
-            'percentuale_presenza': round(percentuale_presenza, 2)
-        }
-        
-        serializer = PartecipanteStatsSerializer(stats_data)
-        return Response(serializer.data)
+        # I dati personali fanno parte della risposta: la chiave include updated_at dell'utente
+        dati = cache.risposta_in_cache(
+            'stats',
+            partecipante.pk,
+            {'utente': partecipante.utente.updated_at.isoformat()},
+            calcola
+        )
+        return condizionali.imposta_intestazioni(Response(dati), etag)
+
+
+def _parti_stats(partecipante, request):
+    return Registro.objects.filter(partecipante_id=partecipante.pk), (
+        request.get_full_path(), partecipante.utente.updated_at.isoformat()
+    )
+
+
+def validatore_stats(partecipante, request):
+    """Validatore di stats: registri del partecipante e dati personali"""
+    registri, parti = _parti_stats(partecipante, request)
+    return condizionali.validatore(registri, *parti)
+
+
+async def avalidatore_stats(partecipante, request):
+    registri, parti = _parti_stats(partecipante, request)
+    return await condizionali.avalidatore(registri, *parti)
+
+
+def partecipanti_visibili(user, presenze=True):
+    """
+    Partecipanti visibili all'utente, con utente e presenze nella stessa query
+    presenze=False: senza le annotazioni di con_presenze (e la join col riepilogo)
+    """
+    queryset = Partecipante.objects.select_related('utente')
+    if presenze:
+        queryset = queryset.con_presenze()
+    
+    # Admin può vedere tutti i partecipanti
+    if user.ruolo == 'admin':
+        return queryset
+    
+    # Partecipante può vedere solo se stesso
+    if user.ruolo == 'partecipante':
+        return queryset.filter(pk=user.pk)
+    
+    return Partecipante.objects.none()
+
+
+def partecipanti_a_rischio(soglia, ore_corso=None):
+    """
+    Partecipanti attivi con percentuale di presenza sotto la soglia, dal più basso,
+    in un'unica query aggregata sul registro (GROUP BY partecipante)
+    ore_assenza_residue: assenze ancora possibili restando alla soglia, calcolate
+    sulle ore già svolte o, se indicate, sulle ore previste dal corso
+    """
+    decimale = DecimalField(max_digits=10, decimal_places=2)
+    quota_assenze = (100 - soglia) / 100
+    percentuale = Case(
+        When(ore_totali__gt=0, then=(
+            Cast(F('ore_totali') - F('assenze'), FloatField()) * 100 / Cast('ore_totali', FloatField())
+        )),
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    if ore_corso is None:
+        assenze_consentite = F('ore_totali') * Value(quota_assenze, output_field=decimale)
+    else:
+        # Costante calcolata qui: un'espressione senza aggregati finirebbe nel GROUP BY
+        assenze_consentite = Value(ore_corso * quota_assenze, output_field=decimale)
+    
+    righe = (
+        Registro.objects.filter(partecipante__attivo=True)
+        .values('partecipante')
+        .annotate(
+            nome=F('partecipante__utente__nome'),
+            cognome=F('partecipante__utente__cognome'),
+            ore_totali=Sum('ore_totali'),
+            assenze=Sum('assenze'),
+        )
+        .annotate(
+            percentuale_presenza=percentuale,
+            ore_assenza_residue=ExpressionWrapper(
+                assenze_consentite - F('assenze'), output_field=decimale
+            ),
+        )
+        # Confronto esatto (presenti * 100 < soglia * totali) invece della percentuale
+        # in virgola mobile: dove le somme sono float (SQLite) l'errore sparisce
+        # arrotondando la differenza, che con ore e soglia a due decimali ne ha quattro
+        .alias(scarto_soglia=Round(
+            (F('ore_totali') - F('assenze')) * Value(100) - F('ore_totali') * Value(soglia, output_field=decimale),
+            6
+        ))
+        .filter(ore_totali__gt=0, scarto_soglia__lt=0)
+        .order_by('percentuale_presenza', 'cognome', 'nome', 'partecipante')
+    )
+    if ore_corso is not None:
+        # Proiezione: presenza massima raggiungibile frequentando tutte le ore restanti
+        righe = righe.annotate(
+            ore_da_svolgere=Greatest(
+                ExpressionWrapper(Value(ore_corso) - F('ore_totali'), output_field=decimale),
+                Value(Decimal('0.00')),
+                output_field=decimale
+            ),
+            # 0 se le assenze superano già le ore del corso
+            percentuale_massima=Greatest(
+                ExpressionWrapper(
+                    Cast(Value(ore_corso) - F('assenze'), FloatField()) * 100 / float(ore_corso),
+                    output_field=FloatField()
+                ),
+                Value(0.0),
+                output_field=FloatField()
+            ),
+        )
+    return righe
+
+
+def dati_stats(partecipante, riepilogo):
+    """Risposta di stats: dati personali del partecipante e totali del riepilogo"""
+    stats_data = {
+        # Dati personali
+        'nome': partecipante.utente.nome,
+        'cognome': partecipante.utente.cognome,
+        'email': partecipante.utente.email,
+        # Statistiche
+        'totale_giorni': riepilogo.totale_giorni,
+        'totale_ore': riepilogo.totale_ore,
+        'totale_assenze': riepilogo.totale_assenze,
+        'ore_presenti': riepilogo.ore_presenti(),
+        'percentuale_presenza': riepilogo.percentuale_presenza()
+    }
+    return PartecipanteStatsSerializer(stats_data).data
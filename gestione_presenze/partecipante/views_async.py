@@ -0,0 +1,52 @@
+"""
+Versioni asincrone (ASGI) delle letture del partecipante: me e stats.
+Stesse risposte delle azioni di PartecipanteViewSet.
+"""
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from gestione_presenze.asincrono import errore, vista_async
+from registro import cache, condizionali
+from registro.models import RiepilogoPresenze
+from .models import Partecipante
+from .serializers import PartecipanteSerializer
+from .views import avalidatore_stats, dati_stats, partecipanti_visibili
+
+
+@vista_async()
+async def me(request):
+    """Profilo partecipante dell'utente autenticato"""
+    try:
+        partecipante = await Partecipante.objects.select_related('utente').con_presenze().aget(
+            pk=request.user.pk
+        )
+    except Partecipante.DoesNotExist:
+        return errore('Profilo partecipante non trovato', status.HTTP_404_NOT_FOUND)
+    return Response(PartecipanteSerializer(partecipante).data)
+
+
+@vista_async()
+async def stats(request, pk):
+    """Statistiche di un partecipante (dati personali e totali del riepilogo)"""
+    try:
+        # Il riepilogo arriva con la stessa query: nessun accesso lazy al database
+        partecipante = await partecipanti_visibili(request.user).select_related('riepilogo').aget(pk=pk)
+    except Partecipante.DoesNotExist:
+        # Stesso messaggio di get_object() nella vista sincrona
+        raise NotFound('No Partecipante matches the given query.')
+    
+    etag = await avalidatore_stats(partecipante, request)
+    non_modificato = condizionali.non_modificato(request, etag)
+    if non_modificato is not None:
+        return non_modificato
+    
+    async def calcola():
+        return dati_stats(partecipante, RiepilogoPresenze.per_partecipante(partecipante))
+    
+    dati = await cache.arisposta_in_cache(
+        'stats',
+        partecipante.pk,
+        {'utente': partecipante.utente.updated_at.isoformat()},
+        calcola
+    )
+    return condizionali.imposta_intestazioni(Response(dati), etag)
@@ -2,6 +2,9 @@
 """
 Script per popolare il database con dati di test
 Eseguire con: python populate_db.py
+
+Per dataset più grandi o senza domande interattive usare il comando:
+    python manage.py popola_db --partecipanti 500 --giorni 200 [--seed 1] [--clear]
 """
 
 import os
@@ -1,14 +1,63 @@
 from django.contrib import admin
-from .models import Registro
+from gestione_presenze.conteggio import PaginatorStimato
+from .models import ORE_PRESENTI, PERCENTUALE_PRESENZA, Registro, RiepilogoPresenze
+
+
+class CreatoDaFilter(admin.RelatedFieldListFilter):
+    """Filtro per created_by: nomi degli admin (utente) letti in una sola query"""
+    
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        admins = field.related_model._default_manager.select_related('utente').order_by(*ordering)
+        return [(profilo.pk, str(profilo)) for profilo in admins]
 
 
 @admin.register(Registro)
 class RegistroAdmin(admin.ModelAdmin):
-    list_display = ['partecipante', 'data', 'ore_totali', 'assenze', 'ore_presenti', 'created_by']
-    list_filter = ['data', 'created_by']
+    list_display = [
+        'partecipante', 'data', 'ore_totali', 'assenze', 'ore_presenti', 'percentuale_presenza', 'created_by'
+    ]
+    list_filter = ['data', ('created_by', CreatoDaFilter)]
     search_fields = ['partecipante__utente__nome', 'partecipante__utente__cognome']
     date_hierarchy = 'data'
+    # Nomi di partecipante e admin (__str__) nella query della pagina
+    list_select_related = ['partecipante__utente', 'created_by__utente']
+    # Tabella grande: totale stimato senza filtri, nessun secondo COUNT(*) con i filtri
+    paginator = PaginatorStimato
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Colonne calcolate dal database, ordinabili
+        return super().get_queryset(request).annotate(
+            ore_presenti_calcolate=ORE_PRESENTI,
+            percentuale_calcolata=PERCENTUALE_PRESENZA,
+        )
     
     def ore_presenti(self, obj):
-        return obj.ore_presenti()
+        return f"{obj.ore_presenti_calcolate:.2f}"
     ore_presenti.short_description = 'Ore Presenti'
+    ore_presenti.admin_order_field = 'ore_presenti_calcolate'
+    
+    def percentuale_presenza(self, obj):
+        return f"{obj.percentuale_calcolata:.2f}%"
+    percentuale_presenza.short_description = 'Presenza %'
+    percentuale_presenza.admin_order_field = 'percentuale_calcolata'
+    
+    def save_model(self, request, obj, form, change):
+        # Il form ha già eseguito full_clean, unicità e vincoli compresi
+        obj.save(valida=False)
+
+
+@admin.register(RiepilogoPresenze)
+class RiepilogoPresenzeAdmin(admin.ModelAdmin):
+    """Sola lettura: i totali sono mantenuti automaticamente dal registro"""
+    list_display = ['partecipante', 'totale_giorni', 'totale_ore', 'totale_assenze', 'percentuale_presenza']
+    list_select_related = ['partecipante__utente']
+    readonly_fields = ['partecipante', 'totale_giorni', 'totale_ore', 'totale_assenze']
+    
+    def percentuale_presenza(self, obj):
+        return f"{obj.percentuale_presenza()}%"
+    percentuale_presenza.short_description = 'Presenza %'
+    
+    def has_add_permission(self, request):
+        return False
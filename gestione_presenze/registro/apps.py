@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RegistroConfig(AppConfig):
     name = 'registro'
+    
+    def ready(self):
+        # Registra i segnali che mantengono aggiornato il riepilogo presenze
+        from . import signals  # noqa: F401
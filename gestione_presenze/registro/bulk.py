@@ -0,0 +1,307 @@
+"""
+Inserimento e modifica in blocco di record di registro.
+
+La validazione avviene in memoria sull'intero lotto (due query in tutto:
+partecipanti esistenti e coppie partecipante/data già registrate), poi i
+record validi vengono scritti con bulk_create in un'unica transazione.
+
+Le modifiche in blocco caricano tutti i record interessati con una query,
+validano in memoria e scrivono con bulk_update nella stessa transazione.
+
+L'upsert di un singolo record usa il vincolo unique (partecipante, data):
+inserimento o aggiornamento avvengono con un'unica istruzione atomica.
+
+L'eliminazione in blocco scrive le tracce per la sincronizzazione con un
+bulk_create e cancella con DELETE a blocchi, senza i segnali per record.
+"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.utils import timezone
+from partecipante.models import Partecipante
+from . import cache
+from .models import Registro, RegistroEliminato, RiepilogoPresenze, SequenzaModifiche, regole_registro
+
+BATCH_SIZE = 1000
+ORE_MASSIME = Decimal('99.99')
+DUE_DECIMALI = Decimal('0.01')
+# Chiavi primarie BigAutoField: interi positivi a 64 bit
+ID_MASSIMO = 2 ** 63 - 1
+
+
+def _decimale(valore, campo, errori, obbligatorio=True):
+    if valore in (None, ''):
+        if obbligatorio:
+            errori[campo] = 'Questo campo è obbligatorio.'
+            return None
+        return Decimal('0.00')
+    try:
+        numero = Decimal(str(valore))
+    except InvalidOperation:
+        errori[campo] = 'Numero non valido.'
+        return None
+    # Più cifre intere del campo (max_digits=4, 2 decimali): fuori intervallo
+    # prima di quantize(), che oltre la precisione del contesto solleverebbe InvalidOperation
+    if numero.is_finite() and numero.adjusted() > ORE_MASSIME.adjusted():
+        if numero < 0:
+            errori[campo] = 'Il valore deve essere maggiore o uguale a 0.00.'
+        else:
+            errori[campo] = f'Il valore deve essere minore o uguale a {ORE_MASSIME}.'
+        return None
+    if not numero.is_finite() or numero != numero.quantize(DUE_DECIMALI):
+        errori[campo] = 'Sono ammessi al massimo 2 decimali.'
+        return None
+    if numero < 0:
+        errori[campo] = 'Il valore deve essere maggiore o uguale a 0.00.'
+        return None
+    if numero > ORE_MASSIME:
+        errori[campo] = f'Il valore deve essere minore o uguale a {ORE_MASSIME}.'
+        return None
+    return numero.quantize(DUE_DECIMALI)
+
+
+def _leggi_riga(riga, oggi, assenze_obbligatorie=False):
+    """
+    Converte partecipante, data, ore_totali e assenze di una riga e applica
+    le regole di dominio del Registro
+    Ritorna (partecipante_id, data, ore_totali, assenze, errori_riga)
+    """
+    errori_riga = {}
+    try:
+        partecipante_id = int(riga.get('partecipante'))
+        if not 0 < partecipante_id <= ID_MASSIMO:
+            raise ValueError
+    except (TypeError, ValueError):
+        partecipante_id = None
+        errori_riga['partecipante'] = 'Id partecipante non valido.'
+    
+    try:
+        giorno = date.fromisoformat(str(riga.get('data')))
+    except ValueError:
+        giorno = None
+        errori_riga['data'] = 'Data non valida, usa il formato YYYY-MM-DD.'
+    
+    ore_totali = _decimale(riga.get('ore_totali'), 'ore_totali', errori_riga)
+    assenze = _decimale(
+        riga.get('assenze'), 'assenze', errori_riga, obbligatorio=assenze_obbligatorie
+    )
+    for campo, messaggio in regole_registro(giorno, ore_totali, assenze, oggi).items():
+        errori_riga.setdefault(campo, messaggio)
+    return partecipante_id, giorno, ore_totali, assenze, errori_riga
+
+
+def valida_registri(righe, created_by_id=None):
+    """
+    Valida un lotto di righe (dict con partecipante, data, ore_totali,
+    assenze, note) e ritorna (registri, errori).
+    errori è una lista di {'riga': indice, 'errori': {campo: messaggio}}.
+    """
+    oggi = timezone.now().date()
+    candidati = []
+    errori = []
+    
+    for indice, riga in enumerate(righe):
+        if not isinstance(riga, dict):
+            errori.append({'riga': indice, 'errori': {'non_field_errors': 'Riga non valida.'}})
+            continue
+        
+        partecipante_id, giorno, ore_totali, assenze, errori_riga = _leggi_riga(riga, oggi)
+        
+        if errori_riga:
+            errori.append({'riga': indice, 'errori': errori_riga})
+        else:
+            candidati.append((indice, Registro(
+                partecipante_id=partecipante_id,
+                data=giorno,
+                ore_totali=ore_totali,
+                assenze=assenze,
+                note=riga.get('note') or None,
+                created_by_id=created_by_id,
+            )))
+    
+    if not candidati:
+        return [], errori
+    
+    partecipanti = {r.partecipante_id for _, r in candidati}
+    date_lotto = {r.data for _, r in candidati}
+    esistenti_partecipanti = set(
+        Partecipante.objects.filter(pk__in=partecipanti).values_list('pk', flat=True)
+    )
+    chiavi_occupate = set(
+        Registro.objects.filter(
+            partecipante_id__in=partecipanti,
+            data__in=date_lotto
+        ).values_list('partecipante_id', 'data')
+    )
+    
+    registri = []
+    for indice, registro in candidati:
+        chiave = (registro.partecipante_id, registro.data)
+        if registro.partecipante_id not in esistenti_partecipanti:
+            errori.append({'riga': indice, 'errori': {
+                'partecipante': f'Partecipante {registro.partecipante_id} inesistente.'
+            }})
+        elif chiave in chiavi_occupate:
+            errori.append({'riga': indice, 'errori': {
+                'non_field_errors': 'Esiste già un registro per questo partecipante in questa data.'
+            }})
+        else:
+            chiavi_occupate.add(chiave)
+            registri.append(registro)
+    
+    errori.sort(key=lambda e: e['riga'])
+    return registri, errori
+
+
+def inserisci_registri(registri):
+    """
+    Scrive i registri già validati e aggiorna i riepiloghi in una transazione
+    """
+    with transaction.atomic():
+        sequenza = SequenzaModifiche.prossima()
+        for registro in registri:
+            registro.sequenza = sequenza
+        Registro.objects.bulk_create(registri, batch_size=BATCH_SIZE)
+        RiepilogoPresenze.aggiungi_registri(registri)
+        cache.invalida(r.partecipante_id for r in registri)
+    return len(registri)
+
+
+def aggiorna_registri(righe):
+    """
+    Modifica ore_totali e assenze di un lotto di registri esistenti, indicati
+    da partecipante e data. Il lotto viene scritto solo se tutte le righe sono
+    valide; ritorna (registri aggiornati nell'ordine delle righe, errori)
+    con errori nello stesso formato di valida_registri.
+    """
+    oggi = timezone.now().date()
+    errori = []
+    modifiche = []
+    chiavi = set()
+    for indice, riga in enumerate(righe):
+        if not isinstance(riga, dict):
+            errori.append({'riga': indice, 'errori': {'non_field_errors': 'Riga non valida.'}})
+            continue
+        
+        partecipante_id, giorno, ore_totali, assenze, errori_riga = _leggi_riga(
+            riga, oggi, assenze_obbligatorie=True
+        )
+        if not errori_riga and (partecipante_id, giorno) in chiavi:
+            errori_riga['non_field_errors'] = 'Registro presente più volte nel lotto.'
+        if errori_riga:
+            errori.append({'riga': indice, 'errori': errori_riga})
+        else:
+            chiavi.add((partecipante_id, giorno))
+            modifiche.append((indice, partecipante_id, giorno, ore_totali, assenze))
+    
+    if errori or not modifiche:
+        return [], errori
+    
+    with transaction.atomic():
+        sequenza = SequenzaModifiche.prossima()
+        # Una sola query per tutti i record (il filtro per insiemi può
+        # includerne altri, scartati in memoria); bloccati fino al commit
+        registri = {
+            (r.partecipante_id, r.data): r
+            for r in Registro.objects.select_related('partecipante__utente')
+            .select_for_update(of=('self',))
+            .filter(
+                partecipante_id__in={m[1] for m in modifiche},
+                data__in={m[2] for m in modifiche},
+            )
+        }
+        
+        adesso = timezone.now()
+        aggiornati = []
+        for indice, partecipante_id, giorno, ore_totali, assenze in modifiche:
+            registro = registri.get((partecipante_id, giorno))
+            if registro is None:
+                errori.append({'riga': indice, 'errori': {'non_field_errors': (
+                    f'Nessun registro trovato per partecipante {partecipante_id} in data {giorno}'
+                )}})
+                continue
+            registro.ore_totali = ore_totali
+            registro.assenze = assenze
+            # bulk_update non applica auto_now
+            registro.updated_at = adesso
+            registro.sequenza = sequenza
+            aggiornati.append(registro)
+        
+        if errori:
+            return [], errori
+        
+        Registro.objects.bulk_update(
+            aggiornati, ['ore_totali', 'assenze', 'updated_at', 'sequenza'], batch_size=BATCH_SIZE
+        )
+        RiepilogoPresenze.aggiorna_registri(aggiornati)
+        cache.invalida(r.partecipante_id for r in aggiornati)
+    return aggiornati, []
+
+
+def upsert_registro(riga, created_by_id=None):
+    """
+    Inserisce il registro (partecipante, data) o ne aggiorna ore_totali e
+    assenze se esiste già, con un solo INSERT ... ON CONFLICT DO UPDATE.
+    created_by viene impostato solo sui record nuovi.
+    Ritorna (registro, creato, errori) con errori {campo: [messaggio]}.
+    """
+    partecipante_id, giorno, ore_totali, assenze, errori = _leggi_riga(riga, timezone.now().date())
+    if not errori and not Partecipante.objects.filter(pk=partecipante_id).exists():
+        errori['partecipante'] = f'Partecipante {partecipante_id} inesistente.'
+    if errori:
+        return None, False, {campo: [messaggio] for campo, messaggio in errori.items()}
+    
+    nuovo = Registro(
+        partecipante_id=partecipante_id,
+        data=giorno,
+        ore_totali=ore_totali,
+        assenze=assenze,
+        created_by_id=created_by_id,
+    )
+    with transaction.atomic():
+        nuovo.sequenza = SequenzaModifiche.prossima()
+        Registro.objects.bulk_create(
+            [nuovo],
+            update_conflicts=True,
+            unique_fields=['partecipante', 'data'],
+            update_fields=['ore_totali', 'assenze', 'updated_at', 'sequenza'],
+        )
+        # Valori precedenti non noti: il riepilogo del partecipante viene ricalcolato
+        RiepilogoPresenze.ricalcola([partecipante_id])
+        cache.invalida([partecipante_id])
+        # Riletto nella stessa transazione: la riga scritta è bloccata fino al
+        # commit, una scrittura concorrente non può sostituirla prima della lettura
+        registro = Registro.objects.select_related('partecipante__utente').get(
+            partecipante_id=partecipante_id, data=giorno
+        )
+    
+    # In caso di conflitto created_at resta quello del record esistente
+    return registro, registro.created_at == nuovo.created_at, {}
+
+
+def elimina_registri(registri):
+    """
+    Elimina i registri del queryset con le stesse conseguenze dei segnali
+    post_delete (traccia per la sincronizzazione, riepiloghi, cache), ma con
+    poche query per blocco invece di alcune per record
+    Ritorna il numero di registri eliminati
+    """
+    tabella = connection.ops.quote_name(Registro._meta.db_table)
+    with transaction.atomic():
+        sequenza = SequenzaModifiche.prossima()
+        righe = list(registri.order_by().values_list('id', 'partecipante_id', 'data'))
+        RegistroEliminato.objects.bulk_create([
+            RegistroEliminato(registro_id=pk, partecipante_id=partecipante_id, data=giorno, sequenza=sequenza)
+            for pk, partecipante_id, giorno in righe
+        ], batch_size=BATCH_SIZE)
+        with connection.cursor() as cursor:
+            for inizio in range(0, len(righe), BATCH_SIZE):
+                blocco = [riga[0] for riga in righe[inizio:inizio + BATCH_SIZE]]
+                segnaposto = ', '.join(['%s'] * len(blocco))
+                cursor.execute(f'DELETE FROM {tabella} WHERE id IN ({segnaposto})', blocco)
+        
+        partecipanti = {riga[1] for riga in righe}
+        if partecipanti:
+            RiepilogoPresenze.ricalcola(partecipanti)
+            cache.invalida(partecipanti)
+    return len(righe)
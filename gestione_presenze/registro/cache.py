@@ -0,0 +1,136 @@
+"""
+Cache versionata delle risposte calcolate sul registro (stats e summary).
+
+Ogni risposta è salvata con una chiave che include la versione dei dati da
+cui dipende: globale per il summary, per partecipante per le stats. Ogni
+scrittura sul registro incrementa le versioni coinvolte, quindi le voci
+vecchie non vengono più lette (e scadono da sole): non serve cercarle per
+cancellarle e non si rischia di servire dati non aggiornati.
+"""
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+PREFISSO = 'registro'
+GLOBALE = 'globale'
+
+_lock = threading.Lock()
+_contatori = {'hit': 0, 'miss': 0, 'invalidazioni': 0}
+
+
+def _cache():
+    return caches[getattr(settings, 'REGISTRO_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'REGISTRO_CACHE_TIMEOUT', 3600)
+
+
+def _chiave_versione(ambito):
+    return f'{PREFISSO}:versione:{ambito}'
+
+
+def _conta(evento):
+    with _lock:
+        _contatori[evento] += 1
+
+
+def versione(ambito):
+    """
+    Versione corrente dei dati di un ambito (GLOBALE o id partecipante).
+    Se manca (prima lettura o chiave rimossa dal backend) parte dal timestamp
+    attuale, così non può coincidere con una versione già usata.
+    """
+    cache = _cache()
+    chiave = _chiave_versione(ambito)
+    valore = cache.get(chiave)
+    if valore is None:
+        cache.add(chiave, time.time_ns(), timeout=None)
+        valore = cache.get(chiave)
+    return valore
+
+
+async def aversione(ambito):
+    """Come versione(), per le viste asincrone"""
+    cache = _cache()
+    chiave = _chiave_versione(ambito)
+    valore = await cache.aget(chiave)
+    if valore is None:
+        await cache.aadd(chiave, time.time_ns(), timeout=None)
+        valore = await cache.aget(chiave)
+    return valore
+
+
+def _incrementa(ambiti):
+    cache = _cache()
+    for ambito in ambiti:
+        chiave = _chiave_versione(ambito)
+        try:
+            cache.incr(chiave)
+        except ValueError:
+            cache.set(chiave, time.time_ns(), timeout=None)
+    _conta('invalidazioni')
+
+
+def invalida(partecipante_ids):
+    """
+    Invalida i dati globali e quelli dei partecipanti indicati.
+    L'incremento è ripetuto al commit, così una lettura concorrente fatta
+    prima del commit non resta in cache sotto la versione nuova.
+    """
+    ambiti = [GLOBALE, *set(partecipante_ids)]
+    _incrementa(ambiti)
+    transaction.on_commit(lambda: _incrementa(ambiti))
+
+
+def risposta_in_cache(nome, ambito, parametri, calcola):
+    """
+    Ritorna il valore salvato per (nome, versione dell'ambito, parametri)
+    oppure lo calcola con calcola() e lo salva
+    """
+    cache = _cache()
+    chiave = _chiave_risposta(nome, ambito, versione(ambito), parametri)
+    
+    valore = cache.get(chiave)
+    if valore is not None:
+        _conta('hit')
+        return valore
+    
+    _conta('miss')
+    valore = calcola()
+    cache.set(chiave, valore, timeout=_timeout())
+    return valore
+
+
+async def arisposta_in_cache(nome, ambito, parametri, acalcola):
+    """Come risposta_in_cache(), con acalcola() coroutine"""
+    cache = _cache()
+    chiave = _chiave_risposta(nome, ambito, await aversione(ambito), parametri)
+    
+    valore = await cache.aget(chiave)
+    if valore is not None:
+        _conta('hit')
+        return valore
+    
+    _conta('miss')
+    valore = await acalcola()
+    await cache.aset(chiave, valore, timeout=_timeout())
+    return valore
+
+
+def _chiave_risposta(nome, ambito, versione_ambito, parametri):
+    parametri = '&'.join(f'{k}={v}' for k, v in sorted(parametri.items()))
+    impronta = hashlib.md5(parametri.encode()).hexdigest()
+    return f'{PREFISSO}:{nome}:{ambito}:{versione_ambito}:{impronta}'
+
+
+def statistiche():
+    """Contatori hit/miss/invalidazioni del processo corrente"""
+    with _lock:
+        dati = dict(_contatori)
+    totale = dati['hit'] + dati['miss']
+    dati['hit_ratio'] = round(dati['hit'] / totale, 4) if totale else 0.0
+    return dati
@@ -0,0 +1,70 @@
+"""
+Richieste condizionali (ETag / If-None-Match) per le letture del registro.
+
+Lista: l'ETag è calcolato dalle righe della pagina appena letta (e dai link
+di paginazione), prima di serializzarle e renderizzarle. La pagina è una
+sola query keyset, quindi il 304 costa quanto la lettura della pagina e non
+aggrega l'intero insieme filtrato.
+
+Stats: il validatore dei registri di un partecipante è calcolato con una
+sola query aggregata sull'indice del partecipante (max updated_at e numero
+di record): se il client ha già la versione corrente riceve 304 senza che
+le statistiche vengano calcolate. Il conteggio fa cambiare l'ETag anche
+quando un record viene eliminato (il massimo di updated_at da solo non se ne
+accorgerebbe).
+
+Niente Last-Modified: ha la risoluzione del secondo e non vede le
+eliminazioni, l'ETag è l'unico validatore.
+"""
+import hashlib
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+
+STATO = {'ultimo': Max('updated_at'), 'totale': Count('id')}
+
+
+def _etag(parti):
+    chiave = '|'.join(str(parte) for parte in parti)
+    return quote_etag(hashlib.md5(chiave.encode()).hexdigest())
+
+
+def _validatore(stato, parti):
+    ultimo = stato['ultimo']
+    return _etag((*parti, ultimo and ultimo.isoformat(), stato['totale']))
+
+
+def validatore(registri, *parti):
+    """
+    ETag dei registri indicati
+    parti: altri valori da cui dipende la risposta (url, utente, ...)
+    """
+    return _validatore(registri.order_by().aggregate(**STATO), parti)
+
+
+async def avalidatore(registri, *parti):
+    """Come validatore(), con l'ORM asincrono"""
+    return _validatore(await registri.order_by().aaggregate(**STATO), parti)
+
+
+def validatore_pagina(paginazione, righe, *parti):
+    """
+    ETag di una pagina della lista: righe lette (dizionari di values(), tutte
+    le colonne della risposta) e link alle pagine vicine
+    """
+    return _etag((*parti, paginazione.get_next_link(), paginazione.get_previous_link(), *map(repr, righe)))
+
+
+def non_modificato(request, etag):
+    """Risposta 304 se il client ha già questa versione, altrimenti None"""
+    return get_conditional_response(request, etag=etag)
+
+
+def imposta_intestazioni(response, etag):
+    """Aggiunge l'ETag a una risposta 200"""
+    if response.status_code == 200:
+        response['ETag'] = etag
+        # La risposta dipende dall'utente e dal formato richiesto
+        patch_vary_headers(response, ['Authorization', 'Accept'])
+    return response
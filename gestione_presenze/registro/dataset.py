@@ -0,0 +1,188 @@
+"""
+Generatore di dataset sintetici: admin, partecipanti e registro su N giorni
+lavorativi, con assenze estratte da una distribuzione configurabile.
+
+Tutto viene scritto con bulk_create a blocchi in un'unica transazione e la
+password di test viene calcolata una sola volta (l'hash PBKDF2 è la parte
+più costosa della creazione di un utente).
+
+Usato dal comando popola_db e dal benchmark. Gli utenti generati hanno tutti
+lo username che inizia con il prefisso indicato: pulisci_dataset elimina
+solo quelli, mai gli altri utenti del database.
+"""
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from admin_profile.models import Admin
+from partecipante.models import Utente, Partecipante
+from . import cache
+from .bulk import elimina_registri
+from .models import Registro, RiepilogoPresenze, SequenzaModifiche
+
+BATCH_SIZE = 5000
+ORE_GIORNALIERE = Decimal('8.00')
+MEZZ_ORA = Decimal('0.50')
+
+
+def _assenze_nessuna(rng, ore, rischio):
+    return Decimal('0.00')
+
+
+def _assenze_uniforme(rng, ore, rischio):
+    return MEZZ_ORA * rng.randint(0, int(ore / MEZZ_ORA))
+
+
+def _assenze_realistica(rng, ore, rischio):
+    """
+    Quasi sempre presenti, a volte ritardi/uscite anticipate, raramente
+    assenti tutto il giorno. I partecipanti "a rischio" si assentano di più.
+    """
+    estrazione = rng.random() / rischio
+    if estrazione < 0.05:
+        return ore
+    if estrazione < 0.20:
+        return MEZZ_ORA * rng.randint(1, 4)
+    return Decimal('0.00')
+
+
+DISTRIBUZIONI = {
+    'nessuna': _assenze_nessuna,
+    'uniforme': _assenze_uniforme,
+    'realistica': _assenze_realistica,
+}
+
+
+def giorni_lavorativi(quanti, fine=None):
+    """Gli ultimi `quanti` giorni dal lunedì al venerdì, fino a `fine` incluso"""
+    giorno = fine or date.today()
+    giorni = []
+    while len(giorni) < quanti:
+        if giorno.weekday() < 5:
+            giorni.append(giorno)
+        giorno -= timedelta(days=1)
+    return giorni
+
+
+def utenti_dataset(prefisso):
+    """Utenti creati da genera_dataset con questo prefisso"""
+    return Utente.objects.filter(username__startswith=f'{prefisso}_')
+
+
+def pulisci_dataset(prefisso):
+    """
+    Elimina gli utenti con il prefisso, i loro profili e i loro registri
+    Ritorna il numero di utenti eliminati
+    """
+    with transaction.atomic():
+        utenti = utenti_dataset(prefisso)
+        quanti = utenti.count()
+        # Prima i registri, in blocco: la cascata dell'ORM invierebbe i segnali per ogni record
+        elimina_registri(Registro.objects.filter(partecipante_id__in=utenti.values('pk')))
+        utenti.delete()
+    return quanti
+
+
+def genera_dataset(
+    partecipanti=50,
+    giorni=60,
+    admin=2,
+    distribuzione='realistica',
+    quota_a_rischio=0.1,
+    seed=42,
+    password='test1234',
+    prefisso='bench',
+    batch_size=BATCH_SIZE,
+):
+    """
+    Crea il dataset e ritorna un dict con i conteggi e i tempi di inserimento
+    """
+    if distribuzione not in DISTRIBUZIONI:
+        raise ValueError(f"Distribuzione sconosciuta: {distribuzione}")
+    estrai_assenze = DISTRIBUZIONI[distribuzione]
+    rng = random.Random(seed)
+    password_hash = make_password(password)
+    inizio = time.perf_counter()
+    
+    with transaction.atomic():
+        utenti_admin = Utente.objects.bulk_create([
+            Utente(
+                username=f'{prefisso}_admin{i}',
+                email=f'{prefisso}_admin{i}@example.com',
+                nome=f'Admin{i}',
+                cognome=prefisso.capitalize(),
+                ruolo='admin',
+                # Gli admin del corso gestiscono i registri anche da Django Admin
+                is_staff=True,
+                is_superuser=True,
+                password=password_hash,
+            )
+            for i in range(1, admin + 1)
+        ], batch_size=batch_size)
+        profili_admin = Admin.objects.bulk_create(
+            [Admin(utente=utente) for utente in utenti_admin],
+            batch_size=batch_size
+        )
+        
+        utenti = Utente.objects.bulk_create([
+            Utente(
+                username=f'{prefisso}_part{i}',
+                email=f'{prefisso}_part{i}@example.com',
+                nome=f'Nome{i}',
+                cognome=f'Cognome{i}',
+                ruolo='partecipante',
+                password=password_hash,
+            )
+            for i in range(1, partecipanti + 1)
+        ], batch_size=batch_size)
+        profili = Partecipante.objects.bulk_create(
+            [Partecipante(utente=utente, attivo=True) for utente in utenti],
+            batch_size=batch_size
+        )
+        utenti_creati = time.perf_counter()
+        
+        # Fattore di rischio per partecipante: >1 significa più assenze
+        rischio = {
+            p.pk: (3.0 if rng.random() < quota_a_rischio else 1.0)
+            for p in profili
+        }
+        creato_da = profili_admin[0] if profili_admin else None
+        date_registro = giorni_lavorativi(giorni)
+        sequenza = SequenzaModifiche.prossima()
+        
+        totale_registri = 0
+        blocco = []
+        for giorno in date_registro:
+            for partecipante in profili:
+                blocco.append(Registro(
+                    partecipante_id=partecipante.pk,
+                    data=giorno,
+                    ore_totali=ORE_GIORNALIERE,
+                    assenze=estrai_assenze(rng, ORE_GIORNALIERE, rischio[partecipante.pk]),
+                    created_by=creato_da,
+                    sequenza=sequenza,
+                ))
+                if len(blocco) >= batch_size:
+                    Registro.objects.bulk_create(blocco)
+                    totale_registri += len(blocco)
+                    blocco = []
+        if blocco:
+            Registro.objects.bulk_create(blocco)
+            totale_registri += len(blocco)
+        
+        RiepilogoPresenze.ricalcola()
+        cache.invalida(p.pk for p in profili)
+    
+    fine = time.perf_counter()
+    return {
+        'admin': len(profili_admin),
+        'partecipanti': len(profili),
+        'registri': totale_registri,
+        'secondi_utenti': round(utenti_creati - inizio, 3),
+        'secondi_totali': round(fine - inizio, 3),
+        'righe_al_secondo': round(
+            (len(utenti_admin) * 2 + len(utenti) * 2 + totale_registri) / max(fine - inizio, 1e-9)
+        ),
+    }
@@ -0,0 +1,85 @@
+"""
+Esportazione in streaming dei record di registro (CSV o NDJSON).
+
+Le righe sono lette con values_list().iterator() a blocchi, senza creare
+istanze del modello: la memoria resta costante qualunque sia il numero di
+record e l'intestazione viene inviata prima ancora di eseguire la query.
+"""
+import csv
+import json
+from rest_framework import serializers
+
+CHUNK_SIZE = 2000
+
+COLONNE = [
+    'id',
+    'partecipante',
+    'partecipante_nome',
+    'partecipante_cognome',
+    'data',
+    'ore_totali',
+    'assenze',
+    'ore_presenti',
+    'percentuale_presenza',
+    'note',
+    'created_at',
+]
+
+CAMPI_DB = [
+    'id',
+    'partecipante_id',
+    'partecipante__utente__nome',
+    'partecipante__utente__cognome',
+    'data',
+    'ore_totali',
+    'assenze',
+    'note',
+    'created_at',
+]
+
+
+class _Echo:
+    """Buffer fittizio per csv.writer: ritorna la riga invece di scriverla"""
+    def write(self, value):
+        return value
+
+
+def _righe(queryset):
+    """
+    Genera le righe come tuple nell'ordine di COLONNE, con ore presenti e
+    percentuale calcolate come Registro.ore_presenti/percentuale_presenza
+    """
+    formatta_data_ora = serializers.DateTimeField().to_representation
+    righe = queryset.order_by('-data', '-id').values_list(*CAMPI_DB).iterator(chunk_size=CHUNK_SIZE)
+    for pk, partecipante_id, nome, cognome, data, ore_totali, assenze, note, created_at in righe:
+        ore_presenti = ore_totali - assenze
+        if ore_totali == 0:
+            percentuale = 0.0
+        else:
+            percentuale = float(round((ore_presenti / ore_totali) * 100, 2))
+        yield (
+            pk, partecipante_id, nome, cognome, data.isoformat(),
+            ore_totali, assenze, float(ore_presenti), percentuale,
+            note, formatta_data_ora(created_at),
+        )
+
+
+def esporta_csv(queryset):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLONNE)
+    for riga in _righe(queryset):
+        yield writer.writerow(riga)
+
+
+def esporta_ndjson(queryset):
+    for riga in _righe(queryset):
+        record = dict(zip(COLONNE, riga))
+        record['ore_totali'] = str(record['ore_totali'])
+        record['assenze'] = str(record['assenze'])
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+ESPORTATORI = {
+    'csv': (esporta_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (esporta_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from registro.dataset import DISTRIBUZIONI, genera_dataset, pulisci_dataset, utenti_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Popola il database con dati di test in modo non interattivo "
+        "(inserimenti in blocco, adatto anche a volumi realistici)"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--partecipanti', type=int, default=4)
+        parser.add_argument('--giorni', type=int, default=10, help="Giorni lavorativi di registro")
+        parser.add_argument('--admin', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=42, help="Seed per assenze riproducibili")
+        parser.add_argument(
+            '--distribuzione',
+            default='realistica',
+            choices=sorted(DISTRIBUZIONI),
+            help="Distribuzione delle ore di assenza"
+        )
+        parser.add_argument('--password', default='test1234', help="Password comune a tutti gli utenti")
+        parser.add_argument('--prefisso', default='demo', help="Prefisso degli username creati")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help="Elimina prima gli utenti con lo stesso prefisso e i loro registri "
+                 "(gli altri utenti non vengono toccati)"
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help="Non chiede conferma prima di eliminare (con --clear)"
+        )
+    
+    def handle(self, *args, **options):
+        prefisso = options['prefisso']
+        esistenti = utenti_dataset(prefisso).count()
+        
+        if esistenti and not options['clear']:
+            raise CommandError(
+                f"Esistono già {esistenti} utenti con prefisso '{prefisso}_': "
+                f"usa un altro --prefisso oppure --clear per eliminarli"
+            )
+        if esistenti:
+            if options['interactive']:
+                risposta = input(
+                    f"Verranno eliminati {esistenti} utenti con prefisso '{prefisso}_' "
+                    f"e i loro registri. Continuare? [s/N] "
+                )
+                if risposta.strip().lower() not in ('s', 'si', 'sì'):
+                    raise CommandError("Operazione annullata")
+            pulisci_dataset(prefisso)
+            self.stdout.write(f"Eliminati {esistenti} utenti con prefisso '{prefisso}_'")
+        
+        risultato = genera_dataset(
+            partecipanti=options['partecipanti'],
+            giorni=options['giorni'],
+            admin=options['admin'],
+            distribuzione=options['distribuzione'],
+            seed=options['seed'],
+            password=options['password'],
+            prefisso=prefisso,
+            batch_size=options['batch_size'],
+        )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Creati {risultato['admin']} admin, {risultato['partecipanti']} partecipanti "
+            f"e {risultato['registri']} registri in {risultato['secondi_totali']}s "
+            f"({risultato['righe_al_secondo']} righe/s)"
+        ))
+        self.stdout.write(
+            f"Credenziali: {prefisso}_admin1 / {prefisso}_part1 ... "
+            f"password: {options['password']}"
+        )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from registro.sync import pulisci_eliminati
+
+
+class Command(BaseCommand):
+    help = "Rimuove le tracce dei registri eliminati più vecchie del periodo di conservazione del feed di sincronizzazione"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--giorni',
+            type=int,
+            default=getattr(settings, 'REGISTRO_SYNC_CONSERVAZIONE_GIORNI', 90),
+            help="Giorni di conservazione (default: REGISTRO_SYNC_CONSERVAZIONE_GIORNI)"
+        )
+    
+    def handle(self, *args, **options):
+        rimosse = pulisci_eliminati(options['giorni'])
+        self.stdout.write(self.style.SUCCESS(f"Rimosse {rimosse} tracce di eliminazione"))
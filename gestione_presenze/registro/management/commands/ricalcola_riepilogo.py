@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from registro.models import RiepilogoPresenze
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce (o verifica) il riepilogo presenze a partire dal Registro"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verifica',
+            action='store_true',
+            help="Non modifica nulla: segnala i partecipanti con riepilogo non allineato"
+        )
+    
+    def handle(self, *args, **options):
+        if options['verifica']:
+            disallineati = RiepilogoPresenze.verifica()
+            if disallineati:
+                raise CommandError(
+                    f"Riepilogo non allineato per {len(disallineati)} partecipanti: "
+                    f"{', '.join(str(p) for p in disallineati)}"
+                )
+            self.stdout.write(self.style.SUCCESS("Riepilogo presenze allineato al registro"))
+            return
+        
+        scritti = RiepilogoPresenze.ricalcola()
+        self.stdout.write(self.style.SUCCESS(f"Riepilogo ricostruito per {scritti} partecipanti"))
@@ -0,0 +1,60 @@
+"""
+Matrice presenze (partecipanti × date) in forma colonnare.
+
+Invece di un oggetto per record con nome, cognome e campi calcolati ripetuti,
+i partecipanti e l'asse delle date compaiono una sola volta e ore/assenze sono
+matrici dense (una riga per partecipante, una colonna per data, null dove il
+record manca). I dati arrivano da un'unica query values_list, senza creare
+istanze del modello né passare dai serializer.
+"""
+
+CAMPI_DB = [
+    'partecipante_id',
+    'partecipante__utente__nome',
+    'partecipante__utente__cognome',
+    'data',
+    'ore_totali',
+    'assenze',
+]
+
+ORDINAMENTO = [
+    'partecipante__utente__cognome',
+    'partecipante__utente__nome',
+    'partecipante_id',
+]
+
+
+def matrice_presenze(registri):
+    """
+    Corpo della risposta di /api/registro/matrix/ per i registri indicati
+    Le date sono solo quelle con almeno un record, in ordine crescente
+    """
+    righe = registri.order_by(*ORDINAMENTO).values_list(*CAMPI_DB)
+    
+    partecipanti = {'id': [], 'nome': [], 'cognome': []}
+    valori = []
+    date = set()
+    for partecipante_id, nome, cognome, data, ore_totali, assenze in righe:
+        if not partecipanti['id'] or partecipanti['id'][-1] != partecipante_id:
+            partecipanti['id'].append(partecipante_id)
+            partecipanti['nome'].append(nome)
+            partecipanti['cognome'].append(cognome)
+            valori.append({})
+        valori[-1][data] = (ore_totali, assenze)
+        date.add(data)
+    
+    date = sorted(date)
+    vuoto = (None, None)
+    ore_totali = []
+    assenze = []
+    for per_data in valori:
+        celle = [per_data.get(data, vuoto) for data in date]
+        ore_totali.append([cella[0] for cella in celle])
+        assenze.append([cella[1] for cella in celle])
+    
+    return {
+        'date': date,
+        'partecipanti': partecipanti,
+        'ore_totali': ore_totali,
+        'assenze': assenze,
+    }
@@ -0,0 +1,52 @@
+# Generated by Django 6.0.1 on 2026-10-17 18:34
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def popola_riepilogo(apps, schema_editor):
+    """Calcola il riepilogo per i record di registro già esistenti"""
+    Registro = apps.get_model('registro', 'Registro')
+    RiepilogoPresenze = apps.get_model('registro', 'RiepilogoPresenze')
+    
+    righe = Registro.objects.order_by().values('partecipante_id').annotate(
+        giorni=Count('id'),
+        ore=Sum('ore_totali'),
+        ass=Sum('assenze'),
+    )
+    RiepilogoPresenze.objects.bulk_create([
+        RiepilogoPresenze(
+            partecipante_id=r['partecipante_id'],
+            totale_giorni=r['giorni'],
+            totale_ore=r['ore'],
+            totale_assenze=r['ass'],
+        )
+        for r in righe
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partecipante', '0001_initial'),
+        ('registro', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiepilogoPresenze',
+            fields=[
+                ('partecipante', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='riepilogo', serialize=False, to='partecipante.partecipante')),
+                ('totale_giorni', models.PositiveIntegerField(default=0)),
+                ('totale_ore', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('totale_assenze', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+            ],
+            options={
+                'verbose_name': 'Riepilogo presenze',
+                'verbose_name_plural': 'Riepiloghi presenze',
+            },
+        ),
+        migrations.RunPython(popola_riepilogo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_profile', '0001_initial'),
+        ('partecipante', '0001_initial'),
+        ('registro', '0002_riepilogopresenze'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registro',
+            index=models.Index(fields=['data', 'id'], name='registro_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registro',
+            index=models.Index(fields=['data', 'partecipante'], name='registro_data_part_idx'),
+        ),
+    ]
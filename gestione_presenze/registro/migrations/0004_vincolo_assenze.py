@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_profile', '0001_initial'),
+        ('partecipante', '0001_initial'),
+        ('registro', '0003_indici_registro'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='registro',
+            constraint=models.CheckConstraint(condition=models.Q(('assenze__lte', models.F('ore_totali'))), name='registro_assenze_max_ore'),
+        ),
+    ]
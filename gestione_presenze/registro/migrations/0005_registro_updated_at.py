@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def inizializza_updated_at(apps, schema_editor):
+    """I record esistenti partono dalla data di creazione"""
+    Registro = apps.get_model('registro', 'Registro')
+    Registro.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0004_vincolo_assenze'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registro',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(inizializza_updated_at, migrations.RunPython.noop),
+    ]
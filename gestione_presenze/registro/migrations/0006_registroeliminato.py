@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0005_registro_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroEliminato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registro_id', models.BigIntegerField()),
+                ('partecipante_id', models.BigIntegerField(db_index=True)),
+                ('data', models.DateField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Registro eliminato',
+                'verbose_name_plural': 'Registri eliminati',
+                'indexes': [models.Index(fields=['deleted_at'], name='registro_eliminato_del_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+def crea_sequenza(apps, schema_editor):
+    """Contatore iniziale: i record già presenti (sequenza 0) arrivano con la prima sincronizzazione"""
+    apps.get_model('registro', 'SequenzaModifiche').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0006_registroeliminato'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenzaModifiche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valore', models.BigIntegerField(default=0)),
+                ('potati_fino_a', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Sequenza modifiche',
+                'verbose_name_plural': 'Sequenza modifiche',
+            },
+        ),
+        migrations.AddField(
+            model_name='registro',
+            name='sequenza',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='registroeliminato',
+            name='sequenza',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='registro',
+            index=models.Index(fields=['sequenza', 'id'], name='registro_sequenza_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroeliminato',
+            index=models.Index(fields=['sequenza', 'id'], name='registro_eliminato_seq_idx'),
+        ),
+        migrations.RunPython(crea_sequenza, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,67 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Abs, Cast, Floor, Round
+from django.db.models.lookups import LessThan
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
 from partecipante.models import Partecipante
 from admin_profile.models import Admin
 
+MESSAGGIO_DATA_FUTURA = "Non puoi inserire presenze future"
+MESSAGGIO_ASSENZE = "Le assenze non possono superare le ore totali"
+
+
+def regole_registro(data, ore_totali, assenze, oggi=None):
+    """
+    Regole di dominio di un record di registro, senza accesso al database
+    Ritorna {campo: messaggio}; i valori None (non validi o mancanti) sono ignorati
+    oggi può essere calcolato una volta sola per un intero lotto
+    """
+    errori = {}
+    if data is not None and data > (oggi or timezone.now().date()):
+        errori['data'] = MESSAGGIO_DATA_FUTURA
+    if ore_totali is not None and assenze is not None and assenze > ore_totali:
+        errori['assenze'] = MESSAGGIO_ASSENZE
+    return errori
+
+
+class SequenzaModifiche(models.Model):
+    """
+    Contatore delle modifiche al registro, cursore del feed di sincronizzazione
+    Una sola riga: ogni scrittura la incrementa all'inizio della propria
+    transazione e la tiene bloccata fino al commit, quindi i numeri vengono
+    assegnati nell'ordine dei commit. Un valore letto dal feed è già
+    committato insieme a tutte le righe con sequenza minore o uguale.
+    potati_fino_a: sequenza massima delle tracce di eliminazione rimosse
+    """
+    valore = models.BigIntegerField(default=0)
+    potati_fino_a = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Sequenza modifiche"
+        verbose_name_plural = "Sequenza modifiche"
+    
+    def __str__(self):
+        return f"Sequenza modifiche: {self.valore}"
+    
+    @classmethod
+    def prossima(cls):
+        """
+        Incrementa il contatore e ritorna il nuovo valore
+        Va chiamata dentro la transazione della scrittura: il blocco sulla riga
+        dura fino al commit
+        """
+        if not cls.objects.filter(pk=1).update(valore=F('valore') + 1):
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(valore=F('valore') + 1)
+        return cls.objects.values_list('valore', flat=True).get(pk=1)
+    
+    @classmethod
+    def stato(cls):
+        """(valore, potati_fino_a) committati, (0, 0) se il contatore non esiste ancora"""
+        return cls.objects.filter(pk=1).values_list('valore', 'potati_fino_a').first() or (0, 0)
+
 
 class Registro(models.Model):
     """
@@ -37,32 +95,79 @@ class Registro(models.Model):
         related_name='registri_create'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Aggiornato anche dalle scritture in blocco (bulk_update, upsert)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Valore di SequenzaModifiche dell'ultima scrittura (feed di sincronizzazione)
+    sequenza = models.BigIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name = "Registro"
         verbose_name_plural = "Registri"
         ordering = ['-data']
         unique_together = ['partecipante', 'data']  # Un record per giorno
+        indexes = [
+            # Ordinamento della lista e filtro keyset su (-data, -id), senza
+            # ordinare a parte i record dello stesso giorno
+            models.Index(fields=['data', 'id'], name='registro_data_idx'),
+            # Intervalli di date raggruppati/filtrati per partecipante
+            models.Index(fields=['data', 'partecipante'], name='registro_data_part_idx'),
+            # Cursore del feed di sincronizzazione
+            models.Index(fields=['sequenza', 'id'], name='registro_sequenza_idx'),
+        ]
+        constraints = [
+            # Garantito dal database anche per bulk_create/bulk_update e upsert;
+            # nella validazione del modello lo controlla solo clean()
+            models.CheckConstraint(
+                condition=Q(assenze__lte=F('ore_totali')),
+                name='registro_assenze_max_ore',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.partecipante.utente.cognome} - {self.data}"
     
     def clean(self):
-        """Validazione custom"""
+        """Validazione custom: niente date future, assenze entro le ore totali"""
         from django.core.exceptions import ValidationError
-        from django.utils import timezone
-        
-        # Non permettere date future
-        if self.data > timezone.now().date():
-            raise ValidationError("Non puoi inserire presenze future")
         
-        # Assenze non possono superare ore totali
-        if self.assenze > self.ore_totali:
-            raise ValidationError("Le assenze non possono superare le ore totali")
+        errori = regole_registro(self.data, self.ore_totali, self.assenze)
+        if errori:
+            raise ValidationError(next(iter(errori.values())))
     
-    def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+    def validate_constraints(self, exclude=None):
+        # Il vincolo sulle assenze è già verificato da clean(), senza query:
+        # ripeterlo darebbe lo stesso errore due volte
+        exclude = {*(exclude or ()), 'assenze'}
+        super().validate_constraints(exclude=exclude)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valori letti dal DB, usati per calcolare il delta del riepilogo
+        if all(nome in field_names for nome in ('partecipante_id', 'ore_totali', 'assenze')):
+            instance._valori_originali = (
+                instance.partecipante_id, instance.ore_totali, instance.assenze
+            )
+        return instance
+    
+    def save(self, *args, valida=True, **kwargs):
+        """
+        valida=False quando i dati sono già stati validati (serializer, form admin)
+        Chiavi esterne, unicità di (partecipante, data) e vincolo sulle assenze
+        sono garantiti dal database: nessuna SELECT di controllo prima della scrittura
+        """
+        if valida:
+            self.full_clean(
+                exclude=['partecipante', 'created_by'],
+                validate_unique=False,
+                validate_constraints=False,
+            )
+        # Il riepilogo viene aggiornato dal segnale post_save nella stessa transazione
+        with transaction.atomic():
+            self.sequenza = SequenzaModifiche.prossima()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'sequenza'}
+            super().save(*args, **kwargs)
     
     def ore_presenti(self):
         """Calcola ore di presenza effettiva"""
@@ -73,3 +178,233 @@ class Registro(models.Model):
         if self.ore_totali == 0:
             return 0.0
         return round((self.ore_presenti() / self.ore_totali) * 100, 2)
+
+
+# Equivalenti SQL di Registro.ore_presenti() e Registro.percentuale_presenza(),
+# per le letture con values() che non creano istanze del modello
+
+# Arrotondata a due decimali: dove il database usa i float (SQLite) la
+# differenza può avere un errore nell'ultima cifra, il valore esatto no
+ORE_PRESENTI = Round(F('ore_totali') - F('assenze'), 2, output_field=FloatField())
+
+
+def percentuale_presenza_sql(ore='ore_totali', assenze='assenze'):
+    """
+    Percentuale con lo stesso arrotondamento di round() sui Decimal (al pari):
+    centesimi di punto (percentuale * 100) in virgola mobile, arrotondati a un
+    intero. Con ore a due decimali un valore che non è a metà tra due interi
+    ne dista almeno 1 / (2 * ore in centesimi): oltre 1e-9 fino a milioni di
+    ore, molto più dell'errore dei float. Solo i casi a metà esatta vanno
+    trattati a parte, scegliendo l'intero pari.
+    ore, assenze: campi (anche annotazioni) con i totali da confrontare
+    """
+    centesimi = (
+        Cast(F(ore) - F(assenze), FloatField())
+        * Value(10000.0)
+        / Cast(ore, FloatField())
+    )
+    intero = Floor(centesimi)
+    pari = intero + intero - Value(2.0) * Floor(intero / Value(2.0))
+    return Case(
+        When(**{ore: 0}, then=Value(0.0)),
+        When(LessThan(Abs(centesimi - intero - Value(0.5)), Value(1e-9)), then=pari / Value(100.0)),
+        default=Round(centesimi) / Value(100.0),
+        output_field=FloatField()
+    )
+
+
+PERCENTUALE_PRESENZA = percentuale_presenza_sql()
+
+
+class RegistroEliminato(models.Model):
+    """
+    Traccia di un record di registro eliminato, per il feed di sincronizzazione
+    Il partecipante è salvato come semplice id: la traccia sopravvive anche
+    all'eliminazione del partecipante
+    """
+    registro_id = models.BigIntegerField()
+    partecipante_id = models.BigIntegerField(db_index=True)
+    data = models.DateField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    sequenza = models.BigIntegerField(default=0, editable=False)
+    
+    class Meta:
+        verbose_name = "Registro eliminato"
+        verbose_name_plural = "Registri eliminati"
+        indexes = [
+            # Conservazione (pulisci_eliminati)
+            models.Index(fields=['deleted_at'], name='registro_eliminato_del_idx'),
+            # Cursore del feed di sincronizzazione
+            models.Index(fields=['sequenza', 'id'], name='registro_eliminato_seq_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Eliminato: {self.registro_id} ({self.data})"
+
+
+class RiepilogoPresenze(models.Model):
+    """
+    Totali presenze per partecipante, aggiornati ad ogni modifica del Registro
+    """
+    partecipante = models.OneToOneField(
+        Partecipante,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='riepilogo'
+    )
+    totale_giorni = models.PositiveIntegerField(default=0)
+    totale_ore = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    totale_assenze = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    
+    class Meta:
+        verbose_name = "Riepilogo presenze"
+        verbose_name_plural = "Riepiloghi presenze"
+    
+    def __str__(self):
+        return f"Riepilogo: {self.partecipante_id}"
+    
+    def ore_presenti(self):
+        """Ore di presenza effettiva complessive"""
+        return self.totale_ore - self.totale_assenze
+    
+    def percentuale_presenza(self):
+        """Percentuale presenza complessiva"""
+        if not self.totale_ore:
+            return 0.0
+        return round((self.ore_presenti() / self.totale_ore) * 100, 2)
+    
+    @classmethod
+    def per_partecipante(cls, partecipante):
+        """
+        Ritorna il riepilogo del partecipante, o uno vuoto (non salvato)
+        se non ha ancora record nel registro
+        """
+        riepilogo = getattr(partecipante, 'riepilogo', None)
+        if riepilogo is None:
+            riepilogo = cls(partecipante=partecipante)
+        return riepilogo
+    
+    @classmethod
+    def applica_delta(cls, partecipante_id, giorni, ore, assenze):
+        """
+        Somma le differenze ai totali del partecipante con un singolo UPDATE.
+        Se il riepilogo non esiste ancora viene ricalcolato dal registro.
+        """
+        if not cls._somma_delta(partecipante_id, giorni, ore, assenze):
+            cls.ricalcola([partecipante_id])
+    
+    @classmethod
+    def _somma_delta(cls, partecipante_id, giorni, ore, assenze):
+        return cls.objects.filter(partecipante_id=partecipante_id).update(
+            totale_giorni=F('totale_giorni') + giorni,
+            totale_ore=F('totale_ore') + ore,
+            totale_assenze=F('totale_assenze') + assenze,
+        )
+    
+    @classmethod
+    def aggiungi_registri(cls, registri):
+        """
+        Aggiorna i riepiloghi dopo un inserimento in blocco
+        (bulk_create non invia i segnali post_save)
+        """
+        delta = {}
+        for registro in registri:
+            giorni, ore, assenze = delta.get(registro.partecipante_id, (0, 0, 0))
+            delta[registro.partecipante_id] = (
+                giorni + 1, ore + registro.ore_totali, assenze + registro.assenze
+            )
+        # I partecipanti senza riepilogo vengono ricalcolati tutti insieme
+        mancanti = [
+            partecipante_id
+            for partecipante_id, (giorni, ore, assenze) in delta.items()
+            if not cls._somma_delta(partecipante_id, giorni, ore, assenze)
+        ]
+        if mancanti:
+            cls.ricalcola(mancanti)
+    
+    @classmethod
+    def aggiorna_registri(cls, registri):
+        """
+        Aggiorna i riepiloghi dopo una modifica in blocco di ore e assenze
+        (bulk_update non invia i segnali post_save). I registri devono essere
+        stati letti dal database: il delta è calcolato sui valori originali.
+        """
+        delta = {}
+        for registro in registri:
+            _, ore_prima, assenze_prima = registro._valori_originali
+            ore, assenze = delta.get(registro.partecipante_id, (0, 0))
+            delta[registro.partecipante_id] = (
+                ore + registro.ore_totali - ore_prima,
+                assenze + registro.assenze - assenze_prima,
+            )
+            registro._valori_originali = (
+                registro.partecipante_id, registro.ore_totali, registro.assenze
+            )
+        mancanti = [
+            partecipante_id
+            for partecipante_id, (ore, assenze) in delta.items()
+            if (ore or assenze) and not cls._somma_delta(partecipante_id, 0, ore, assenze)
+        ]
+        if mancanti:
+            cls.ricalcola(mancanti)
+    
+    @classmethod
+    def calcola_dal_registro(cls, partecipante_ids=None):
+        """
+        Calcola i totali direttamente dalla tabella Registro
+        Ritorna un dict {partecipante_id: (giorni, ore, assenze)}
+        """
+        registri = Registro.objects.all()
+        if partecipante_ids is not None:
+            registri = registri.filter(partecipante_id__in=partecipante_ids)
+        
+        righe = registri.order_by().values('partecipante_id').annotate(
+            giorni=Count('id'),
+            ore=Sum('ore_totali'),
+            ass=Sum('assenze'),
+        )
+        return {
+            r['partecipante_id']: (r['giorni'], r['ore'], r['ass'])
+            for r in righe
+        }
+    
+    @classmethod
+    def ricalcola(cls, partecipante_ids=None):
+        """
+        Ricostruisce da zero i riepiloghi (tutti o solo quelli indicati)
+        Ritorna il numero di riepiloghi scritti
+        """
+        totali = cls.calcola_dal_registro(partecipante_ids)
+        with transaction.atomic():
+            esistenti = cls.objects.all()
+            if partecipante_ids is not None:
+                esistenti = esistenti.filter(partecipante_id__in=partecipante_ids)
+            esistenti.delete()
+            cls.objects.bulk_create([
+                cls(
+                    partecipante_id=partecipante_id,
+                    totale_giorni=giorni,
+                    totale_ore=ore,
+                    totale_assenze=assenze,
+                )
+                for partecipante_id, (giorni, ore, assenze) in totali.items()
+            ])
+        return len(totali)
+    
+    @classmethod
+    def verifica(cls):
+        """
+        Confronta i riepiloghi salvati con i totali del registro
+        Ritorna la lista dei partecipante_id non allineati
+        """
+        attesi = cls.calcola_dal_registro()
+        salvati = {
+            r.partecipante_id: (r.totale_giorni, r.totale_ore, r.totale_assenze)
+            for r in cls.objects.all()
+        }
+        vuoto = (0, Decimal('0.00'), Decimal('0.00'))
+        return sorted(
+            partecipante_id
+            for partecipante_id in attesi.keys() | salvati.keys()
+            if attesi.get(partecipante_id, vuoto) != salvati.get(partecipante_id, vuoto)
+        )
@@ -0,0 +1,133 @@
+import base64
+import binascii
+from datetime import date
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RegistroCursorPagination(BasePagination):
+    """
+    Paginazione keyset su (data, id), dal più recente al più vecchio.
+    Ogni pagina è una singola query con filtro sulla chiave dell'ultimo
+    record visto: il costo non dipende da quanto si va indietro nello storico
+    e inserimenti concorrenti non spostano i record tra le pagine.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursore non valido'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, page_size = self._prepara(queryset, request)
+        return self._imposta_pagina(list(queryset), page_size)
+    
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Come paginate_queryset, con l'ORM asincrono"""
+        queryset, page_size = self._prepara(queryset, request)
+        return self._imposta_pagina([registro async for registro in queryset], page_size)
+    
+    def _prepara(self, queryset, request):
+        """Filtro keyset e limite della pagina (nessuna query eseguita)"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        
+        self.cursore = self.decode_cursor(request)
+        self.indietro = self.cursore is not None and self.cursore[0]
+        
+        if self.indietro:
+            queryset = queryset.order_by('data', 'id')
+            if self.cursore:
+                _, data, pk = self.cursore
+                queryset = queryset.filter(Q(data__gt=data) | Q(data=data, id__gt=pk))
+        else:
+            queryset = queryset.order_by('-data', '-id')
+            if self.cursore:
+                _, data, pk = self.cursore
+                queryset = queryset.filter(Q(data__lt=data) | Q(data=data, id__lt=pk))
+        
+        # Un record in più per sapere se esiste un'altra pagina
+        return queryset[:page_size + 1], page_size
+    
+    def _imposta_pagina(self, righe, page_size):
+        altre = len(righe) > page_size
+        righe = righe[:page_size]
+        
+        if self.indietro:
+            righe.reverse()
+            self.has_next = True
+            self.has_previous = altre
+        else:
+            self.has_next = altre
+            self.has_previous = self.cursore is not None
+        
+        self.page = righe
+        return righe
+    
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+    
+    def decode_cursor(self, request):
+        """
+        Ritorna (indietro, data, id) oppure None se il cursore non è presente
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            decoded = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            indietro, data, pk = decoded.split('|')
+            return indietro == '1', date.fromisoformat(data), int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+    
+    def encode_cursor(self, indietro, registro):
+        # Istanza del modello o riga di values() (con data e id)
+        if isinstance(registro, dict):
+            data, pk = registro['data'], registro['id']
+        else:
+            data, pk = registro.data, registro.pk
+        raw = f"{'1' if indietro else '0'}|{data.isoformat()}|{pk}"
+        encoded = base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Pagina vuota tornando indietro: riparte dall'inizio
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(False, self.page[-1])
+    
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
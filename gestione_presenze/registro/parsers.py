@@ -0,0 +1,23 @@
+import codecs
+import csv
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """
+    Parser per file CSV con intestazione: ritorna una lista di dict
+    """
+    media_type = 'text/csv'
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        try:
+            righe = codecs.iterdecode(stream, 'utf-8-sig')
+            return [
+                {chiave.strip(): valore for chiave, valore in riga.items() if chiave}
+                for riga in csv.DictReader(righe)
+            ]
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ParseError(f'CSV non valido - {exc}')
@@ -32,7 +32,7 @@ class IsOwnerOrAdmin(permissions.BasePermission):
             return True
         
         # Partecipante può accedere solo ai propri dati
-        if hasattr(obj, 'partecipante'):
-            return obj.partecipante.utente == request.user
+        if hasattr(obj, 'partecipante_id'):
+            return obj.partecipante_id == request.user.pk
         
         return False
@@ -0,0 +1,27 @@
+import json
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class _EsportazioneRenderer(BaseRenderer):
+    """
+    Renderer usati solo per la negoziazione del formato di esportazione:
+    i dati veri e propri sono inviati in streaming dalla view, qui passano
+    soltanto le risposte di errore (serializzate come JSON).
+    """
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode(self.charset)
+
+
+class CSVRenderer(_EsportazioneRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_EsportazioneRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Registro
+from rest_framework.validators import UniqueTogetherValidator
+from .models import Registro, regole_registro
 
 class RegistroSerializer(serializers.ModelSerializer):
     partecipante_nome = serializers.CharField(
@@ -34,6 +35,13 @@ class RegistroSerializer(serializers.ModelSerializer):
     def get_percentuale_presenza(self, obj):
         return obj.percentuale_presenza()
 
+class RegistroSyncSerializer(RegistroSerializer):
+    """Record del feed di sincronizzazione: include id e ultima modifica"""
+    
+    class Meta(RegistroSerializer.Meta):
+        fields = ['id', *RegistroSerializer.Meta.fields, 'updated_at']
+
+
 class RegistroUpdateSerializer(serializers.ModelSerializer):
     """Serializer per modifica registro da parte admin"""
     
@@ -45,11 +53,51 @@ class RegistroUpdateSerializer(serializers.ModelSerializer):
             'ore_totali',
             'assenze'
         ]
+        # L'unicità di (partecipante, data) è garantita dal vincolo del database:
+        # le viste convertono l'IntegrityError con errore_integrita()
+        validators = []
     
     def validate(self, data):
-        """Validazione dati"""
-        if data['assenze'] > data['ore_totali']:
-            raise serializers.ValidationError({
-                'assenze': 'Le ore di assenza non possono superare le ore totali.'
-            })
+        """Regole di Registro.clean, valutate una sola volta"""
+        valori = {
+            campo: data.get(campo, getattr(self.instance, campo, None))
+            for campo in ('data', 'ore_totali', 'assenze')
+        }
+        errori = regole_registro(**valori)
+        if 'assenze' in errori:
+            errori['assenze'] = 'Le ore di assenza non possono superare le ore totali.'
+        if errori:
+            raise serializers.ValidationError(errori)
         return data
+    
+    def update(self, instance, validated_data):
+        for campo, valore in validated_data.items():
+            setattr(instance, campo, valore)
+        # Dati già validati: save() non ripete full_clean
+        instance.save(valida=False)
+        return instance
+
+
+# Stesso messaggio del validatore unique_together di DRF
+ERRORE_UNICITA = {'non_field_errors': [
+    UniqueTogetherValidator.message.format(field_names='partecipante, data')
+]}
+
+ERRORE_INTEGRITA = {'non_field_errors': [
+    'Dati non validi: partecipante inesistente o vincolo del database violato.'
+]}
+
+
+def violazione_unicita(exc):
+    """
+    True se l'IntegrityError viene dal vincolo di unicità
+    (SQLite: "UNIQUE constraint failed", PostgreSQL/MySQL: "duplicate key"/"Duplicate entry")
+    Le altre violazioni (chiave esterna, CHECK) non sono conflitti di unicità
+    """
+    messaggio = str(exc).lower()
+    return 'unique' in messaggio or 'duplicate' in messaggio
+
+
+def errore_integrita(exc):
+    """Corpo dell'errore 400 per un IntegrityError in scrittura"""
+    return ERRORE_UNICITA if violazione_unicita(exc) else ERRORE_INTEGRITA
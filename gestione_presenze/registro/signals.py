@@ -0,0 +1,71 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from partecipante.models import Utente
+from . import cache
+from .models import Registro, RegistroEliminato, RiepilogoPresenze, SequenzaModifiche
+
+
+@receiver(post_save, sender=Registro)
+def aggiorna_riepilogo_dopo_salvataggio(sender, instance, created, **kwargs):
+    """
+    Applica al riepilogo la differenza tra i valori vecchi e quelli nuovi
+    """
+    originali = getattr(instance, '_valori_originali', None)
+    cache.invalida([instance.partecipante_id] + ([originali[0]] if originali else []))
+    
+    if not created and originali is None:
+        # Valori precedenti non noti: ricalcolo completo del partecipante
+        RiepilogoPresenze.ricalcola([instance.partecipante_id])
+    else:
+        delta = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+        if not created:
+            partecipante_id, ore_totali, assenze = originali
+            delta[partecipante_id][0] -= 1
+            delta[partecipante_id][1] -= ore_totali
+            delta[partecipante_id][2] -= assenze
+        delta[instance.partecipante_id][0] += 1
+        delta[instance.partecipante_id][1] += instance.ore_totali
+        delta[instance.partecipante_id][2] += instance.assenze
+        
+        for partecipante_id, (giorni, ore, assenze) in delta.items():
+            if giorni or ore or assenze:
+                RiepilogoPresenze.applica_delta(partecipante_id, giorni, ore, assenze)
+    
+    instance._valori_originali = (
+        instance.partecipante_id, instance.ore_totali, instance.assenze
+    )
+
+
+@receiver(post_delete, sender=Registro)
+def aggiorna_riepilogo_dopo_eliminazione(sender, instance, **kwargs):
+    """
+    Sottrae dal riepilogo il record eliminato (anche eliminazioni multiple da admin)
+    e ne registra la traccia per il feed di sincronizzazione
+    """
+    cache.invalida([instance.partecipante_id])
+    # Il segnale è inviato dentro la transazione dell'eliminazione
+    RegistroEliminato.objects.create(
+        registro_id=instance.pk,
+        partecipante_id=instance.partecipante_id,
+        data=instance.data,
+        sequenza=SequenzaModifiche.prossima(),
+    )
+    RiepilogoPresenze.objects.filter(partecipante_id=instance.partecipante_id).update(
+        totale_giorni=F('totale_giorni') - 1,
+        totale_ore=F('totale_ore') - instance.ore_totali,
+        totale_assenze=F('totale_assenze') - instance.assenze,
+    )
+
+
+@receiver(post_save, sender=Utente)
+def invalida_dopo_modifica_utente(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Il summary per partecipante contiene nome e cognome: vanno invalidati anche
+    quando cambia l'utente, non solo quando cambia il registro
+    """
+    if created or (update_fields is not None and not {'nome', 'cognome'} & set(update_fields)):
+        return
+    cache.invalida([instance.pk])
@@ -0,0 +1,156 @@
+"""
+Feed di sincronizzazione incrementale del registro.
+
+Restituisce i record creati o modificati e le tracce dei record eliminati
+dopo un cursore opaco. Ogni scrittura riceve un numero da SequenzaModifiche
+dentro la propria transazione, nell'ordine dei commit: il cursore contiene
+la posizione (sequenza, id) raggiunta in entrambi i flussi e ogni richiesta
+legge solo le righe successive, fino al valore del contatore letto
+all'inizio (già committato, come tutte le righe con sequenza minore). Il
+costo dipende dalle modifiche e non dalla dimensione dello storico.
+
+Le tracce delle eliminazioni vengono conservate per
+REGISTRO_SYNC_CONSERVAZIONE_GIORNI (comando pulisci_eliminati): un cursore
+precedente alle tracce rimosse riceve 410 e il client deve ripartire da capo.
+"""
+import base64
+import binascii
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from .models import Registro, RegistroEliminato, SequenzaModifiche
+
+LIMITE_DEFAULT = 500
+LIMITE_MASSIMO = 5000
+
+
+class CursoreScaduto(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = (
+        'Cursore troppo vecchio: alcune eliminazioni non sono più disponibili, '
+        'sincronizza da capo senza cursore'
+    )
+    default_code = 'cursore_scaduto'
+
+
+def _codifica(posizioni):
+    testo = '|'.join('' if valore is None else str(valore) for posizione in posizioni for valore in posizione)
+    return base64.urlsafe_b64encode(testo.encode('ascii')).decode('ascii')
+
+
+def decodifica_cursore(cursore):
+    """
+    Ritorna [(sequenza, id) dei registri, (sequenza, id) delle eliminazioni]
+    (None, None): dall'inizio; (sequenza, None): consegnato tutto fino a sequenza
+    """
+    if not cursore:
+        return [(None, None), (None, None)]
+    try:
+        parti = base64.urlsafe_b64decode(cursore.encode('ascii')).decode('ascii').split('|')
+        if len(parti) != 4:
+            raise ValueError
+        posizioni = []
+        for sequenza, pk in (parti[0:2], parti[2:4]):
+            if not sequenza:
+                if pk:
+                    raise ValueError
+                posizioni.append((None, None))
+            else:
+                posizioni.append((int(sequenza), int(pk) if pk else None))
+        return posizioni
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValidationError({'cursor': 'Cursore non valido'})
+
+
+def _dopo(queryset, posizione):
+    sequenza, pk = posizione
+    if sequenza is None:
+        return queryset
+    if pk is None:
+        return queryset.filter(sequenza__gt=sequenza)
+    return queryset.filter(Q(sequenza__gt=sequenza) | Q(sequenza=sequenza, id__gt=pk))
+
+
+def _pagina(queryset, posizione, limite, fino_a):
+    righe = list(
+        _dopo(queryset, posizione)
+        .filter(sequenza__lte=fino_a)
+        .order_by('sequenza', 'id')[:limite + 1]
+    )
+    altre = len(righe) > limite
+    righe = righe[:limite]
+    if altre:
+        posizione = (righe[-1].sequenza, righe[-1].pk)
+    else:
+        # Flusso consegnato per intero fino al contatore letto
+        posizione = (fino_a, None)
+    return righe, posizione, altre
+
+
+def _scaduta(posizione, potati_fino_a):
+    """True se dopo la posizione c'erano tracce di eliminazione ora rimosse"""
+    sequenza, pk = posizione
+    if sequenza is None:
+        return False
+    return sequenza < potati_fino_a or (sequenza == potati_fino_a and pk is not None)
+
+
+def modifiche(user, cursore=None, limite=LIMITE_DEFAULT):
+    """
+    Modifiche visibili all'utente dopo il cursore
+    Ritorna (registri modificati, eliminati, nuovo cursore, altre modifiche disponibili)
+    Solleva CursoreScaduto se il cursore precede le tracce rimosse dalla conservazione
+    """
+    posizioni = decodifica_cursore(cursore)
+    fino_a, potati_fino_a = SequenzaModifiche.stato()
+    if _scaduta(posizioni[1], potati_fino_a):
+        raise CursoreScaduto()
+    
+    if user.ruolo == 'admin':
+        registri = Registro.objects.all()
+        eliminati = RegistroEliminato.objects.all()
+    elif user.ruolo == 'partecipante':
+        registri = Registro.objects.filter(partecipante_id=user.pk)
+        eliminati = RegistroEliminato.objects.filter(partecipante_id=user.pk)
+    else:
+        registri = Registro.objects.none()
+        eliminati = RegistroEliminato.objects.none()
+    
+    registri, posizione_registri, altri_registri = _pagina(
+        registri.select_related('partecipante__utente'), posizioni[0], limite, fino_a
+    )
+    eliminati, posizione_eliminati, altri_eliminati = _pagina(
+        eliminati, posizioni[1], limite, fino_a
+    )
+    return (
+        registri,
+        eliminati,
+        _codifica([posizione_registri, posizione_eliminati]),
+        altri_registri or altri_eliminati,
+    )
+
+
+def pulisci_eliminati(giorni=None):
+    """
+    Rimuove le tracce di eliminazione più vecchie di `giorni` (default
+    REGISTRO_SYNC_CONSERVAZIONE_GIORNI) e registra fino a quale sequenza
+    sono state rimosse. Ritorna il numero di tracce rimosse
+    """
+    if giorni is None:
+        giorni = getattr(settings, 'REGISTRO_SYNC_CONSERVAZIONE_GIORNI', 90)
+    limite = timezone.now() - timedelta(days=giorni)
+    with transaction.atomic():
+        massima = RegistroEliminato.objects.filter(deleted_at__lt=limite).aggregate(
+            massima=Max('sequenza')
+        )['massima']
+        if massima is None:
+            return 0
+        # Tutte le tracce fino alla sequenza massima: nessun buco nel flusso
+        rimosse, _ = RegistroEliminato.objects.filter(sequenza__lte=massima).delete()
+        SequenzaModifiche.objects.get_or_create(pk=1)
+        SequenzaModifiche.objects.filter(pk=1, potati_fino_a__lt=massima).update(potati_fino_a=massima)
+    return rimosse
@@ -1,3 +1,1436 @@
-from django.test import TestCase
+import csv
+import json
+import re
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+from decimal import Decimal
+from io import StringIO
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from gestione_presenze.metriche import metriche
+from gestione_presenze.renderers import msgpack
+from admin_profile.models import Admin
+from partecipante.authentication import TokenConRuoloSerializer, verifica_utenti
+from partecipante.models import Utente, Partecipante
+from .admin import RegistroAdmin
+from .models import Registro, RegistroEliminato, RiepilogoPresenze
+from .serializers import ERRORE_INTEGRITA, ERRORE_UNICITA, RegistroSerializer
 
-# Create your tests here.
+
+def bearer(utente):
+    token = TokenConRuoloSerializer.get_token(utente).access_token
+    return f'Bearer {token}'
+
+
+def crea_partecipante(username):
+    utente = Utente.objects.create(
+        username=username,
+        nome=username.capitalize(),
+        cognome='Test',
+        ruolo='partecipante'
+    )
+    return Partecipante.objects.create(utente=utente)
+
+
+class RiepilogoPresenzeTest(TestCase):
+    def setUp(self):
+        self.partecipante = crea_partecipante('part1')
+        self.altro = crea_partecipante('part2')
+        self.oggi = date.today()
+    
+    def crea_registro(self, partecipante, giorni_fa, ore='8.00', assenze='0.00'):
+        return Registro.objects.create(
+            partecipante=partecipante,
+            data=self.oggi - timedelta(days=giorni_fa),
+            ore_totali=Decimal(ore),
+            assenze=Decimal(assenze)
+        )
+    
+    def riepilogo(self, partecipante):
+        return RiepilogoPresenze.objects.get(partecipante=partecipante)
+    
+    def test_creazione_aggiorna_totali(self):
+        self.crea_registro(self.partecipante, 0, assenze='2.00')
+        self.crea_registro(self.partecipante, 1)
+        
+        riepilogo = self.riepilogo(self.partecipante)
+        self.assertEqual(riepilogo.totale_giorni, 2)
+        self.assertEqual(riepilogo.totale_ore, Decimal('16.00'))
+        self.assertEqual(riepilogo.totale_assenze, Decimal('2.00'))
+        self.assertEqual(self.partecipante.calcola_percentuale_presenza(), Decimal('87.50'))
+    
+    def test_modifica_applica_differenza(self):
+        registro = self.crea_registro(self.partecipante, 0, assenze='2.00')
+        
+        registro = Registro.objects.get(pk=registro.pk)
+        registro.assenze = Decimal('4.00')
+        registro.save()
+        
+        riepilogo = self.riepilogo(self.partecipante)
+        self.assertEqual(riepilogo.totale_giorni, 1)
+        self.assertEqual(riepilogo.totale_assenze, Decimal('4.00'))
+    
+    def test_cambio_partecipante_sposta_totali(self):
+        registro = self.crea_registro(self.partecipante, 0, assenze='1.00')
+        
+        registro.partecipante = self.altro
+        registro.save()
+        
+        self.assertEqual(self.riepilogo(self.partecipante).totale_giorni, 0)
+        self.assertEqual(self.riepilogo(self.altro).totale_giorni, 1)
+        self.assertEqual(self.riepilogo(self.altro).totale_assenze, Decimal('1.00'))
+    
+    def test_eliminazione_sottrae_totali(self):
+        self.crea_registro(self.partecipante, 0, assenze='1.00')
+        self.crea_registro(self.partecipante, 1)
+        
+        Registro.objects.filter(data=self.oggi).delete()
+        
+        riepilogo = self.riepilogo(self.partecipante)
+        self.assertEqual(riepilogo.totale_giorni, 1)
+        self.assertEqual(riepilogo.totale_assenze, Decimal('0.00'))
+    
+    def test_comando_ricostruisce_e_verifica(self):
+        self.crea_registro(self.partecipante, 0, assenze='1.00')
+        RiepilogoPresenze.objects.update(totale_giorni=10)
+        self.assertEqual(RiepilogoPresenze.verifica(), [self.partecipante.pk])
+        
+        call_command('ricalcola_riepilogo', stdout=StringIO())
+        
+        self.assertEqual(RiepilogoPresenze.verifica(), [])
+        call_command('ricalcola_riepilogo', '--verifica', stdout=StringIO())
+
+
+class PopolaDbTest(TestCase):
+    def setUp(self):
+        self.superuser = Utente.objects.create(
+            username='root', nome='Root', cognome='Test', ruolo='admin', is_staff=True, is_superuser=True
+        )
+        self.partecipante = crea_partecipante('reale')
+        Registro.objects.create(
+            partecipante=self.partecipante, data=date.today() - timedelta(days=1), ore_totali=Decimal('8.00')
+        )
+    
+    def popola(self, *argomenti):
+        call_command('popola_db', '--partecipanti', '2', '--giorni', '3', *argomenti, stdout=StringIO())
+    
+    def test_clear_elimina_solo_il_prefisso(self):
+        self.popola()
+        self.popola('--clear', '--noinput')
+        
+        self.assertTrue(Utente.objects.filter(pk=self.superuser.pk).exists())
+        self.assertEqual(self.partecipante.registro_set.count(), 1)
+        self.assertEqual(Utente.objects.filter(username__startswith='demo_').count(), 4)
+        self.assertEqual(Registro.objects.count(), 1 + 2 * 3)
+        # Registri eliminati in blocco: tracce per la sincronizzazione e riepiloghi allineati
+        self.assertEqual(RegistroEliminato.objects.count(), 2 * 3)
+        self.assertEqual(RiepilogoPresenze.verifica(), [])
+    
+    def test_senza_clear_non_elimina(self):
+        self.popola()
+        with self.assertRaisesMessage(CommandError, '--clear'):
+            self.popola()
+    
+    def test_conferma_richiesta(self):
+        self.popola()
+        with mock.patch('builtins.input', return_value='n'):
+            with self.assertRaisesMessage(CommandError, 'annullata'):
+                self.popola('--clear')
+        self.assertEqual(Registro.objects.count(), 1 + 2 * 3)
+
+
+class RegistroValidazioneTest(TestCase):
+    def setUp(self):
+        self.partecipante = crea_partecipante('part1')
+        self.ieri = date.today() - timedelta(days=1)
+    
+    def test_save_senza_select_di_controllo(self):
+        with CaptureQueriesContext(connection) as query:
+            Registro.objects.create(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('8'))
+        
+        # Prima dell'INSERT nessuna lettura del registro (il riepilogo viene
+        # aggiornato dopo), solo il contatore delle modifiche
+        sql = [q['sql'] for q in query.captured_queries]
+        inserimento = next(i for i, q in enumerate(sql) if q.startswith('INSERT INTO "registro_registro"'))
+        self.assertFalse([
+            q for q in sql[:inserimento] if q.startswith('SELECT') and 'registro_sequenzamodifiche' not in q
+        ])
+    
+    def test_regole_di_dominio_invariate(self):
+        from django.core.exceptions import ValidationError
+        with self.assertRaisesMessage(ValidationError, 'Non puoi inserire presenze future'):
+            Registro.objects.create(
+                partecipante=self.partecipante, data=date.today() + timedelta(days=1), ore_totali=Decimal('8')
+            )
+        with self.assertRaisesMessage(ValidationError, 'Le assenze non possono superare le ore totali'):
+            Registro.objects.create(
+                partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('2'), assenze=Decimal('3')
+            )
+    
+    def test_full_clean_senza_errori_duplicati(self):
+        from django.core.exceptions import ValidationError
+        registro = Registro(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('2'), assenze=Decimal('3'))
+        with self.assertRaises(ValidationError) as errore:
+            registro.full_clean()
+        self.assertEqual(errore.exception.messages, ['Le assenze non possono superare le ore totali'])
+    
+    def test_vincoli_del_database(self):
+        Registro.objects.create(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('8'))
+        with self.assertRaises(IntegrityError):
+            Registro.objects.create(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('8'))
+        with self.assertRaises(IntegrityError):
+            Registro.objects.bulk_create([Registro(
+                partecipante=self.partecipante, data=self.ieri - timedelta(days=1),
+                ore_totali=Decimal('2'), assenze=Decimal('3')
+            )])
+    
+    def test_api_update(self):
+        client = APIClient()
+        client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        registro = Registro.objects.create(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('8'))
+        Registro.objects.create(partecipante=self.partecipante, data=date.today(), ore_totali=Decimal('8'))
+        
+        risposta = client.patch(f'/api/registro/{registro.pk}/', {'data': str(date.today())}, format='json')
+        self.assertEqual(risposta.status_code, 400)
+        self.assertIn('non_field_errors', risposta.json())
+        
+        risposta = client.patch(f'/api/registro/{registro.pk}/', {'assenze': '9'}, format='json')
+        self.assertEqual(risposta.json(), {'assenze': ['Le ore di assenza non possono superare le ore totali.']})
+        
+        risposta = client.patch(f'/api/registro/{registro.pk}/', {'assenze': '2'}, format='json')
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(RiepilogoPresenze.objects.get().totale_assenze, Decimal('2.00'))
+    
+    def test_errore_di_chiave_esterna_non_e_unicita(self):
+        client = APIClient()
+        client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        registro = Registro.objects.create(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('8'))
+        
+        # Partecipante eliminato tra la validazione e la scrittura
+        errore = IntegrityError('FOREIGN KEY constraint failed')
+        with mock.patch.object(Registro, 'save', side_effect=errore):
+            risposta = client.patch(f'/api/registro/{registro.pk}/', {'assenze': '2'}, format='json')
+        self.assertEqual(risposta.status_code, 400)
+        self.assertEqual(risposta.json(), ERRORE_INTEGRITA)
+        
+        errore = IntegrityError('UNIQUE constraint failed: registro_registro.partecipante_id, registro_registro.data')
+        with mock.patch.object(Registro, 'save', side_effect=errore):
+            risposta = client.patch(f'/api/registro/{registro.pk}/', {'assenze': '2'}, format='json')
+        self.assertEqual(risposta.json(), ERRORE_UNICITA)
+
+
+class RegistroListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        oggi = date.today()
+        for username in ('part1', 'part2', 'part3'):
+            partecipante = crea_partecipante(username)
+            for giorni_fa in range(5):
+                Registro.objects.create(
+                    partecipante=partecipante,
+                    data=oggi - timedelta(days=giorni_fa),
+                    ore_totali=Decimal('8.00')
+                )
+    
+    def test_pagina_in_una_query(self):
+        # L'ETag è calcolato dalle righe della pagina: nessuna query in più
+        with self.assertNumQueries(1):
+            risposta = self.client.get('/api/registro/', {'page_size': 4})
+        self.assertEqual(len(risposta.json()['results']), 4)
+        self.assertEqual(risposta.json()['results'][0]['partecipante_nome'], 'Part3')
+    
+    def test_cursore_avanti_e_indietro(self):
+        pagine = []
+        url = '/api/registro/?page_size=4'
+        while url:
+            dati = self.client.get(url).json()
+            pagine.append([(r['data'], r['partecipante']) for r in dati['results']])
+            url = dati['next']
+        
+        visti = [chiave for pagina in pagine for chiave in pagina]
+        self.assertEqual(len(visti), 15)
+        self.assertEqual(len(set(visti)), 15)
+        self.assertEqual(visti, sorted(visti, reverse=True))
+        
+        indietro = self.client.get(dati['previous']).json()
+        self.assertEqual([(r['data'], r['partecipante']) for r in indietro['results']], pagine[-2])
+    
+    def test_cursore_non_valido(self):
+        risposta = self.client.get('/api/registro/', {'cursor': 'xyz'})
+        self.assertEqual(risposta.status_code, 404)
+    
+    def test_uguale_al_serializer(self):
+        # La lista è letta con values(): stesso JSON del serializer, anche per
+        # percentuali a metà tra due centesimi (arrotondate al pari) e ore a zero
+        partecipante = crea_partecipante('part4')
+        valori = [
+            ('8.00', '0.03'), ('8.00', '0.01'), ('8.00', '0.05'), ('0.00', '0.00'),
+            ('7.97', '1.30'), ('99.48', '97.30'), ('3.33', '0.01'), ('6.00', '6.00'),
+        ]
+        for giorni_fa, (ore, assenze) in enumerate(valori):
+            Registro.objects.create(
+                partecipante=partecipante,
+                data=date.today() - timedelta(days=10 + giorni_fa),
+                ore_totali=Decimal(ore),
+                assenze=Decimal(assenze)
+            )
+        
+        risultati = self.client.get('/api/registro/', {'page_size': 1000}).json()['results']
+        
+        attesi = RegistroSerializer(Registro.objects.order_by('-data', '-id'), many=True).data
+        self.assertEqual(len(risultati), 23)
+        self.assertEqual(risultati, json.loads(JSONRenderer().render(attesi)))
+
+
+class RegistroCondizionaleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        verifica_utenti.svuota()
+        self.admin = Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.partecipante = crea_partecipante('part1')
+        self.registri = [
+            Registro.objects.create(
+                partecipante=self.partecipante,
+                data=date.today() - timedelta(days=giorni),
+                ore_totali=Decimal('8.00')
+            )
+            for giorni in range(3)
+        ]
+    
+    def test_lista_non_modificata(self):
+        risposta = self.client.get('/api/registro/')
+        etag = risposta['ETag']
+        self.assertNotIn('Last-Modified', risposta)
+        
+        # Solo la query della pagina, nessuna serializzazione
+        with self.assertNumQueries(1):
+            risposta = self.client.get('/api/registro/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 304)
+        self.assertEqual(risposta.content, b'')
+        
+        # Pagine e filtri diversi hanno ETag diversi
+        self.assertNotEqual(self.client.get('/api/registro/', {'page_size': 1})['ETag'], etag)
+    
+    def test_lista_modificata(self):
+        etag = self.client.get('/api/registro/')['ETag']
+        registro = self.registri[1]
+        registro.assenze = Decimal('1.00')
+        registro.save()
+        
+        risposta = self.client.get('/api/registro/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 200)
+        
+        etag = risposta['ETag']
+        Registro.objects.filter(pk=self.registri[0].pk).delete()
+        self.assertEqual(self.client.get('/api/registro/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_pagina_dipende_solo_dalle_sue_righe(self):
+        url = '/api/registro/?page_size=1'
+        etag = self.client.get(url)['ETag']
+        
+        # Modifica fuori dalla pagina: stessa risposta, ancora 304
+        registro = self.registri[2]
+        registro.assenze = Decimal('1.00')
+        registro.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        # Il nome del partecipante fa parte della risposta
+        utente = self.partecipante.utente
+        utente.nome = 'Rinominato'
+        utente.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_stats(self):
+        url = f'/api/partecipante/{self.partecipante.pk}/stats/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        self.client.put('/api/registro/update_registro/batch/', [{
+            'partecipante': self.partecipante.pk, 'data': str(date.today()),
+            'ore_totali': '8', 'assenze': '2',
+        }], format='json')
+        risposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(risposta.json()['totale_assenze'], '2.00')
+        
+        etag = risposta['ETag']
+        utente = self.partecipante.utente
+        utente.email = 'nuova@example.com'
+        utente.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_lista_asincrona(self):
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=bearer(self.admin))
+        etag = self.client.get('/api/async/registro/')['ETag']
+        
+        risposta = self.client.get('/api/async/registro/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(risposta.status_code, 304)
+
+
+class RegistroSyncTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        self.partecipanti = [crea_partecipante('part1'), crea_partecipante('part2')]
+        self.registri = [
+            Registro.objects.create(
+                partecipante=partecipante,
+                data=date.today() - timedelta(days=giorni),
+                ore_totali=Decimal('8.00')
+            )
+            for partecipante in self.partecipanti
+            for giorni in range(3)
+        ]
+    
+    def sincronizza(self, cursore=None, **parametri):
+        if cursore:
+            parametri['cursor'] = cursore
+        risposta = self.client.get('/api/registro/sync/', parametri)
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.json()
+    
+    def test_prima_sincronizzazione_e_incrementi(self):
+        dati = self.sincronizza()
+        self.assertEqual(len(dati['modificati']), 6)
+        self.assertFalse(dati['altri'])
+        self.assertIn('updated_at', dati['modificati'][0])
+        
+        vuota = self.sincronizza(dati['cursor'])
+        self.assertEqual((vuota['modificati'], vuota['eliminati']), ([], []))
+        
+        registro = self.registri[4]
+        registro.assenze = Decimal('2.00')
+        registro.save()
+        eliminato_id = self.registri[0].pk
+        self.registri[0].delete()
+        
+        dati = self.sincronizza(vuota['cursor'])
+        self.assertEqual([r['id'] for r in dati['modificati']], [registro.pk])
+        self.assertEqual(dati['modificati'][0]['assenze'], '2.00')
+        self.assertEqual([e['id'] for e in dati['eliminati']], [eliminato_id])
+        self.assertEqual(self.sincronizza(dati['cursor'])['eliminati'], [])
+    
+    def test_pagine_con_limite(self):
+        visti = []
+        cursore = None
+        while True:
+            dati = self.sincronizza(cursore, limit=4)
+            visti += [r['id'] for r in dati['modificati']]
+            cursore = dati['cursor']
+            if not dati['altri']:
+                break
+        self.assertEqual(sorted(visti), sorted(r.pk for r in self.registri))
+    
+    def test_visibilita_partecipante(self):
+        RegistroEliminato.objects.create(registro_id=999, partecipante_id=self.partecipanti[1].pk, data=date.today())
+        self.client.force_authenticate(self.partecipanti[0].utente)
+        
+        dati = self.sincronizza()
+        
+        self.assertEqual({r['partecipante'] for r in dati['modificati']}, {self.partecipanti[0].pk})
+        self.assertEqual(dati['eliminati'], [])
+    
+    def test_ordine_dei_commit_non_dell_orologio(self):
+        from .bulk import aggiorna_registri
+        cursore = self.sincronizza()['cursor']
+        
+        # Transazione iniziata prima dell'ultima sincronizzazione: updated_at
+        # nel passato, ma la sequenza è assegnata nell'ordine dei commit
+        registro = self.registri[2]
+        passato = timezone.now() - timedelta(days=1)
+        with mock.patch('registro.bulk.timezone.now', return_value=passato):
+            aggiorna_registri([{
+                'partecipante': registro.partecipante_id, 'data': str(registro.data),
+                'ore_totali': '8', 'assenze': '1',
+            }])
+        
+        dati = self.sincronizza(cursore)
+        self.assertEqual([r['id'] for r in dati['modificati']], [registro.pk])
+    
+    def test_cursore_scaduto_dopo_la_pulizia(self):
+        vecchio = self.sincronizza()['cursor']
+        self.registri[0].delete()
+        recente = self.sincronizza(vecchio)['cursor']
+        
+        with override_settings(REGISTRO_SYNC_CONSERVAZIONE_GIORNI=0):
+            call_command('pulisci_eliminati', stdout=StringIO())
+        self.assertFalse(RegistroEliminato.objects.exists())
+        
+        # Il vecchio cursore non ha visto l'eliminazione rimossa: si riparte da capo
+        risposta = self.client.get('/api/registro/sync/', {'cursor': vecchio})
+        self.assertEqual(risposta.status_code, 410)
+        self.assertEqual(len(self.sincronizza()['modificati']), 5)
+        # Chi l'aveva già ricevuta continua normalmente
+        self.assertEqual(self.sincronizza(recente)['eliminati'], [])
+    
+    def test_cursore_non_valido(self):
+        risposta = self.client.get('/api/registro/sync/', {'cursor': 'xyz'})
+        self.assertEqual(risposta.status_code, 400)
+
+
+class RegistroBulkTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        self.client.force_authenticate(self.admin)
+        self.partecipante = crea_partecipante('part1')
+        self.ieri = date.today() - timedelta(days=1)
+    
+    def test_valori_fuori_intervallo(self):
+        righe = [
+            {'partecipante': self.partecipante.pk, 'data': str(self.ieri), 'ore_totali': '1e1000'},
+            {'partecipante': self.partecipante.pk, 'data': str(self.ieri), 'ore_totali': '8', 'assenze': '-1e1000'},
+            {'partecipante': 10 ** 30, 'data': str(self.ieri), 'ore_totali': '8'},
+            {'partecipante': 0, 'data': str(self.ieri), 'ore_totali': '8'},
+        ]
+        risposta = self.client.post('/api/registro/bulk/', righe, format='json')
+        
+        self.assertEqual(risposta.status_code, 400)
+        errori = {e['riga']: e['errori'] for e in risposta.json()['errori']}
+        self.assertEqual(errori[0], {'ore_totali': 'Il valore deve essere minore o uguale a 99.99.'})
+        self.assertEqual(errori[1], {'assenze': 'Il valore deve essere maggiore o uguale a 0.00.'})
+        self.assertEqual(errori[2], {'partecipante': 'Id partecipante non valido.'})
+        self.assertEqual(errori[3], {'partecipante': 'Id partecipante non valido.'})
+        self.assertFalse(Registro.objects.exists())
+    
+    def test_inserimento_json(self):
+        righe = [
+            {'partecipante': self.partecipante.pk, 'data': str(self.ieri), 'ore_totali': '8', 'assenze': '2'},
+            {'partecipante': self.partecipante.pk, 'data': str(date.today()), 'ore_totali': '4.5'},
+        ]
+        risposta = self.client.post('/api/registro/bulk/', righe, format='json')
+        
+        self.assertEqual(risposta.status_code, 201)
+        self.assertEqual(risposta.json(), {'creati': 2})
+        riepilogo = RiepilogoPresenze.objects.get(partecipante=self.partecipante)
+        self.assertEqual(riepilogo.totale_giorni, 2)
+        self.assertEqual(riepilogo.totale_ore, Decimal('12.50'))
+        self.assertEqual(RiepilogoPresenze.verifica(), [])
+    
+    def test_inserimento_csv(self):
+        csv = (
+            'partecipante,data,ore_totali,assenze,note\n'
+            f'{self.partecipante.pk},{self.ieri},8.00,1.00,Ritardo\n'
+        )
+        risposta = self.client.post('/api/registro/bulk/', csv, content_type='text/csv')
+        
+        self.assertEqual(risposta.status_code, 201)
+        self.assertEqual(Registro.objects.get().note, 'Ritardo')
+    
+    def test_errori_per_riga_e_nessuna_scrittura(self):
+        Registro.objects.create(partecipante=self.partecipante, data=self.ieri, ore_totali=Decimal('8'))
+        domani = date.today() + timedelta(days=1)
+        righe = [
+            {'partecipante': self.partecipante.pk, 'data': str(date.today()), 'ore_totali': '8'},
+            {'partecipante': self.partecipante.pk, 'data': str(domani), 'ore_totali': '8'},
+            {'partecipante': self.partecipante.pk, 'data': str(date.today()), 'ore_totali': '2', 'assenze': '3'},
+            {'partecipante': self.partecipante.pk, 'data': str(self.ieri), 'ore_totali': '8'},
+            {'partecipante': self.partecipante.pk, 'data': str(date.today()), 'ore_totali': '8'},
+            {'partecipante': 999, 'data': str(self.ieri), 'ore_totali': '8'},
+        ]
+        risposta = self.client.post('/api/registro/bulk/', righe, format='json')
+        
+        self.assertEqual(risposta.status_code, 400)
+        errori = {e['riga']: e['errori'] for e in risposta.json()['errori']}
+        self.assertEqual(sorted(errori), [1, 2, 3, 4, 5])
+        self.assertEqual(errori[1]['data'], 'Non puoi inserire presenze future')
+        self.assertEqual(errori[2]['assenze'], 'Le assenze non possono superare le ore totali')
+        self.assertEqual(Registro.objects.count(), 1)
+    
+    def test_solo_admin(self):
+        self.client.force_authenticate(self.partecipante.utente)
+        risposta = self.client.post('/api/registro/bulk/', [], format='json')
+        self.assertEqual(risposta.status_code, 403)
+
+
+class RegistroBatchUpdateTest(TestCase):
+    URL = '/api/registro/update_registro/batch/'
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        self.partecipanti = [crea_partecipante('part1'), crea_partecipante('part2')]
+        self.giorni = [date.today() - timedelta(days=g) for g in range(3)]
+        for partecipante in self.partecipanti:
+            for giorno in self.giorni:
+                Registro.objects.create(partecipante=partecipante, data=giorno, ore_totali=Decimal('8'))
+    
+    def riga(self, partecipante, giorno, ore_totali='8', assenze='0'):
+        return {'partecipante': partecipante.pk, 'data': str(giorno),
+                'ore_totali': ore_totali, 'assenze': assenze}
+    
+    def test_valore_enorme(self):
+        righe = [self.riga(self.partecipanti[0], self.giorni[0], ore_totali='1e1000')]
+        risposta = self.client.put(self.URL, righe, format='json')
+        
+        self.assertEqual(risposta.status_code, 400)
+        self.assertEqual(
+            risposta.json()['errori'],
+            [{'riga': 0, 'errori': {'ore_totali': 'Il valore deve essere minore o uguale a 99.99.'}}]
+        )
+    
+    def test_aggiornamento(self):
+        righe = [
+            self.riga(self.partecipanti[0], self.giorni[0], assenze='2'),
+            self.riga(self.partecipanti[1], self.giorni[2], ore_totali='6', assenze='1.5'),
+        ]
+        risposta = self.client.put(self.URL, righe, format='json')
+        
+        self.assertEqual(risposta.status_code, 200)
+        dati = risposta.json()
+        self.assertEqual(dati['aggiornati'], 2)
+        self.assertEqual([r['riga'] for r in dati['risultati']], [0, 1])
+        self.assertEqual(dati['risultati'][1]['registro']['ore_totali'], '6.00')
+        self.assertEqual(dati['risultati'][1]['registro']['partecipante_nome'], 'Part2')
+        
+        registro = Registro.objects.get(partecipante=self.partecipanti[1], data=self.giorni[2])
+        self.assertEqual((registro.ore_totali, registro.assenze), (Decimal('6.00'), Decimal('1.50')))
+        self.assertEqual(RiepilogoPresenze.verifica(), [])
+        riepilogo = RiepilogoPresenze.objects.get(partecipante=self.partecipanti[0])
+        self.assertEqual(riepilogo.totale_assenze, Decimal('2.00'))
+    
+    def test_numero_query_costante(self):
+        righe = [self.riga(p, g, assenze='1') for p in self.partecipanti for g in self.giorni]
+        # Contatore delle modifiche (incremento e lettura), lettura, update,
+        # riepiloghi (uno per partecipante) e savepoint della transazione
+        with self.assertNumQueries(6 + len(self.partecipanti)):
+            risposta = self.client.put(self.URL, righe, format='json')
+        self.assertEqual(risposta.json()['aggiornati'], 6)
+        self.assertEqual(RiepilogoPresenze.verifica(), [])
+    
+    def test_errori_per_riga_e_nessuna_scrittura(self):
+        futuro = date.today() + timedelta(days=1)
+        righe = [
+            self.riga(self.partecipanti[0], self.giorni[0], assenze='1'),
+            self.riga(self.partecipanti[0], self.giorni[1], ore_totali='2', assenze='3'),
+            self.riga(self.partecipanti[0], self.giorni[0], assenze='1'),
+            {'partecipante': self.partecipanti[0].pk, 'data': str(self.giorni[2]), 'ore_totali': '8'},
+        ]
+        risposta = self.client.put(self.URL, righe, format='json')
+        
+        self.assertEqual(risposta.status_code, 400)
+        errori = {e['riga']: e['errori'] for e in risposta.json()['errori']}
+        self.assertEqual(sorted(errori), [1, 2, 3])
+        self.assertEqual(errori[1]['assenze'], 'Le assenze non possono superare le ore totali')
+        self.assertIn('assenze', errori[3])
+        
+        risposta = self.client.put(self.URL, [
+            self.riga(self.partecipanti[0], self.giorni[0], assenze='1'),
+            self.riga(self.partecipanti[0], futuro),
+        ], format='json')
+        
+        self.assertEqual(risposta.status_code, 400)
+        self.assertEqual(risposta.json()['errori'][0]['riga'], 1)
+        self.assertFalse(Registro.objects.filter(assenze__gt=0).exists())
+    
+    def test_solo_admin(self):
+        self.client.force_authenticate(self.partecipanti[0].utente)
+        risposta = self.client.put(self.URL, [], format='json')
+        self.assertEqual(risposta.status_code, 403)
+
+
+class RegistroUpsertTest(TestCase):
+    URL = '/api/registro/update_registro/?upsert=true'
+    
+    def setUp(self):
+        self.client = APIClient()
+        utente = Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        self.admin = Admin.objects.create(utente=utente)
+        self.client.force_authenticate(utente)
+        self.partecipante = crea_partecipante('part1')
+        self.ieri = date.today() - timedelta(days=1)
+    
+    def upsert(self, ore_totali, assenze):
+        return self.client.put(self.URL, {
+            'partecipante': self.partecipante.pk, 'data': str(self.ieri),
+            'ore_totali': ore_totali, 'assenze': assenze,
+        }, format='json')
+    
+    def test_crea_poi_aggiorna(self):
+        risposta = self.upsert('8', '1')
+        
+        self.assertEqual(risposta.status_code, 201)
+        self.assertEqual(risposta.json()['assenze'], '1.00')
+        registro = Registro.objects.get()
+        self.assertEqual(registro.created_by, self.admin)
+        
+        risposta = self.upsert('6', '2')
+        
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(risposta.json()['ore_totali'], '6.00')
+        self.assertEqual(Registro.objects.get().pk, registro.pk)
+        riepilogo = RiepilogoPresenze.objects.get(partecipante=self.partecipante)
+        self.assertEqual((riepilogo.totale_giorni, riepilogo.totale_ore), (1, Decimal('6.00')))
+        self.assertEqual(RiepilogoPresenze.verifica(), [])
+    
+    def test_rilettura_nella_transazione(self):
+        with CaptureQueriesContext(connection) as query:
+            self.upsert('8', '1')
+        
+        sql = [q['sql'] for q in query.captured_queries]
+        rilettura = next(
+            i for i, q in enumerate(sql)
+            if q.startswith('SELECT') and 'FROM "registro_registro" INNER JOIN' in q
+        )
+        # Il savepoint dell'upsert (la transazione nei test) si chiude dopo la rilettura
+        fine_transazione = max(i for i, q in enumerate(sql) if q.startswith('RELEASE SAVEPOINT'))
+        self.assertLess(rilettura, fine_transazione)
+    
+    def test_validazione(self):
+        risposta = self.upsert('2', '3')
+        
+        self.assertEqual(risposta.status_code, 400)
+        self.assertEqual(risposta.json(), {'assenze': ['Le assenze non possono superare le ore totali']})
+        self.assertFalse(Registro.objects.exists())
+    
+    def test_senza_upsert_resta_404(self):
+        risposta = self.client.put('/api/registro/update_registro/', {
+            'partecipante': self.partecipante.pk, 'data': str(self.ieri), 'ore_totali': '8', 'assenze': '0',
+        }, format='json')
+        self.assertEqual(risposta.status_code, 404)
+
+
+class RegistroExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.partecipante = crea_partecipante('part1')
+        altro = crea_partecipante('part2')
+        oggi = date.today()
+        for partecipante in (self.partecipante, altro):
+            for giorni_fa in range(3):
+                Registro.objects.create(
+                    partecipante=partecipante,
+                    data=oggi - timedelta(days=giorni_fa),
+                    ore_totali=Decimal('8.00'),
+                    assenze=Decimal('1.00'),
+                    note='Nota, con virgola'
+                )
+    
+    def scarica(self, formato):
+        risposta = self.client.get('/api/registro/export/', {'format': formato})
+        self.assertEqual(risposta.status_code, 200)
+        return b''.join(risposta.streaming_content).decode()
+    
+    def test_csv_solo_propri_registri(self):
+        self.client.force_authenticate(self.partecipante.utente)
+        
+        righe = list(csv.DictReader(self.scarica('csv').splitlines()))
+        
+        self.assertEqual(len(righe), 3)
+        self.assertEqual({r['partecipante'] for r in righe}, {str(self.partecipante.pk)})
+        self.assertEqual(righe[0]['note'], 'Nota, con virgola')
+        self.assertEqual(righe[0]['percentuale_presenza'], '87.5')
+    
+    def test_ndjson_uguale_alla_lista(self):
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        
+        esportati = [json.loads(riga) for riga in self.scarica('ndjson').splitlines()]
+        lista = self.client.get('/api/registro/').json()['results']
+        
+        self.assertEqual(len(esportati), 6)
+        for esportato, elemento in zip(esportati, lista):
+            for campo, valore in elemento.items():
+                self.assertEqual(esportato[campo], valore, campo)
+    
+    def test_server_timing_con_rendering(self):
+        self.client.force_authenticate(self.partecipante.utente)
+        intestazione = self.client.get('/api/registro/')['Server-Timing']
+        
+        render = float(re.search(r'render;dur=([\d.]+)', intestazione).group(1))
+        view = float(re.search(r'view;dur=([\d.]+)', intestazione).group(1))
+        self.assertLessEqual(render, view)
+        self.assertIn('desc="', intestazione)
+    
+    def test_metriche_di_serializzazione(self):
+        self.client.force_authenticate(self.partecipante.utente)
+        metriche.azzera()
+        intestazione = self.client.get('/api/registro/')['Server-Timing']
+        
+        serializzazione = float(re.search(r'serializzazione;dur=([\d.]+)', intestazione).group(1))
+        view = float(re.search(r'view;dur=([\d.]+)', intestazione).group(1))
+        self.assertLessEqual(serializzazione, view)
+        # L'header ha la risoluzione di 0.1 ms, l'istogramma no
+        somma = re.search(
+            r'gp_serializzazione_durata_secondi_sum\{route="registro-list",method="GET"\} ([\d.]+)',
+            metriche.prometheus()
+        )
+        self.assertGreater(float(somma.group(1)), 0)
+    
+    def test_metriche_includono_le_query_dello_stream(self):
+        self.client.force_authenticate(self.partecipante.utente)
+        metriche.azzera()
+        
+        risposta = self.client.get('/api/registro/export/', {'format': 'csv'})
+        # Registrate solo a fine stream
+        self.assertNotIn('gp_sql_query_count{route="registro-export"', metriche.prometheus())
+        b''.join(risposta.streaming_content)
+        risposta.close()
+        
+        esportazione = metriche.prometheus()
+        self.assertIn('gp_sql_query_count{route="registro-export",method="GET"} 1', esportazione)
+        self.assertNotIn('gp_sql_query_sum{route="registro-export",method="GET"} 0', esportazione)
+
+
+class RegistroMatriceTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.oggi = date.today()
+        self.bianchi = crea_partecipante('bianchi')
+        self.bianchi.utente.cognome = 'Bianchi'
+        self.bianchi.utente.save()
+        self.rossi = crea_partecipante('rossi')
+        self.rossi.utente.cognome = 'Rossi'
+        self.rossi.utente.save()
+        for giorni_fa in range(3):
+            Registro.objects.create(
+                partecipante=self.rossi,
+                data=self.oggi - timedelta(days=giorni_fa),
+                ore_totali=Decimal('8.00'),
+                assenze=Decimal(giorni_fa)
+            )
+        # Bianchi manca il giorno intermedio
+        for giorni_fa in (0, 2):
+            Registro.objects.create(
+                partecipante=self.bianchi,
+                data=self.oggi - timedelta(days=giorni_fa),
+                ore_totali=Decimal('6.00')
+            )
+    
+    def test_matrice_in_una_query(self):
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        
+        with self.assertNumQueries(1):
+            risposta = self.client.get('/api/registro/matrix/')
+        
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(risposta.json(), {
+            'date': [str(self.oggi - timedelta(days=giorni_fa)) for giorni_fa in (2, 1, 0)],
+            'partecipanti': {
+                'id': [self.bianchi.pk, self.rossi.pk],
+                'nome': ['Bianchi', 'Rossi'],
+                'cognome': ['Bianchi', 'Rossi'],
+            },
+            'ore_totali': [[6.0, None, 6.0], [8.0, 8.0, 8.0]],
+            'assenze': [[0.0, None, 0.0], [2.0, 1.0, 0.0]],
+        })
+    
+    def test_intervallo_e_visibilita_partecipante(self):
+        self.client.force_authenticate(self.rossi.utente)
+        
+        dati = self.client.get('/api/registro/matrix/', {
+            'data_inizio': str(self.oggi - timedelta(days=1)),
+            'data_fine': str(self.oggi),
+        }).json()
+        
+        self.assertEqual(dati['partecipanti']['id'], [self.rossi.pk])
+        self.assertEqual(len(dati['date']), 2)
+        self.assertEqual(dati['assenze'], [[1.0, 0.0]])
+    
+    def test_date_non_valide(self):
+        self.client.force_authenticate(self.rossi.utente)
+        risposta = self.client.get('/api/registro/matrix/', {'data_inizio': '30/01/2026'})
+        self.assertEqual(risposta.status_code, 400)
+
+
+class RegistroFormatiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        partecipante = crea_partecipante('part1')
+        for giorni_fa in range(3):
+            Registro.objects.create(
+                partecipante=partecipante,
+                data=date.today() - timedelta(days=giorni_fa),
+                ore_totali=Decimal('8.00'),
+                assenze=Decimal('1.50')
+            )
+    
+    def json(self):
+        return self.client.get('/api/registro/', {'page_size': 2}).json()
+    
+    def test_colonnare(self):
+        attesa = self.json()
+        
+        risposta = self.client.get('/api/registro/', {'page_size': 2, 'format': 'columnar'})
+        
+        self.assertEqual(risposta['Content-Type'], 'application/vnd.columnar+json')
+        dati = risposta.json()
+        self.assertIn('format=columnar', dati['next'])
+        self.assertEqual(dati['columns'], list(attesa['results'][0]))
+        self.assertEqual(len(dati['rows']), 2)
+        riga = dict(zip(dati['columns'], dati['rows'][0]))
+        # Decimali come numeri invece che stringhe
+        self.assertEqual(riga['ore_totali'], 8.0)
+        self.assertEqual(riga['assenze'], 1.5)
+        self.assertEqual({**riga, 'ore_totali': '8.00', 'assenze': '1.50'}, attesa['results'][0])
+    
+    def test_colonnare_da_accept(self):
+        risposta = self.client.get('/api/registro/', HTTP_ACCEPT='application/vnd.columnar+json')
+        self.assertIn('rows', risposta.json())
+    
+    @skipUnless(msgpack, 'richiede il pacchetto msgpack')
+    def test_msgpack(self):
+        colonnare = self.client.get('/api/registro/', {'page_size': 2, 'format': 'columnar'}).json()
+        
+        risposta = self.client.get('/api/registro/', {'page_size': 2}, HTTP_ACCEPT='application/msgpack')
+        
+        self.assertEqual(risposta['Content-Type'], 'application/msgpack')
+        dati = msgpack.unpackb(risposta.content)
+        self.assertEqual(
+            [dict(zip(colonnare['columns'], riga)) for riga in colonnare['rows']],
+            dati['results']
+        )
+    
+    def test_etag_diverso_per_formato(self):
+        self.assertNotEqual(
+            self.client.get('/api/registro/')['ETag'],
+            self.client.get('/api/registro/', HTTP_ACCEPT='application/vnd.columnar+json')['ETag']
+        )
+
+
+class RegistroCampiParzialiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        self.partecipante = crea_partecipante('part1')
+        for giorni_fa in range(3):
+            Registro.objects.create(
+                partecipante=self.partecipante,
+                data=date.today() - timedelta(days=giorni_fa),
+                ore_totali=Decimal('8.00'),
+                assenze=Decimal('2.00'),
+                note='Nota'
+            )
+    
+    def pagina(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            risposta = self.client.get('/api/registro/', params)
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        return risposta.json()['results'], ctx.captured_queries[-1]['sql']
+    
+    def test_colonne_per_tutti_i_campi(self):
+        from .views import COLONNE_CAMPI
+        self.assertEqual(list(COLONNE_CAMPI), list(RegistroSerializer().fields))
+    
+    def test_fields_senza_join(self):
+        completi, _ = self.pagina()
+        
+        risultati, sql = self.pagina(fields='data,ore_presenti,percentuale_presenza')
+        
+        self.assertEqual(
+            risultati,
+            [{campo: r[campo] for campo in ('data', 'ore_presenti', 'percentuale_presenza')} for r in completi]
+        )
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"note"', sql)
+        self.assertNotIn('"created_at"', sql)
+    
+    def test_fields_con_nomi(self):
+        risultati, sql = self.pagina(fields='partecipante_cognome')
+        
+        self.assertEqual(risultati[0], {'partecipante_cognome': 'Test'})
+        self.assertIn('"partecipante_utente"', sql)
+        self.assertNotIn('"username"', sql)
+    
+    def test_exclude(self):
+        risultati, sql = self.pagina(exclude='partecipante_nome,partecipante_cognome,created_at')
+        
+        self.assertEqual(
+            list(risultati[0]),
+            ['partecipante', 'data', 'ore_totali', 'assenze', 'ore_presenti', 'percentuale_presenza']
+        )
+        self.assertNotIn('JOIN', sql)
+    
+    def test_campo_sconosciuto(self):
+        risposta = self.client.get('/api/registro/', {'fields': 'data,password'})
+        self.assertEqual(risposta.status_code, 400)
+        self.assertIn('password', risposta.json()['fields'])
+    
+    def test_dettaglio(self):
+        registro = Registro.objects.first()
+        self.client.force_authenticate(self.partecipante.utente)
+        
+        risposta = self.client.get(f'/api/registro/{registro.pk}/', {'fields': 'assenze'})
+        
+        self.assertEqual(risposta.json(), {'assenze': '2.00'})
+
+
+
+class RegistroAdminTest(TestCase):
+    def setUp(self):
+        self.admin = Utente.objects.create(
+            username='admin1', nome='Admin', cognome='Test', ruolo='admin',
+            is_staff=True, is_superuser=True
+        )
+        self.admin_profile = Admin.objects.create(utente=self.admin)
+        self.client.force_login(self.admin)
+        self.giorno = 0
+    
+    def crea_registri(self, quanti):
+        for i in range(quanti):
+            partecipante = crea_partecipante(f'part{self.giorno}')
+            Registro.objects.create(
+                partecipante=partecipante,
+                data=date.today() - timedelta(days=self.giorno),
+                ore_totali=Decimal('8.00'),
+                assenze=Decimal(self.giorno % 5),
+                created_by=self.admin_profile
+            )
+            self.giorno += 1
+    
+    def changelist(self, **params):
+        risposta = self.client.get('/admin/registro/registro/', params)
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.context['cl']
+    
+    def test_form_senza_sequenza(self):
+        risposta = self.client.get('/admin/registro/registro/add/')
+        self.assertNotIn('sequenza', risposta.context['adminform'].form.fields)
+        
+        partecipante = crea_partecipante('part1')
+        risposta = self.client.post('/admin/registro/registro/add/', {
+            'partecipante': partecipante.pk,
+            'data': str(date.today()),
+            'ore_totali': '8.00',
+            'assenze': '1.00',
+        })
+        self.assertEqual(risposta.status_code, 302)
+        # Assegnata dal contatore al salvataggio
+        self.assertGreater(Registro.objects.get().sequenza, 0)
+    
+    def test_errore_assenze_una_sola_volta(self):
+        partecipante = crea_partecipante('part1')
+        risposta = self.client.post('/admin/registro/registro/add/', {
+            'partecipante': partecipante.pk,
+            'data': str(date.today()),
+            'ore_totali': '2.00',
+            'assenze': '3.00',
+        })
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(
+            risposta.context['adminform'].form.non_field_errors(),
+            ['Le assenze non possono superare le ore totali']
+        )
+        self.assertFalse(Registro.objects.exists())
+    
+    def test_numero_query_costante(self):
+        self.crea_registri(5)
+        with CaptureQueriesContext(connection) as poche:
+            self.changelist()
+        
+        self.crea_registri(20)
+        Admin.objects.create(
+            utente=Utente.objects.create(username='admin2', nome='Altro', cognome='Admin', ruolo='admin')
+        )
+        with CaptureQueriesContext(connection) as molte:
+            cl = self.changelist()
+        
+        self.assertEqual(len(molte), len(poche))
+        self.assertEqual(cl.result_count, 25)
+    
+    def test_colonne_calcolate_ordinabili(self):
+        self.crea_registri(6)
+        colonna = RegistroAdmin.list_display.index('percentuale_presenza')
+        
+        cl = self.changelist(o=f'{colonna}')
+        
+        percentuali = [registro.percentuale_presenza() for registro in cl.result_list]
+        self.assertEqual(percentuali, sorted(percentuali))
+        self.assertEqual(
+            [registro.percentuale_calcolata for registro in cl.result_list],
+            [float(percentuale) for percentuale in percentuali]
+        )
+        self.assertEqual(
+            [registro.ore_presenti_calcolate for registro in cl.result_list],
+            [float(registro.ore_presenti()) for registro in cl.result_list]
+        )
+    
+    def test_conteggio_stimato(self):
+        self.crea_registri(6)
+        Registro.objects.order_by('id').first().delete()
+        
+        with override_settings(ADMIN_CONTEGGIO_STIMATO_DA=1):
+            # Senza statistiche del database (SQLite) il conteggio è esatto
+            self.assertEqual(self.changelist().result_count, 5)
+            with mock.patch('gestione_presenze.conteggio.stima_righe', return_value=1000):
+                self.assertEqual(self.changelist().result_count, 1000)
+                # Con filtri il conteggio resta esatto
+                self.assertEqual(self.changelist(created_by__exact=self.admin_profile.pk).result_count, 5)
+        with override_settings(ADMIN_CONTEGGIO_STIMATO_DA=None):
+            self.assertEqual(self.changelist().result_count, 5)
+
+
+class RegistroSummaryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        )
+        self.lunedi = date.today() - timedelta(days=date.today().weekday() + 7)
+        self.partecipanti = [crea_partecipante('part1'), crea_partecipante('part2')]
+        for partecipante in self.partecipanti:
+            for giorni in range(4):
+                Registro.objects.create(
+                    partecipante=partecipante,
+                    data=self.lunedi + timedelta(days=giorni * 3),
+                    ore_totali=Decimal('8.00'),
+                    assenze=Decimal('2.00') if partecipante is self.partecipanti[0] else Decimal('0.00')
+                )
+    
+    def test_senza_raggruppamento(self):
+        dati = self.client.get('/api/registro/summary/').json()
+        self.assertEqual(dati['totale_record'], 8)
+        self.assertEqual(dati['percentuale_presenza_media'], 87.5)
+        self.assertNotIn('gruppi', dati)
+    
+    def test_per_settimana_con_intervallo(self):
+        dati = self.client.get('/api/registro/summary/', {
+            'group_by': 'week',
+            'data_inizio': str(self.lunedi + timedelta(days=1)),
+        }).json()
+        
+        self.assertEqual(dati['totale_record'], 6)
+        periodi = [(g['periodo'], g['totale_record']) for g in dati['gruppi']]
+        self.assertEqual(periodi, [
+            (str(self.lunedi), 4),
+            (str(self.lunedi + timedelta(days=7)), 2),
+        ])
+    
+    def test_per_partecipante(self):
+        dati = self.client.get('/api/registro/summary/', {'group_by': 'partecipante'}).json()
+        
+        percentuali = {g['partecipante']: g['percentuale_presenza_media'] for g in dati['gruppi']}
+        self.assertEqual(percentuali, {self.partecipanti[0].pk: 75.0, self.partecipanti[1].pk: 100.0})
+    
+    def test_parametri_non_validi(self):
+        self.assertEqual(self.client.get('/api/registro/summary/', {'group_by': 'anno'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/registro/summary/', {'data_fine': 'ieri'}).status_code, 400)
+
+    def test_cache_invalidata_dalle_scritture(self):
+        prima = self.client.get('/api/registro/summary/').json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/registro/summary/').json(), prima)
+        
+        Registro.objects.create(
+            partecipante=self.partecipanti[1],
+            data=date.today() - timedelta(days=1),
+            ore_totali=Decimal('4.00')
+        )
+        
+        dopo = self.client.get('/api/registro/summary/').json()
+        self.assertEqual(dopo['totale_record'], prima['totale_record'] + 1)
+        statistiche = self.client.get('/api/registro/cache_stats/').json()
+        self.assertGreaterEqual(statistiche['hit'], 1)
+        self.assertGreaterEqual(statistiche['miss'], 2)
+    
+    def test_cache_invalidata_dal_cambio_nome(self):
+        self.client.get('/api/registro/summary/', {'group_by': 'partecipante'})
+        utente = self.partecipanti[0].utente
+        utente.nome = 'Rinominato'
+        utente.save()
+        
+        dati = self.client.get('/api/registro/summary/', {'group_by': 'partecipante'}).json()
+        nomi = {g['partecipante']: g['partecipante_nome'] for g in dati['gruppi']}
+        self.assertEqual(nomi[utente.pk], 'Rinominato')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN è specifico di SQLite')
+class QueryPlanTest(TestCase):
+    """
+    Esegue EXPLAIN QUERY PLAN su ogni SELECT delle query più frequenti
+    (API e changelist admin) e fallisce se una tabella principale viene
+    letta per intero senza indice. Le scansioni attese (liste senza filtri
+    ordinate su un indice, aggregati sull'intera tabella) sono elencate
+    esplicitamente per ogni richiesta.
+    """
+    TABELLE = {
+        'registro_registro',
+        'registro_riepilogopresenze',
+        'partecipante_partecipante',
+        'partecipante_utente',
+    }
+    SCANSIONE_LISTA = 'SCAN registro_registro USING INDEX registro_data_idx'
+    
+    def setUp(self):
+        cache.clear()
+        self.admin = Utente.objects.create(
+            username='admin1', nome='Admin', cognome='Test', ruolo='admin',
+            is_staff=True, is_superuser=True
+        )
+        self.admin_profile = Admin.objects.create(utente=self.admin)
+        self.partecipante = crea_partecipante('part1')
+        self.oggi = date.today()
+        for partecipante in (self.partecipante, crea_partecipante('part2')):
+            for giorni_fa in range(5):
+                Registro.objects.create(
+                    partecipante=partecipante,
+                    data=self.oggi - timedelta(days=giorni_fa),
+                    ore_totali=Decimal('8.00'),
+                    created_by=self.admin_profile
+                )
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+        self.intervallo = {
+            'data_inizio': str(self.oggi - timedelta(days=2)),
+            'data_fine': str(self.oggi),
+        }
+    
+    def piani(self, richiesta):
+        with CaptureQueriesContext(connection) as ctx:
+            risposta = richiesta()
+            if risposta.streaming:
+                b''.join(risposta.streaming_content)
+        self.assertEqual(risposta.status_code, 200)
+        
+        piani = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                piani.append((query['sql'], [riga[3] for riga in cursor.fetchall()]))
+        return piani
+    
+    def assertSenzaScansioni(self, richiesta, consentite=()):
+        for sql, dettagli in self.piani(richiesta):
+            for dettaglio in dettagli:
+                scansione = re.match(r'SCAN (?:TABLE )?(\w+)', dettaglio)
+                if scansione and scansione.group(1) in self.TABELLE and dettaglio not in consentite:
+                    self.fail(f'{dettaglio}\n{sql}')
+    
+    def test_lista_registro_admin(self):
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/registro/', {'page_size': 3}),
+            consentite=[self.SCANSIONE_LISTA]
+        )
+    
+    def test_lista_registro_pagina_successiva(self):
+        successiva = self.api.get('/api/registro/', {'page_size': 3}).json()['next']
+        self.assertSenzaScansioni(
+            lambda: self.api.get(successiva),
+            consentite=[self.SCANSIONE_LISTA]
+        )
+    
+    def test_pagine_senza_ordinamento_temporaneo(self):
+        # L'indice (data, id) fornisce già l'ordine (-data, -id) del keyset
+        successiva = self.api.get('/api/registro/', {'page_size': 3}).json()['next']
+        for richiesta in (
+            lambda: self.api.get('/api/registro/', {'page_size': 3}),
+            lambda: self.api.get(successiva),
+            lambda: self.api.get('/api/registro/', self.intervallo),
+        ):
+            for sql, dettagli in self.piani(richiesta):
+                self.assertFalse([d for d in dettagli if 'TEMP B-TREE' in d], sql)
+    
+    def test_lista_registro_filtrata(self):
+        self.assertSenzaScansioni(lambda: self.api.get('/api/registro/', self.intervallo))
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/registro/', {'partecipante': self.partecipante.pk})
+        )
+    
+    def test_lista_registro_partecipante(self):
+        self.api.force_authenticate(self.partecipante.utente)
+        self.assertSenzaScansioni(lambda: self.api.get('/api/registro/'))
+        self.assertSenzaScansioni(lambda: self.api.get('/api/registro/export/', {'format': 'csv'}))
+    
+    def test_export_admin(self):
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/registro/export/', {'format': 'ndjson'}),
+            consentite=[self.SCANSIONE_LISTA]
+        )
+    
+    def test_matrix(self):
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/registro/matrix/', self.intervallo)
+        )
+        self.api.force_authenticate(self.partecipante.utente)
+        self.assertSenzaScansioni(lambda: self.api.get('/api/registro/matrix/'))
+    
+    def test_sync(self):
+        cursore = self.api.get('/api/registro/sync/').json()['cursor']
+        self.assertSenzaScansioni(lambda: self.api.get('/api/registro/sync/', {'cursor': cursore}))
+        self.api.force_authenticate(self.partecipante.utente)
+        self.assertSenzaScansioni(lambda: self.api.get('/api/registro/sync/', {'cursor': cursore}))
+    
+    def test_summary(self):
+        # Aggregato sull'intera tabella: la scansione completa è inevitabile
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/registro/summary/'),
+            consentite=['SCAN registro_registro']
+        )
+        for group_by in ('day', 'week', 'month', 'partecipante'):
+            self.assertSenzaScansioni(
+                lambda: self.api.get('/api/registro/summary/', {**self.intervallo, 'group_by': group_by})
+            )
+    
+    def test_a_rischio(self):
+        # Aggregato su tutti i partecipanti attivi: come summary senza filtri
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/partecipante/a_rischio/', {'ore_corso': '200'}),
+            consentite=[
+                'SCAN registro_registro',
+                'SCAN registro_registro USING INDEX registro_registro_partecipante_id_977ec934',
+            ]
+        )
+    
+    def test_classifica(self):
+        # La classifica ordina tutti i partecipanti attivi: scansione inevitabile
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/partecipante/classifica/', {'partecipante': self.partecipante.pk}),
+            consentite=['SCAN partecipante_partecipante', 'SCAN registro_riepilogopresenze']
+        )
+    
+    def test_update_registro(self):
+        self.assertSenzaScansioni(lambda: self.api.put('/api/registro/update_registro/', {
+            'partecipante': self.partecipante.pk,
+            'data': str(self.oggi),
+            'ore_totali': '8.00',
+            'assenze': '1.00',
+        }, format='json'))
+    
+    def test_partecipante(self):
+        self.assertSenzaScansioni(
+            lambda: self.api.get('/api/partecipante/'),
+            consentite=['SCAN partecipante_partecipante']
+        )
+        self.assertSenzaScansioni(lambda: self.api.get(f'/api/partecipante/{self.partecipante.pk}/stats/'))
+        self.api.force_authenticate(self.partecipante.utente)
+        self.assertSenzaScansioni(lambda: self.api.get('/api/partecipante/me/'))
+    
+    def test_changelist_admin(self):
+        self.client.force_login(self.admin)
+        # COUNT(*) di tutta la tabella (SQLite conta sull'indice più piccolo)
+        # e MIN/MAX(data) della date_hierarchy: scansioni proprie della changelist
+        conteggio = [
+            'SCAN registro_registro USING COVERING INDEX registro_registro_partecipante_id_977ec934',
+            'SCAN registro_registro USING COVERING INDEX registro_data_part_idx',
+        ]
+        self.assertSenzaScansioni(
+            lambda: self.client.get('/admin/registro/registro/'),
+            consentite=[self.SCANSIONE_LISTA, *conteggio]
+        )
+        self.assertSenzaScansioni(
+            lambda: self.client.get('/admin/registro/registro/', {
+                'data__year': self.oggi.year, 'data__month': self.oggi.month
+            }),
+            consentite=conteggio
+        )
+        self.assertSenzaScansioni(
+            lambda: self.client.get('/admin/registro/registro/', {'created_by__exact': self.admin.pk}),
+            consentite=conteggio
+        )
+        self.assertSenzaScansioni(
+            lambda: self.client.get('/admin/partecipante/partecipante/'),
+            consentite=[
+                'SCAN partecipante_partecipante USING COVERING INDEX sqlite_autoindex_partecipante_partecipante_1',
+                'SCAN partecipante_partecipante USING INDEX sqlite_autoindex_partecipante_partecipante_1',
+            ]
+        )
+
+
+class RegistroAsyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        verifica_utenti.svuota()
+        self.admin = Utente.objects.create(username='admin1', nome='Admin', cognome='Test', ruolo='admin')
+        self.partecipante = crea_partecipante('part1')
+        altro = crea_partecipante('part2')
+        oggi = date.today()
+        for giorni in range(5):
+            for partecipante in (self.partecipante, altro):
+                Registro.objects.create(
+                    partecipante=partecipante,
+                    data=oggi - timedelta(days=giorni),
+                    ore_totali=Decimal('8.00'),
+                    assenze=Decimal('1.00') if giorni == 0 else Decimal('0.00')
+                )
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=bearer(self.admin))
+    
+    def test_lista_uguale_alla_sincrona(self):
+        sincrona = self.api.get('/api/registro/', {'page_size': 3}).json()
+        asincrona = self.api.get('/api/async/registro/', {'page_size': 3}).json()
+        
+        self.assertEqual(asincrona['results'], sincrona['results'])
+        self.assertIn('/api/async/registro/', asincrona['next'])
+        
+        seconda = self.api.get(asincrona['next']).json()
+        self.assertEqual(seconda['results'], self.api.get(sincrona['next']).json()['results'])
+    
+    def test_lista_con_campi_parziali(self):
+        parametri = {'fields': 'data,assenze', 'page_size': 3}
+        sincrona = self.api.get('/api/registro/', parametri).json()
+        asincrona = self.api.get('/api/async/registro/', parametri).json()
+        
+        self.assertEqual(asincrona['results'], sincrona['results'])
+        self.assertEqual(list(asincrona['results'][0]), ['data', 'assenze'])
+        self.assertEqual(self.api.get('/api/async/registro/', {'fields': 'x'}).status_code, 400)
+    
+    def test_lista_del_partecipante(self):
+        self.api.credentials(HTTP_AUTHORIZATION=bearer(self.partecipante.utente))
+        risultati = self.api.get('/api/async/registro/').json()['results']
+        
+        self.assertEqual(len(risultati), 5)
+        self.assertEqual({r['partecipante'] for r in risultati}, {self.partecipante.pk})
+    
+    def test_summary_uguale_al_sincrono(self):
+        for parametri in ({}, {'group_by': 'partecipante'}, {'group_by': 'week'}):
+            self.assertEqual(
+                self.api.get('/api/async/registro/summary/', parametri).content,
+                self.api.get('/api/registro/summary/', parametri).content
+            )
+        
+        risposta = self.api.get('/api/async/registro/summary/', {'group_by': 'anno'})
+        self.assertEqual(risposta.status_code, 400)
+    
+    def test_summary_vietato_al_partecipante(self):
+        self.api.credentials(HTTP_AUTHORIZATION=bearer(self.partecipante.utente))
+        self.assertEqual(self.api.get('/api/async/registro/summary/').status_code, 403)
+    
+    def test_senza_token(self):
+        self.api.credentials()
+        risposta = self.api.get('/api/async/registro/')
+        
+        self.assertEqual(risposta.status_code, 401)
+        self.assertIn('WWW-Authenticate', risposta)
+    
+    async def test_client_asincrono(self):
+        token = await sync_to_async(bearer)(self.admin)
+        risposta = await AsyncClient().get('/api/async/registro/summary/', headers={'Authorization': token})
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(risposta.json()['totale_record'], 10)
+        self.assertIn('desc="', risposta['Server-Timing'])
+        self.assertIn('render;dur=', risposta['Server-Timing'])
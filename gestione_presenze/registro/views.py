@@ -1,19 +1,63 @@
+from datetime import date
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Sum, Count
-from .models import Registro
-from .serializers import RegistroSerializer, RegistroUpdateSerializer
+from rest_framework.parsers import JSONParser
+from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+from django.db.models import Sum, Count, F
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from gestione_presenze.campi import CampiParzialiMixin
+from gestione_presenze.renderers import DecimaliNumericiMixin
+from gestione_presenze.valori import ListaValoriMixin
+from . import cache, condizionali, sync
+from .bulk import aggiorna_registri, valida_registri, inserisci_registri, upsert_registro
+from .export import ESPORTATORI
+from .matrice import matrice_presenze
+from .models import ORE_PRESENTI, PERCENTUALE_PRESENZA, Registro
+from .pagination import RegistroCursorPagination
+from .parsers import CSVParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .serializers import (
+    ERRORE_INTEGRITA, RegistroSerializer, RegistroSyncSerializer, RegistroUpdateSerializer,
+    errore_integrita, violazione_unicita,
+)
 from .permissions import IsAdmin, IsOwnerOrAdmin
 
 
-class RegistroViewSet(viewsets.ModelViewSet):
+# Colonne lette per ogni campo di RegistroSerializer (?fields= / ?exclude=)
+COLONNE_CAMPI = {
+    'partecipante': ['partecipante'],
+    'partecipante_nome': ['partecipante__utente__nome'],
+    'partecipante_cognome': ['partecipante__utente__cognome'],
+    'data': ['data'],
+    'ore_totali': ['ore_totali'],
+    'assenze': ['assenze'],
+    'ore_presenti': ['ore_totali', 'assenze'],
+    'percentuale_presenza': ['ore_totali', 'assenze'],
+    'created_at': ['created_at'],
+}
+# Ordinamento della paginazione e controllo dei permessi sul dettaglio
+COLONNE_SEMPRE = ['data', 'partecipante']
+
+
+class RegistroViewSet(CampiParzialiMixin, DecimaliNumericiMixin, ListaValoriMixin, viewsets.ModelViewSet):
     """
     ViewSet per gestire i record di registro (presenze/assenze)
     Solo lettura e modifica - creazione ed eliminazione disabilitate
     """
     queryset = Registro.objects.all()
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RegistroCursorPagination
+    colonne_campi = COLONNE_CAMPI
+    colonne_sempre = COLONNE_SEMPRE
+    # Lista letta con values(): campi calcolati in SQL, data e id per il cursore
+    espressioni_valori = {
+        'ore_presenti': ORE_PRESENTI,
+        'percentuale_presenza': PERCENTUALE_PRESENZA,
+    }
+    colonne_valori = ('data', 'id')
     
     def get_serializer_class(self):
         """
@@ -41,43 +85,42 @@ class RegistroViewSet(viewsets.ModelViewSet):
             status=status.HTTP_405_METHOD_NOT_ALLOWED
         )
     
+    def risposta_pagina(self, pagina, lettore):
+        """
+        Lista paginata con richieste condizionali: se le righe della pagina non
+        sono cambiate (If-None-Match) risponde 304 senza serializzarle
+        """
+        request = self.request
+        etag = condizionali.validatore_pagina(
+            self.paginator, pagina, request.get_full_path(), request.user.pk, request.accepted_renderer.format
+        )
+        non_modificato = condizionali.non_modificato(request, etag)
+        if non_modificato is not None:
+            return non_modificato
+        return condizionali.imposta_intestazioni(super().risposta_pagina(pagina, lettore), etag)
+    
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except IntegrityError as exc:
+            # Coppia partecipante/data già occupata o partecipante eliminato nel frattempo
+            raise ValidationError(errore_integrita(exc))
+    
     def get_queryset(self):
         """
         Filtra i risultati in base all'utente
+        Con ?fields= / ?exclude= legge solo le colonne dei campi richiesti
         """
-        user = self.request.user
-        
-        # Admin può vedere tutti i registri
-        if user.ruolo == 'admin':
-            queryset = Registro.objects.all()
-        # Partecipante può vedere solo i propri
-        elif user.ruolo == 'partecipante':
-            queryset = Registro.objects.filter(
-                partecipante__utente=user
-            )
-        else:
-            queryset = Registro.objects.none()
-        
-        # Filtri opzionali via query params
-        partecipante_id = self.request.query_params.get('partecipante', None)
-        data_inizio = self.request.query_params.get('data_inizio', None)
-        data_fine = self.request.query_params.get('data_fine', None)
-        
-        if partecipante_id:
-            queryset = queryset.filter(partecipante_id=partecipante_id)
-        if data_inizio:
-            queryset = queryset.filter(data__gte=data_inizio)
-        if data_fine:
-            queryset = queryset.filter(data__lte=data_fine)
-        
-        return queryset
+        return self.riduci_queryset(registri_visibili(self.request.user, self.request.query_params))
     
     def get_permissions(self):
         """
         Permessi diversi per azioni diverse
         """
-        if self.action in ['update', 'partial_update']:
-            # Solo admin può modificare
+        if self.action in [
+            'update', 'partial_update', 'update_registro', 'update_registro_batch', 'bulk', 'cache_stats'
+        ]:
+            # Solo admin può modificare o inserire
             return [IsAdmin()]
         else:
             # Lettura: owner o admin
@@ -88,6 +131,7 @@ class RegistroViewSet(viewsets.ModelViewSet):
         """
         Endpoint per aggiornare un registro senza specificare l'ID
         Usa partecipante e data per trovare il record
+        Con ?upsert=true crea il record se non esiste (201), in modo atomico
         Solo per admin
         """
         partecipante_id = request.data.get('partecipante')
@@ -99,6 +143,17 @@ class RegistroViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if request.query_params.get('upsert', '').lower() in ('1', 'true'):
+            registro, creato, errori = upsert_registro(
+                request.data, created_by_id=request.user.admin_id
+            )
+            if errori:
+                return Response(errori, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                RegistroSerializer(registro).data,
+                status=status.HTTP_201_CREATED if creato else status.HTTP_200_OK
+            )
+        
         try:
             # Trova il registro basandosi su partecipante e data
             registro = Registro.objects.get(
@@ -114,17 +169,164 @@ class RegistroViewSet(viewsets.ModelViewSet):
         # Usa il serializer per validare e aggiornare
         serializer = RegistroUpdateSerializer(registro, data=request.data, partial=False)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                serializer.save()
+            except IntegrityError as exc:
+                return Response(errore_integrita(exc), status=status.HTTP_400_BAD_REQUEST)
             # Ritorna il registro aggiornato con tutti i campi
             response_serializer = RegistroSerializer(registro)
             return Response(response_serializer.data, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['put'], url_path='update_registro/batch', permission_classes=[IsAdmin])
+    def update_registro_batch(self, request):
+        """
+        Endpoint per aggiornare più registri (partecipante, data, ore_totali, assenze)
+        in una sola richiesta: una query per leggerli, una transazione per scriverli
+        Il lotto viene scritto solo se tutte le righe sono valide
+        Solo per admin
+        """
+        righe = request.data
+        if not isinstance(righe, list):
+            return Response(
+                {'error': 'Devi fornire una lista di registri'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        registri, errori = aggiorna_registri(righe)
+        if errori:
+            return Response({'errori': errori}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'aggiornati': len(registri),
+            'risultati': [
+                {'riga': indice, 'registro': dati}
+                for indice, dati in enumerate(RegistroSerializer(registri, many=True).data)
+            ],
+        })
+    
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAdmin],
+        parser_classes=[JSONParser, CSVParser]
+    )
+    def bulk(self, request):
+        """
+        Endpoint per inserire in blocco i registri di più partecipanti/giorni
+        Accetta una lista JSON o un CSV (partecipante, data, ore_totali, assenze, note)
+        Il lotto viene scritto solo se tutte le righe sono valide
+        Solo per admin
+        """
+        righe = request.data
+        if not isinstance(righe, list):
+            return Response(
+                {'error': 'Devi fornire una lista di registri'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        registri, errori = valida_registri(righe, created_by_id=request.user.admin_id)
+        if errori:
+            return Response({'errori': errori}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            creati = inserisci_registri(registri)
+        except IntegrityError as exc:
+            if not violazione_unicita(exc):
+                return Response(ERRORE_INTEGRITA, status=status.HTTP_400_BAD_REQUEST)
+            # Un altro inserimento concorrente ha occupato una delle coppie partecipante/data
+            return Response(
+                {'error': 'Alcuni registri esistono già, nessun record inserito'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response({'creati': creati}, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Endpoint per esportare i registri in streaming (?format=csv|ndjson)
+        Stessi filtri e visibilità della lista
+        """
+        esporta, content_type = ESPORTATORI[request.accepted_renderer.format]
+        response = StreamingHttpResponse(
+            esporta(self.filter_queryset(self.get_queryset())),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="registro.{request.accepted_renderer.format}"'
+        )
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def matrix(self, request):
+        """
+        Endpoint per la griglia del registro: partecipanti e date una sola volta,
+        ore totali e assenze come matrici partecipanti × date (null se manca il record)
+        Query params opzionali: data_inizio, data_fine (YYYY-MM-DD), partecipante
+        Stessa visibilità della lista (il partecipante vede solo i propri registri)
+        """
+        try:
+            for param in ('data_inizio', 'data_fine'):
+                valore = request.query_params.get(param)
+                if valore:
+                    date.fromisoformat(valore)
+        except ValueError:
+            return Response(
+                {'error': 'Le date devono essere nel formato YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(matrice_presenze(self.get_queryset()))
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Feed di sincronizzazione: record creati o modificati ed eliminati dopo il cursore
+        Query params opzionali:
+        - cursor: valore 'cursor' della risposta precedente (assente alla prima sincronizzazione)
+        - limit: massimo di record per flusso (default 500)
+        Se 'altri' è true ci sono altre modifiche: ripetere subito con il nuovo cursore
+        410 se il cursore è più vecchio delle tracce di eliminazione conservate:
+        il client deve ripartire senza cursore
+        Stessa visibilità della lista (il partecipante vede solo i propri registri)
+        """
+        try:
+            limite = min(int(request.query_params.get('limit', sync.LIMITE_DEFAULT)), sync.LIMITE_MASSIMO)
+            if limite < 1:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': 'limit deve essere un intero positivo'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        registri, eliminati, cursore, altri = sync.modifiche(
+            request.user, request.query_params.get('cursor'), limite
+        )
+        return Response({
+            'cursor': cursore,
+            'altri': altri,
+            'modificati': RegistroSyncSerializer(registri, many=True).data,
+            'eliminati': [
+                {
+                    'id': eliminato.registro_id,
+                    'partecipante': eliminato.partecipante_id,
+                    'data': eliminato.data,
+                    'deleted_at': eliminato.deleted_at,
+                }
+                for eliminato in eliminati
+            ],
+        })
+    
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """
         Endpoint per statistiche generali
+        Query params opzionali:
+        - data_inizio / data_fine (YYYY-MM-DD)
+        - group_by=day|week|month|partecipante per l'andamento per periodo o partecipante
         Solo per admin
         """
         if request.user.ruolo != 'admin':
@@ -133,22 +335,154 @@ class RegistroViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Statistiche aggregate
-        stats = Registro.objects.aggregate(
-            totale_record=Count('id'),
-            totale_ore=Sum('ore_totali'),
-            totale_assenze=Sum('assenze')
-        )
+        try:
+            group_by, registri = filtri_summary(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
-        ore_presenti = (stats['totale_ore'] or 0) - (stats['totale_assenze'] or 0)
-        percentuale_media = 0.0
-        if stats['totale_ore'] and stats['totale_ore'] > 0:
-            percentuale_media = (ore_presenti / stats['totale_ore']) * 100
+        def calcola():
+            # Statistiche aggregate e, se richiesto, un'unica query GROUP BY
+            stats = registri.aggregate(**AGGREGATI)
+            gruppi = list(query_gruppi(registri, group_by)) if group_by else None
+            return risposta_summary(stats, group_by, gruppi)
         
-        return Response({
-            'totale_record': stats['totale_record'],
-            'totale_ore': stats['totale_ore'],
-            'totale_assenze': stats['totale_assenze'],
-            'ore_presenti': ore_presenti,
-            'percentuale_presenza_media': round(percentuale_media, 2)
-        })
+        risposta = cache.risposta_in_cache(
+            'summary', cache.GLOBALE, parametri_summary(request.query_params), calcola
+        )
+        return Response(risposta)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def cache_stats(self, request):
+        """
+        Endpoint per monitorare la cache di stats e summary (hit/miss del processo)
+        Solo per admin
+        """
+        return Response(cache.statistiche())
+
+
+def registri_visibili(user, query_params):
+    """
+    Registri visibili all'utente, con i filtri opzionali della lista
+    (partecipante, data_inizio, data_fine)
+    """
+    # Nome e cognome del partecipante caricati nella stessa query
+    registri = Registro.objects.select_related('partecipante__utente')
+    
+    # Admin può vedere tutti i registri
+    if user.ruolo == 'admin':
+        queryset = registri.all()
+    # Partecipante può vedere solo i propri
+    elif user.ruolo == 'partecipante':
+        # Il profilo partecipante ha come chiave l'id dell'utente
+        queryset = registri.filter(
+            partecipante_id=user.pk
+        )
+    else:
+        queryset = Registro.objects.none()
+    
+    # Filtri opzionali via query params
+    partecipante_id = query_params.get('partecipante', None)
+    data_inizio = query_params.get('data_inizio', None)
+    data_fine = query_params.get('data_fine', None)
+    
+    if partecipante_id:
+        queryset = queryset.filter(partecipante_id=partecipante_id)
+    if data_inizio:
+        queryset = queryset.filter(data__gte=data_inizio)
+    if data_fine:
+        queryset = queryset.filter(data__lte=data_fine)
+    
+    return queryset
+
+
+AGGREGATI = {
+    'totale_record': Count('id'),
+    'totale_ore': Sum('ore_totali'),
+    'totale_assenze': Sum('assenze'),
+}
+
+# group_by -> (campi del raggruppamento, annotazioni necessarie)
+RAGGRUPPAMENTI = {
+    'day': (['periodo'], {'periodo': TruncDay('data')}),
+    'week': (['periodo'], {'periodo': TruncWeek('data')}),
+    'month': (['periodo'], {'periodo': TruncMonth('data')}),
+    'partecipante': (
+        ['partecipante_cognome', 'partecipante_nome', 'partecipante'],
+        {
+            'partecipante_cognome': F('partecipante__utente__cognome'),
+            'partecipante_nome': F('partecipante__utente__nome'),
+        }
+    ),
+}
+
+
+def filtri_summary(query_params):
+    """
+    Ritorna (group_by, registri filtrati per data) per il summary
+    Solleva ValueError con il messaggio da mostrare se i parametri non sono validi
+    """
+    group_by = query_params.get('group_by')
+    if group_by and group_by not in RAGGRUPPAMENTI:
+        raise ValueError(f"group_by deve essere uno tra: {', '.join(RAGGRUPPAMENTI)}")
+    
+    registri = Registro.objects.all()
+    try:
+        for param, lookup in (('data_inizio', 'data__gte'), ('data_fine', 'data__lte')):
+            valore = query_params.get(param)
+            if valore:
+                registri = registri.filter(**{lookup: date.fromisoformat(valore)})
+    except ValueError:
+        raise ValueError('Le date devono essere nel formato YYYY-MM-DD')
+    return group_by, registri
+
+
+def parametri_summary(query_params):
+    """Parametri che identificano una risposta del summary in cache"""
+    return {
+        param: query_params.get(param, '')
+        for param in ('group_by', 'data_inizio', 'data_fine')
+    }
+
+
+def query_gruppi(registri, group_by):
+    """Aggregati per periodo (Trunc*) o per partecipante in un'unica query GROUP BY"""
+    campi, annotazioni = RAGGRUPPAMENTI[group_by]
+    return (
+        registri.order_by()
+        .annotate(**annotazioni)
+        .values(*campi)
+        .annotate(**AGGREGATI)
+        .order_by(*campi)
+    )
+
+
+def risposta_summary(stats, group_by, gruppi):
+    """Corpo della risposta del summary dagli aggregati già calcolati"""
+    risposta = _statistiche(stats)
+    if group_by:
+        campi, _ = RAGGRUPPAMENTI[group_by]
+        risposta['group_by'] = group_by
+        risposta['gruppi'] = [
+            {
+                **{campo: gruppo[campo] for campo in campi},
+                **_statistiche(gruppo),
+            }
+            for gruppo in gruppi
+        ]
+    return risposta
+
+
+def _statistiche(stats):
+    """Totali, ore presenti e percentuale media da un risultato aggregato"""
+    ore_presenti = (stats['totale_ore'] or 0) - (stats['totale_assenze'] or 0)
+    percentuale_media = 0.0
+    if stats['totale_ore'] and stats['totale_ore'] > 0:
+        percentuale_media = (ore_presenti / stats['totale_ore']) * 100
+    
+    return {
+        'totale_record': stats['totale_record'],
+        'totale_ore': stats['totale_ore'],
+        'totale_assenze': stats['totale_assenze'],
+        'ore_presenti': ore_presenti,
+        'percentuale_presenza_media': round(percentuale_media, 2)
+    }
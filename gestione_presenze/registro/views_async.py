@@ -0,0 +1,61 @@
+"""
+Versioni asincrone (ASGI) delle letture del registro: lista e summary.
+Stessi parametri, permessi e risposte delle azioni di RegistroViewSet.
+"""
+from rest_framework import status
+from rest_framework.response import Response
+from gestione_presenze.asincrono import errore, vista_async
+from gestione_presenze.campi import campi_richiesti, riduci_serializer
+from gestione_presenze.valori import LettoreValori
+from . import cache, condizionali
+from .pagination import RegistroCursorPagination
+from .serializers import RegistroSerializer
+from .views import (
+    AGGREGATI, COLONNE_CAMPI, RegistroViewSet, filtri_summary, parametri_summary,
+    query_gruppi, registri_visibili, risposta_summary,
+)
+
+
+@vista_async()
+async def lista(request):
+    """Lista paginata dei registri visibili all'utente, con richieste condizionali"""
+    # Stessa lettura con values() della lista sincrona (ListaValoriMixin)
+    campi = campi_richiesti(request.query_params, COLONNE_CAMPI)
+    lettore = LettoreValori(
+        riduci_serializer(RegistroSerializer(many=True), campi), RegistroViewSet.espressioni_valori
+    )
+    queryset = lettore.queryset(registri_visibili(request.user, request.query_params), *RegistroViewSet.colonne_valori)
+    
+    paginazione = RegistroCursorPagination()
+    righe = await paginazione.apaginate_queryset(queryset, request)
+    etag = condizionali.validatore_pagina(paginazione, righe, request.get_full_path(), request.user.pk)
+    non_modificato = condizionali.non_modificato(request, etag)
+    if non_modificato is not None:
+        return non_modificato
+    return condizionali.imposta_intestazioni(
+        paginazione.get_paginated_response(lettore.rappresenta(righe)), etag
+    )
+
+
+@vista_async()
+async def summary(request):
+    """Statistiche generali, con group_by opzionale. Solo per admin"""
+    if request.user.ruolo != 'admin':
+        return errore('Solo gli admin possono accedere a questo endpoint', status.HTTP_403_FORBIDDEN)
+    
+    try:
+        group_by, registri = filtri_summary(request.query_params)
+    except ValueError as exc:
+        return errore(str(exc))
+    
+    async def calcola():
+        stats = await registri.aaggregate(**AGGREGATI)
+        gruppi = None
+        if group_by:
+            gruppi = [gruppo async for gruppo in query_gruppi(registri, group_by)]
+        return risposta_summary(stats, group_by, gruppi)
+    
+    risposta = await cache.arisposta_in_cache(
+        'summary', cache.GLOBALE, parametri_summary(request.query_params), calcola
+    )
+    return Response(risposta)